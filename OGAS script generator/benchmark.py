@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+脚本生成吞吐量测试
+把pm_goods.csv中的生产方式复制放大到指定倍数，对比旧的 += 拼接字符串写法与预编译模板写法
+生成 AUTO_goods_origin.txt 和 AUTO_building_profit_prediction.txt 的耗时和MB/s
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+
+import main as generator
+from pm_records import read_pm_records_csv
+
+
+def legacy_goods_origin(model, output_file):
+    """旧版 += 拼接写法，仅保留用于性能和结果对比"""
+    with open(output_file, 'w', encoding='utf-8-sig') as outfile:
+        for pmg_name, group in model.groups.items():
+            production_methods = group.production_methods
+            for goods_name in group.goods_by_first_use():
+                current_script = f"""{pmg_name}_{goods_name}_current = {{
+    if = {{
+        limit = {{
+            has_active_production_method = {production_methods[0]}
+        }}
+        value = {production_methods[0]}_{goods_name}
+    }}
+"""
+                for i in range(1, len(production_methods)):
+                    current_script += f"""    else_if = {{
+        limit = {{
+            has_active_production_method = {production_methods[i]}
+        }}
+        value = {production_methods[i]}_{goods_name}
+    }}
+"""
+                current_script += f"""    else = {{
+        value = 0.0
+    }}
+    multiply = building_work_efficiency
+}}
+
+"""
+                origin_scripts = f"""state_{goods_name}_production_if_no_{pmg_name} = {{
+\tvalue = state.sg:{goods_name}.state_goods_production
+    if = {{
+        limit = {{
+            {pmg_name}_{goods_name}_current > 0.0
+        }}
+\tsubtract = {pmg_name}_{goods_name}_current
+    }}
+}}
+
+state_{goods_name}_consumption_if_no_{pmg_name} = {{
+\tvalue = state.sg:{goods_name}.state_goods_consumption
+    if = {{
+        limit = {{
+            {pmg_name}_{goods_name}_current < 0.0
+        }}
+\tadd = {pmg_name}_{goods_name}_current
+    }}
+}}
+
+market_{goods_name}_production_if_no_{pmg_name} = {{
+\tvalue = market.mg:{goods_name}.market_goods_sell_orders
+    if = {{
+        limit = {{
+            {pmg_name}_{goods_name}_current > 0.0
+        }}
+\tsubtract = {pmg_name}_{goods_name}_current
+        multiply = state.market_access
+    }}
+}}
+
+market_{goods_name}_consumption_if_no_{pmg_name} = {{
+\tvalue = market.mg:{goods_name}.market_goods_buy_orders
+    if = {{
+        limit = {{
+            {pmg_name}_{goods_name}_current < 0.0
+        }}
+\tadd = {pmg_name}_{goods_name}_current
+        multiply = state.market_access
+    }}
+}}
+
+"""
+                outfile.write(current_script)
+                outfile.write(origin_scripts)
+
+
+def legacy_profit_prediction(model, output_file):
+    """旧版 += 拼接写法，仅保留用于性能和结果对比"""
+    with open(output_file, 'w', encoding='utf-8-sig') as outfile:
+        for (pmg_name, pm_name), goods_data in model.methods.items():
+            profit_script = f"""{pmg_name}_{pm_name}_profit_prediction = {{
+    value = 0
+"""
+            for goods_name, goods_value in goods_data.items():
+                if goods_value > 0:
+                    profit_script += f"""    add = {{
+        value = {pm_name}_{goods_name}
+        multiply = building_work_efficiency
+        save_temporary_value_as = {pm_name}_{goods_name}_prediction
+        value = state_{goods_name}_production_if_no_{pmg_name}
+        add = scope:{pm_name}_{goods_name}_prediction
+        save_temporary_value_as = state_{goods_name}_production_prediction
+        value = state_{goods_name}_consumption_if_no_{pmg_name}
+        save_temporary_value_as = state_{goods_name}_consumption_prediction
+        value = market_{goods_name}_production_if_no_{pmg_name}
+        add = scope:{pm_name}_{goods_name}_prediction
+        save_temporary_value_as = market_{goods_name}_production_prediction
+        value = market_{goods_name}_consumption_if_no_{pmg_name}
+        save_temporary_value_as = market_{goods_name}_consumption_prediction
+        value = {goods_name}_price_prediction
+        multiply = scope:{pm_name}_{goods_name}_prediction
+    }}
+"""
+                else:
+                    profit_script += f"""    add = {{
+        value = {pm_name}_{goods_name}
+        multiply = building_work_efficiency
+        save_temporary_value_as = {pm_name}_{goods_name}_prediction
+        value = state_{goods_name}_production_if_no_{pmg_name}
+        save_temporary_value_as = state_{goods_name}_production_prediction
+        value = state_{goods_name}_consumption_if_no_{pmg_name}
+        subtract = scope:{pm_name}_{goods_name}_prediction
+        save_temporary_value_as = state_{goods_name}_consumption_prediction
+        value = market_{goods_name}_production_if_no_{pmg_name}
+        save_temporary_value_as = market_{goods_name}_production_prediction
+        value = market_{goods_name}_consumption_if_no_{pmg_name}
+        subtract = scope:{pm_name}_{goods_name}_prediction
+        save_temporary_value_as = market_{goods_name}_consumption_prediction
+        value = {goods_name}_price_prediction
+        multiply = scope:{pm_name}_{goods_name}_prediction
+    }}
+"""
+            profit_script += f"""    divide = level
+}}
+
+{pmg_name}_{pm_name}_profit_prediction_weighted = {{
+    value = {pmg_name}_{pm_name}_profit_prediction
+    multiply = owner.var:cnm_upgrade_tolerance_pm_manager
+}}
+
+"""
+            outfile.write(profit_script)
+
+
+def scaled_records(records, scale):
+    """把生产方式复制scale份，每份的建筑、生产方式组、生产方式名加上后缀"""
+    scaled = []
+    for copy in range(scale):
+        suffix = f"_x{copy}" if copy else ""
+        for record in records:
+            scaled.append(record._replace(building=record.building + suffix, pmg=record.pmg + suffix,
+                                          pm=record.pm + suffix))
+    return scaled
+
+
+def _time_best(function, repeat):
+    """重复执行取最短耗时，减少系统抖动的影响"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比 += 拼接与预编译模板的脚本生成吞吐量")
+    parser.add_argument('--csv', default='pm_goods.csv', help="作为样本的生产方式表格")
+    parser.add_argument('--scale', type=int, default=20, help="样本复制的倍数")
+    parser.add_argument('--repeat', type=int, default=3, help="重复次数，取最短耗时")
+    args = parser.parse_args()
+
+    source_dir = os.path.dirname(os.path.abspath(__file__))
+    records = scaled_records(read_pm_records_csv(args.csv), args.scale)
+
+    work_dir = tempfile.mkdtemp(prefix='ogas_benchmark_')
+    previous_dir = os.getcwd()
+    try:
+        shutil.copytree(os.path.join(source_dir, 'goods'), os.path.join(work_dir, 'goods'))
+        os.makedirs(os.path.join(work_dir, 'script_values'))
+        os.makedirs(os.path.join(work_dir, 'legacy'))
+        os.chdir(work_dir)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            generator.use_pm_records(records)
+            model = generator.get_pm_model()
+
+        stages = (
+            ("goods_origin", 'AUTO_goods_origin.txt', legacy_goods_origin, generator.generate_goods_origin_script),
+            ("profit_prediction", 'AUTO_building_profit_prediction.txt',
+             legacy_profit_prediction, generator.generate_building_profit_prediction_script),
+        )
+
+        print(f"脚本生成吞吐量对比（{len(records)} 条生产方式记录，重复 {args.repeat} 次取最短耗时）")
+        print("=" * 50)
+        print(f"{'':<20}{'输出(MB)':>10}{'拼接(ms)':>10}{'拼接MB/s':>10}{'模板(ms)':>10}{'模板MB/s':>10}{'加速比':>8}")
+        for label, filename, legacy, generate in stages:
+            legacy_file = os.path.join('legacy', filename)
+            output_file = os.path.join('script_values', filename)
+
+            def run_template():
+                # 删除旧文件，避免把与现有文件的比较计入耗时
+                if os.path.exists(output_file):
+                    os.remove(output_file)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    generate()
+
+            legacy_time = _time_best(lambda: legacy(model, legacy_file), args.repeat)
+            template_time = _time_best(run_template, args.repeat)
+
+            megabytes = os.path.getsize(output_file) / 1e6
+            with open(legacy_file, 'rb') as f1, open(output_file, 'rb') as f2:
+                identical = f1.read() == f2.read()
+            print(f"{label:<20}{megabytes:>10.2f}{legacy_time * 1000:>10.1f}{megabytes / legacy_time:>10.1f}"
+                  f"{template_time * 1000:>10.1f}{megabytes / template_time:>10.1f}{legacy_time / template_time:>8.2f}x"
+                  + ("" if identical else "  输出不一致！"))
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量生成
+输出文件先写入同目录下的临时文件，内容与现有文件完全相同时丢弃临时文件，不同时再原子替换，
+未变化的文件不会被改写（修改时间不变）；
+清单文件记录每个生成阶段依赖的输入数据摘要和输出文件状态，依赖未变化且输出文件未被改动的阶段直接跳过
+"""
+
+import filecmp
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 增量生成清单，保存在生成目录下
+MANIFEST_FILE = '.ogas_build_manifest.json'
+MANIFEST_VERSION = 1
+
+# 输出文件的写缓冲大小，生成的块先在缓冲中累积，减少实际写入次数
+WRITE_BUFFER_SIZE = 1 << 18
+
+# 本次运行中已经写完（或确认未变化）的输出文件，以及写入统计
+committed_outputs: List[str] = []
+write_stats = {'written': 0, 'unchanged': 0}
+
+# 延迟提交时写完的 (临时文件, 输出文件)，为None时输出文件写完后立即提交
+_pending_outputs: Optional[List[Tuple[str, str]]] = None
+
+
+@contextmanager
+def open_output(path: str, encoding: str = 'utf-8-sig'):
+    """
+    以文本方式打开输出文件
+    内容写入临时文件，正常结束时与现有文件比较：相同则删除临时文件，不同则原子替换；出错时保留原文件不变
+    """
+    temp_path = path + '.tmp'
+    # utf-8-sig的编码器是纯Python实现，每次写入都有额外开销；改为手动写入BOM后使用C实现的utf-8编码器，输出完全相同
+    write_bom = encoding.lower().replace('_', '-') == 'utf-8-sig'
+    try:
+        with open(temp_path, 'w', encoding='utf-8' if write_bom else encoding,
+                  buffering=WRITE_BUFFER_SIZE) as outfile:
+            if write_bom:
+                outfile.write('\ufeff')
+            yield outfile
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    if _pending_outputs is not None:
+        _pending_outputs.append((temp_path, path))
+    else:
+        commit_output(temp_path, path)
+
+
+def commit_output(temp_path: str, path: str):
+    """临时文件与现有文件相同时删除临时文件，不同时原子替换"""
+    if os.path.exists(path) and filecmp.cmp(temp_path, path, shallow=False):
+        os.remove(temp_path)
+        write_stats['unchanged'] += 1
+    else:
+        os.replace(temp_path, path)
+        write_stats['written'] += 1
+    committed_outputs.append(path)
+
+
+@contextmanager
+def deferred_commit():
+    """
+    延迟提交：其中写完的输出文件先保留为临时文件，返回 (临时文件, 输出文件) 列表供整体处理（例如删除无用定义），
+    正常结束时统一提交；出错时删除所有临时文件，原输出文件保持不变
+    """
+    global _pending_outputs
+    pending = _pending_outputs = []
+    try:
+        yield pending
+    except BaseException:
+        for temp_path, _ in pending:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        raise
+    finally:
+        _pending_outputs = None
+
+    for temp_path, path in pending:
+        commit_output(temp_path, path)
+
+
+def digest(data) -> str:
+    """计算可序列化为JSON的数据的摘要"""
+    encoded = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha1(encoded).hexdigest()
+
+
+def source_digest(files: Iterable[str]) -> str:
+    """计算生成程序源代码的摘要，程序修改后所有阶段都会重新生成"""
+    sha1 = hashlib.sha1()
+    for filepath in files:
+        with open(filepath, 'rb') as f:
+            sha1.update(f.read())
+    return sha1.hexdigest()
+
+
+def _file_state(path: str):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class BuildManifest:
+    def __init__(self, manifest_file: str, source: str):
+        self.manifest_file = manifest_file
+        self.source = source
+        self.stages: Dict[str, dict] = {}  # 阶段名称 -> {'inputs': {依赖名称: 摘要}, 'outputs': {输出文件: [大小, mtime_ns]}}
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        """读取清单，版本或生成程序不一致时视为没有清单"""
+        try:
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            self._dirty = True
+            return
+        except Exception as e:
+            print(f"增量生成清单已损坏，将全部重新生成：{e}")
+            self._dirty = True
+            return
+
+        if data.get('version') == MANIFEST_VERSION and data.get('source') == self.source:
+            self.stages = data.get('stages', {})
+        else:
+            self._dirty = True
+
+    def changed_inputs(self, stage: str, inputs: Dict[str, str]) -> List[str]:
+        """
+        返回需要重新生成的原因：变化的依赖名称，或被改动/删除的输出文件
+        返回空列表表示该阶段是最新的
+        """
+        record = self.stages.get(stage)
+        if record is None:
+            return ['首次生成']
+
+        reasons = [name for name, value in inputs.items() if record['inputs'].get(name) != value]
+        for path, state in record['outputs'].items():
+            try:
+                if _file_state(path) != state:
+                    reasons.append(path)
+            except FileNotFoundError:
+                reasons.append(path)
+        return reasons
+
+    def record_stage(self, stage: str, inputs: Dict[str, str], outputs: Iterable[str]):
+        record = {'inputs': inputs, 'outputs': {path: _file_state(path) for path in outputs}}
+        if self.stages.get(stage) != record:
+            self.stages[stage] = record
+            self._dirty = True
+
+    def forget_stage(self, stage: str):
+        if self.stages.pop(stage, None) is not None:
+            self._dirty = True
+
+    def save(self):
+        """清单有变化时才写回（无变化的重新生成不会改动任何文件）"""
+        if not self._dirty:
+            return
+        temp_file = self.manifest_file + '.tmp'
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump({'version': MANIFEST_VERSION, 'source': self.source, 'stages': self.stages},
+                          f, ensure_ascii=False, indent=1)
+            os.replace(temp_file, self.manifest_file)
+            self._dirty = False
+        except OSError as e:
+            print(f"保存增量生成清单时出错：{e}")
@@ -5,74 +5,133 @@ Victoria 3 PM Goods to Script Values Converter
 将带有生产方式和物资数据的表格转化为游戏内的script_values
 """
 
-import csv
+import argparse
+import hashlib
 import os
-import re
+import textwrap
+from contextlib import nullcontext
 
-# 缓存pm_goods.csv数据，避免重复读取
-_pm_goods_cache = None
+from incremental import (MANIFEST_FILE, BuildManifest, committed_outputs, deferred_commit, digest, open_output,
+                         source_digest, write_stats)
+from pm_model import PMModel, parse_goods_file
+from pm_records import (DEFAULT_ANALYZER_DIR, apply_selection, format_goods_value, import_analyzer_source,
+                        read_pm_records_csv, records_from_analyzer, write_pm_records_csv)
+from script_emitter import Template
+from script_graph import ENTRY_POINTS, collect_handwritten_references, count_script_nodes, prune_unreachable
 
-def read_pm_goods_csv():
-    global _pm_goods_cache
-    
-    # 如果已经缓存过数据，直接返回缓存
-    if _pm_goods_cache is not None:
-        return _pm_goods_cache
-    
-    input_file = 'pm_goods.csv'
-    
+# 生产方式表格，由--csv设置
+_pm_goods_csv = 'pm_goods.csv'
+# 缓存生产方式记录，避免重复读取
+_pm_records_cache = None
+# 缓存由生产方式记录和goods文件建立的数据模型，所有生成函数共用
+_pm_model_cache = None
+# 分阶段性能记录，由--profile设置；为None时不记录
+_profiler = None
+
+# 性能记录与分析程序共用
+stage_profiler = import_analyzer_source('stage_profiler')
+
+# 生成选项，由命令行设置；选项变化时所有阶段都会重新生成
+GENERATION_OPTIONS = {
+    # PM平衡中跳过/简化与同组其他生产方式物资完全相同且没有投入的生产方式
+    'prune_dominated_pms': True,
+    # PM管理开始时把每个建筑当前生产方式的物资数值缓存到建筑变量中，{pmg}_{goods}_current直接读取
+    'cache_active_pm': True,
+    # PM管理开始时把balance/upgrade生产方式的利润预测计算一次并保存到建筑变量中，比较和排序都读取变量
+    'memoize_profit_prediction': True,
+    # 预先计算利润预测前，先为每个生产方式组保存一次与生产方式无关的 *_if_no_<pmg> 基准值，各生产方式只叠加自己的变化量
+    'hoist_pmg_baselines': True,
+    # 物资价格预测中state和market共用同一个供需价格系数计算器，不再各自展开整个公式
+    'shared_price_formula': True,
+    # 按建筑类型分派的脚本使用预先保存在建筑上的类型编号二分查找，不再逐个判断is_building_type
+    'building_type_dispatch': True,
+    # PM平衡每个建筑类型只遍历一次state选出每个生产方式组的最优生产方式，再按利润排序执行，不再每个生产方式遍历一次
+    'balance_by_building': True,
+    # PM管理的建筑类型分为几份，每次PM管理只处理其中一份（1为不分片）
+    'pm_manage_shards': 1,
+    # PM升级在一次执行中直接升级到最优的更高级生产方式，不再每次只升一级
+    'upgrade_jump': True,
+    # 只重新计算自上次计算以来物资价格或雇佣率变化超过阈值的建筑（每个state分别判断）
+    'dirty_tracking': True,
+    'dirty_threshold': 0.05,
+    # 超过这么多次PM管理没有重新计算的建筑也会重新计算（例如研究科技后出现新的生产方式）
+    'dirty_max_age': 12,
+}
+
+def read_pm_goods_csv(input_file='pm_goods.csv'):
+    """读取pm_goods.csv并转换为生产方式记录（物资列按表头中的名字对应）"""
     try:
-        # 读取CSV文件
-        with open(input_file, 'r', encoding='utf-8') as csvfile:
-            reader = csv.reader(csvfile)
-            rows = list(reader)
+        records = read_pm_records_csv(input_file)
+        if _profiler is not None:
+            _profiler.count_file_read(input_file, blocks=len(records))
         
         # 检查文件是否为空
-        if len(rows) < 2:
+        if not records:
             print("错误：CSV文件为空或格式不正确")
-            return []
-        
-        # 缓存数据并返回
-        _pm_goods_cache = rows
-        return rows
+        return records
         
     except FileNotFoundError:
         print(f"错误：找不到输入文件 {input_file}")
         return []
     except Exception as e:
-        print(f"读取pm_goods.csv时发生错误：{e}")
+        print(f"读取{input_file}时发生错误：{e}")
         return []
 
+def load_pm_records():
+    """返回所有生产方式记录；没有通过use_pm_records指定时从--csv指定的表格（默认pm_goods.csv）读取"""
+    global _pm_records_cache
+    
+    # 如果已经缓存过数据，直接返回缓存
+    if _pm_records_cache is None:
+        _pm_records_cache = read_pm_goods_csv(_pm_goods_csv)
+    return _pm_records_cache
+
+def use_pm_records(records):
+    """直接指定各生成函数使用的生产方式记录（例如来自分析程序的内存数据）"""
+    global _pm_records_cache, _pm_model_cache
+    _pm_records_cache = list(records)
+    _pm_model_cache = None
+
 def read_goods_from_file():
-    """从goods/00_goods.txt文件中读取物资名称列表"""
+    """从goods/00_goods.txt文件中读取物资名称列表和基础价格，返回 (物资名称列表, [(物资名称, 价格)])"""
     goods_file = 'goods/00_goods.txt'
-    goods_list = []
     
     try:
         with open(goods_file, 'r', encoding='utf-8') as file:
             content = file.read()
-            
-        # 使用正则表达式匹配物资定义：物资名称 = {
-        pattern = r'^(\w+)\s*=\s*\{'
-        matches = re.findall(pattern, content, re.MULTILINE)
         
-        # 过滤掉注释和空行，只保留有效的物资名称
-        for match in matches:
-            if match and not match.startswith('#'):
-                goods_list.append(match)
+        # 物资名称和价格都从同一份内容中提取，文件只读取一次
+        goods_list, goods_costs = parse_goods_file(content)
+        if _profiler is not None:
+            _profiler.count_file_read(goods_file, blocks=len(goods_list))
         
         print(f"从 {goods_file} 中读取了 {len(goods_list)} 个物资")
-        return goods_list
+        return goods_list, goods_costs
         
     except FileNotFoundError:
         print(f"错误：找不到物资文件 {goods_file}")
-        return []
+        return [], []
     except Exception as e:
         print(f"读取物资文件时发生错误：{e}")
-        return []
+        return [], []
+
+def get_pm_model():
+    """返回所有生成函数共用的数据模型，第一次调用时由生产方式记录和goods文件建立"""
+    global _pm_model_cache
+    
+    if _pm_model_cache is None:
+        with _profiler.stage('pm_model') if _profiler is not None else nullcontext():
+            goods_list, goods_costs = read_goods_from_file()
+            
+            # 如果读取失败，使用空列表
+            if not goods_list:
+                print("警告：无法读取物资列表，使用空列表")
+            
+            _pm_model_cache = PMModel.build(load_pm_records(), goods_list, goods_costs)
+    return _pm_model_cache
 
 def convert_pm_goods_to_script_values():
-    """将pm_goods.csv转换为script_values格式"""
+    """将生产方式记录转换为script_values格式"""
     
     # 输出文件路径
     output_file = 'script_values/AUTO_database_pm_goods.txt'
@@ -80,86 +139,35 @@ def convert_pm_goods_to_script_values():
     # 确保输出目录存在
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
     
-    # 从文件读取物资列对应的英文名称
-    goods_columns = read_goods_from_file()
-    
-    # 如果读取失败，使用空列表
-    if not goods_columns:
-        print("警告：无法读取物资列表，使用空列表")
-        goods_columns = []
-    
     try:
-        # 使用统一函数读取CSV文件
-        rows = read_pm_goods_csv()
+        # 使用共用的数据模型
+        model = get_pm_model()
         
-        # 检查文件是否为空
-        if len(rows) < 2:
-            print("错误：CSV文件为空或格式不正确")
+        # 检查数据是否为空
+        if not model:
+            print("错误：没有可用的生产方式数据")
             return
         
-        # 构建数据结构：每个生产方式组对应的物资和生产方式
-        production_group_data = {}
-        
-        # 处理每一行数据（跳过标题行）
-        for row in rows[1:]:
-            if len(row) < 3:
-                continue
-            
-            building_type = row[0].strip()  # 建筑类型（第1列）
-            pmg_name = row[1].strip()  # 生产方式组名称（第2列）
-            pm_name = row[2].strip()  # 生产方式名称（第3列）
-            
-            # 初始化生产方式组数据
-            if pmg_name not in production_group_data:
-                production_group_data[pmg_name] = {
-                    'building_type': building_type,
-                    'production_methods': [],
-                    'goods_data': {}
-                }
-            
-            # 添加生产方式
-            if pm_name not in production_group_data[pmg_name]['production_methods']:
-                production_group_data[pmg_name]['production_methods'].append(pm_name)
-            
-            # 处理每个物资列
-            for i, goods_name in enumerate(goods_columns):
-                if i + 5 < len(row):  # 确保列索引有效（物资数据从第6列开始）
-                    goods_value = row[i + 5].strip()  # 物资数值（列索引从5开始）
-                    
-                    # 记录物资数据（包括空值）
-                    if goods_name not in production_group_data[pmg_name]['goods_data']:
-                        production_group_data[pmg_name]['goods_data'][goods_name] = {}
-                    
-                    # 存储生产方式对应的物资数值（如果为空则存储为0）
-                    if goods_value and goods_value != '':
-                        production_group_data[pmg_name]['goods_data'][goods_name][pm_name] = goods_value
-                    else:
-                        production_group_data[pmg_name]['goods_data'][goods_name][pm_name] = '0'
-        
         # 生成输出文件
-        with open(output_file, 'w', encoding='utf-8-sig') as outfile:
+        with open_output(output_file) as outfile:
             # 为每个生产方式组中的每个物资生成完整条目
-            for pmg_name, pmg_data in production_group_data.items():
-                production_methods = pmg_data['production_methods']
-                goods_data = pmg_data['goods_data']
-                
-                # 收集该PMG实际使用的物资列表（有非零值的物资）
-                used_goods = [goods for goods, pm_values in goods_data.items() 
-                            if any(v != '0' for v in pm_values.values())]
+            for pmg_name, group in model.groups.items():
+                # 收集该PMG实际使用的物资列表（有非零值的物资），按goods文件中的顺序
+                used_goods = group.used_goods(model.goods)
                 
                 # 为每个实际使用的物资生成所有生产方式的条目
                 for goods_name in used_goods:
-                    pm_values = goods_data[goods_name]
-                    for pm_name in production_methods:
+                    for pm_name in group.production_methods:
                         # 获取物资数值，如果没有则使用0
-                        goods_value = pm_values.get(pm_name, '0')
+                        goods_value = format_goods_value(group.goods[pm_name].get(goods_name, 0))
                         
                         # 生成条目：pm名_物资名=物资数
                         entry = f"{pm_name}_{goods_name}={goods_value}\n"
                         outfile.write(entry)
         
         print(f"转换完成！输出文件：{output_file}")
-        print(f"共处理了 {len(production_group_data)} 个生产方式组")
+        print(f"共处理了 {len(model.groups)} 个生产方式组")
+        return True
         
     except Exception as e:
         print(f"转换过程中发生错误：{e}")
@@ -167,23 +175,17 @@ def convert_pm_goods_to_script_values():
 def generate_base_goods_price_script():
     """生成基础物资价格脚本"""
     
-    goods_file = 'goods/00_goods.txt'
     output_file = 'script_values/AUTO_database_base_goods_price.txt'
     
     # 确保输出目录存在
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
     
     try:
-        with open(goods_file, 'r', encoding='utf-8') as file:
-            content = file.read()
-        
-        # 使用正则表达式匹配物资定义和价格信息
-        # 匹配模式：物资名称 = { ... cost = 价格 ... }
-        pattern = r'^(\w+)\s*=\s*\{[^}]*?cost\s*=\s*(\d+)'
-        matches = re.findall(pattern, content, re.MULTILINE | re.DOTALL)
+        # 物资价格在建立数据模型时已经从goods文件中提取
+        matches = get_pm_model().goods_costs
         
         # 生成输出文件
-        with open(output_file, 'w', encoding='utf-8-sig') as outfile:
+        with open_output(output_file) as outfile:
             for goods_name, cost_value in matches:
                 # 生成条目：物资名称_base_price = 价格
                 entry = f"{goods_name}_base_price = {cost_value}\n"
@@ -191,34 +193,13 @@ def generate_base_goods_price_script():
         
         print(f"基础物资价格脚本生成完成！输出文件：{output_file}")
         print(f"共处理了 {len(matches)} 个物资的价格信息")
+        return True
         
-    except FileNotFoundError:
-        print(f"错误：找不到物资文件 {goods_file}")
     except Exception as e:
         print(f"生成基础物资价格脚本时发生错误：{e}")
 
-def generate_price_prediction_script():
-    """生成物资价格预测计算器脚本"""
-    
-    output_file = 'script_values/AUTO_price_prediction.txt'
-    
-    # 确保输出目录存在
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    
-    # 从文件读取物资列对应的英文名称
-    goods_columns = read_goods_from_file()
-    
-    # 如果读取失败，使用空列表
-    if not goods_columns:
-        print("警告：无法读取物资列表，使用空列表")
-        goods_columns = []
-    
-    try:
-        # 生成输出文件
-        with open(output_file, 'w', encoding='utf-8-sig') as outfile:
-            for goods_name in goods_columns:
-                # 为每个物资生成价格预测计算器
-                prediction_script = f"""{goods_name}_price_prediction = {{
+# 物资价格预测计算器
+PRICE_PREDICTION_TEMPLATE = Template("""{goods_name}_price_prediction = {{
     if = {{
         limit = {{
             scope:state_{goods_name}_production_prediction < scope:state_{goods_name}_consumption_prediction
@@ -300,114 +281,485 @@ def generate_price_prediction_script():
     }}
 }}
 
+""")
+
+# 供需价格系数：读取临时值 OGAS_price_production / OGAS_price_consumption（调用前保存），
+# 与上面的分支写法等价：两个分支的分母都是产量和消费中较小的一个，供需相等时分子为0，系数为1
+PRICE_FACTOR_SCRIPT = """OGAS_supply_demand_price_factor = {
+    value = scope:OGAS_price_production
+    subtract = scope:OGAS_price_consumption
+    divide = {
+        value = scope:OGAS_price_production
+        max = scope:OGAS_price_consumption
+        min = 0.1
+    }
+    multiply = -0.75
+    min = -0.75
+    max = 0.75
+    add = 1
+}
+
 """
-                outfile.write(prediction_script)
+
+# 使用共用供需价格系数的物资价格预测计算器
+SHARED_PRICE_PREDICTION_TEMPLATE = Template("""{goods_name}_price_prediction = {{
+    value = scope:state_{goods_name}_production_prediction
+    save_temporary_value_as = OGAS_price_production
+    value = scope:state_{goods_name}_consumption_prediction
+    save_temporary_value_as = OGAS_price_consumption
+    value = OGAS_supply_demand_price_factor
+    multiply = {{
+        value = 1
+        subtract = {{
+            value = state.modifier:state_market_access_price_impact
+            multiply = state.market_access
+        }}
+        multiply = {goods_name}_base_price
+    }}
+    add = {{
+        value = scope:market_{goods_name}_production_prediction
+        save_temporary_value_as = OGAS_price_production
+        value = scope:market_{goods_name}_consumption_prediction
+        save_temporary_value_as = OGAS_price_consumption
+        value = OGAS_supply_demand_price_factor
+        multiply = state.modifier:state_market_access_price_impact
+        multiply = state.market_access
+        multiply = {goods_name}_base_price
+    }}
+}}
+
+""")
+
+def generate_price_prediction_script():
+    """生成物资价格预测计算器脚本"""
+    
+    output_file = 'script_values/AUTO_price_prediction.txt'
+    
+    # 确保输出目录存在
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    
+    try:
+        # 物资列表来自共用的数据模型
+        goods_columns = get_pm_model().goods
+        
+        shared_formula = GENERATION_OPTIONS['shared_price_formula']
+        
+        # 生成输出文件
+        with open_output(output_file) as outfile:
+            if shared_formula:
+                outfile.write(PRICE_FACTOR_SCRIPT)
+            for goods_name in goods_columns:
+                # 为每个物资生成价格预测计算器
+                if shared_formula:
+                    SHARED_PRICE_PREDICTION_TEMPLATE.emit(outfile, goods_name=goods_name)
+                else:
+                    PRICE_PREDICTION_TEMPLATE.emit(outfile, goods_name=goods_name)
         
         print(f"物资价格预测计算器生成完成！输出文件：{output_file}")
         print(f"共为 {len(goods_columns)} 个物资生成了价格预测计算器")
+        if shared_formula and goods_columns:
+            # 每个物资的节点数相同，按一个物资计算
+            inline_nodes = count_script_nodes(PRICE_PREDICTION_TEMPLATE.render(goods_name=goods_columns[0]))
+            shared_nodes = count_script_nodes(SHARED_PRICE_PREDICTION_TEMPLATE.render(goods_name=goods_columns[0]))
+            before = inline_nodes * len(goods_columns)
+            after = shared_nodes * len(goods_columns) + count_script_nodes(PRICE_FACTOR_SCRIPT)
+            print(f"脚本节点数：{before} → {after}（每个物资 {inline_nodes} → {shared_nodes}）")
+        return True
         
     except Exception as e:
         print(f"生成物资价格预测计算器时发生错误：{e}")
 
-def generate_goods_origin_script():
-    """生成物资原始情况计算器脚本"""
+def pm_manage_shards(model):
+    """
+    把PM管理的建筑类型分为若干份，每次PM管理只处理其中一份，返回每份的建筑类型列表（按出现顺序）
+    按PMModel.pm_manage_cost估计的计算量，从大到小依次放入当前计算量最小的一份；不分片时为所有建筑类型
+    """
+    shard_count = GENERATION_OPTIONS['pm_manage_shards']
+    if shard_count <= 1:
+        return [list(model.building_groups)]
     
-    output_file = 'script_values/AUTO_goods_origin.txt'
+    costs = {building_type: model.pm_manage_cost(building_type) for building_type in model.building_groups}
+    managed = [building_type for building_type, cost in costs.items() if cost > 0]
+    shard_count = max(min(shard_count, len(managed)), 1)
+    shards = [[] for _ in range(shard_count)]
+    loads = [0] * shard_count
+    for building_type in sorted(managed, key=lambda building_type: -costs[building_type]):
+        index = loads.index(min(loads))
+        shards[index].append(building_type)
+        loads[index] += costs[building_type]
     
-    # 确保输出目录存在
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    order = {building_type: i for i, building_type in enumerate(model.building_groups)}
+    return [sorted(shard, key=order.__getitem__) for shard in shards]
+
+def pm_manage_effect_name(name, shards, index):
+    """每份建筑类型对应的效果名，不分片时与原来的效果名相同"""
+    return name if len(shards) == 1 else f"{name}_shard_{index}"
+
+def shard_groups(shards, groups):
+    """每份中的生产方式组：编号 -> 生产方式组列表，不包含没有生产方式组的份"""
+    if len(shards) == 1:
+        return {0: groups} if groups else {}
+    result = {}
+    for index, shard in enumerate(shards):
+        shard_buildings = set(shard)
+        shard_data = [group for group in groups if group.building in shard_buildings]
+        if shard_data:
+            result[index] = shard_data
+    return result
+
+# 分片轮换：OGAS_next_pm_shard 在每次PM管理开始时切换到下一份，
+# PM_balance、PM_upgrade 等按 OGAS_pm_shard 只执行当前一份
+PM_SHARD_NEXT_TEMPLATE = Template("""OGAS_next_pm_shard = {{
+    if = {{
+        limit = {{
+            has_variable = OGAS_pm_shard
+            var:OGAS_pm_shard < {last_shard}
+        }}
+        change_variable = {{
+            name = OGAS_pm_shard
+            add = 1
+        }}
+    }}
+    else = {{
+        set_variable = {{
+            name = OGAS_pm_shard
+            value = 0
+        }}
+    }}
+}}
+""")
+
+PM_SHARD_DISPATCH_TEMPLATE = Template("""    {branch} = {{
+        limit = {{
+            var:OGAS_pm_shard = {index}
+        }}
+        {effect_name} = yes
+    }}
+""")
+
+def write_shard_dispatch(outfile, name, shards, shard_effects):
+    """分片时生成按 OGAS_pm_shard 调用当前一份的效果；不分片时不生成"""
+    if len(shards) == 1 or not shard_effects:
+        return
+    outfile.write(f"{name} = {{\n")
+    for position, index in enumerate(shard_effects):
+        PM_SHARD_DISPATCH_TEMPLATE.emit(outfile, branch='else_if' if position else 'if', index=index,
+                                        effect_name=pm_manage_effect_name(name, shards, index))
+    outfile.write("}\n")
+
+# 脏标记：OGAS_refresh_pm_snapshots 在每次PM管理开始时把计数器 OGAS_pm_run 加1，
+# 并为每个state记录物资价格（state_goods_pricier）超出上次快照阈值的时间，
+# 需要重新计算的建筑类型的 OGAS_<建筑>_pm_dirty 设为本次计数，PM管理中只计算这些建筑；
+# 计算完成后由 OGAS_commit_pm_snapshots 记录 OGAS_<建筑>_pm_evaluated 和新的快照
+PM_DIRTY_HEAD_TEMPLATE = Template("""OGAS_refresh_pm_snapshots = {{
+    if = {{
+        limit = {{
+            has_variable = OGAS_pm_run
+        }}
+        change_variable = {{
+            name = OGAS_pm_run
+            add = 1
+        }}
+    }}
+    else = {{
+        set_variable = {{
+            name = OGAS_pm_run
+            value = 1
+        }}
+    }}
+    every_scope_state = {{
+""")
+
+PM_DIRTY_GOODS_TEMPLATE = Template("""        if = {{
+            limit = {{
+                or = {{
+                    not = {{
+                        has_variable = OGAS_{goods_name}_pricier_max
+                    }}
+                    sg:{goods_name}.state_goods_pricier > var:OGAS_{goods_name}_pricier_max
+                    sg:{goods_name}.state_goods_pricier < var:OGAS_{goods_name}_pricier_min
+                }}
+            }}
+            set_variable = {{
+                name = OGAS_{goods_name}_pricier_moved
+                value = root.var:OGAS_pm_run
+            }}
+            set_variable = {{
+                name = OGAS_{goods_name}_pricier_max
+                value = {{
+                    value = sg:{goods_name}.state_goods_pricier
+                    add = {threshold}
+                }}
+            }}
+            set_variable = {{
+                name = OGAS_{goods_name}_pricier_min
+                value = {{
+                    value = sg:{goods_name}.state_goods_pricier
+                    subtract = {threshold}
+                }}
+            }}
+        }}
+""")
+
+# 建筑类型需要重新计算：从未计算过、超过最长间隔、雇佣率或任一相关物资的价格在上次计算后变化超过阈值
+PM_DIRTY_BUILDING_HEAD_TEMPLATE = Template("""        if = {{
+            limit = {{
+                has_active_building = {building_type}
+                or = {{
+                    not = {{
+                        has_variable = OGAS_{building_type}_pm_evaluated
+                    }}
+                    root.var:OGAS_pm_run >= var:OGAS_{building_type}_pm_expires
+                    b:{building_type}.occupancy > var:OGAS_{building_type}_occupancy_max
+                    b:{building_type}.occupancy < var:OGAS_{building_type}_occupancy_min
+""")
+
+PM_DIRTY_BUILDING_GOODS_TEMPLATE = Template("""                    var:OGAS_{goods_name}_pricier_moved > var:OGAS_{building_type}_pm_evaluated
+""")
+
+PM_DIRTY_BUILDING_TAIL_TEMPLATE = Template("""                }}
+            }}
+            set_variable = {{
+                name = OGAS_{building_type}_pm_dirty
+                value = root.var:OGAS_pm_run
+            }}
+        }}
+""")
+
+# 建筑类型的balance/upgrade生产方式没有用到任何物资时没有可以比较的快照，每次PM管理都重新计算
+PM_DIRTY_BUILDING_ALWAYS_TEMPLATE = Template("""        if = {{
+            limit = {{
+                has_active_building = {building_type}
+            }}
+            set_variable = {{
+                name = OGAS_{building_type}_pm_dirty
+                value = root.var:OGAS_pm_run
+            }}
+        }}
+""")
+
+# 本次重新计算的state中，选出的生产方式都已执行（没有被 cnm_pm_manage_amount 截掉）时才记录为已计算并更新快照，
+# 否则保持需要重新计算，下次PM管理继续处理；随后清除剩下的选择
+PM_COMMIT_BUILDING_HEAD_TEMPLATE = Template("""        if = {{
+            limit = {{
+                has_active_building = {building_type}
+                var:OGAS_{building_type}_pm_dirty = root.var:OGAS_pm_run
+            }}
+            if = {{
+                limit = {{
+                    nor = {{
+""")
+
+PM_COMMIT_BUILDING_CHOICE_TEMPLATE = Template("""                        has_variable = {choice}
+""")
+
+PM_COMMIT_BUILDING_TAIL_TEMPLATE = Template("""                    }}
+                }}
+                set_variable = {{
+                    name = OGAS_{building_type}_pm_evaluated
+                    value = root.var:OGAS_pm_run
+                }}
+                set_variable = {{
+                    name = OGAS_{building_type}_pm_expires
+                    value = {{
+                        value = root.var:OGAS_pm_run
+                        add = {max_age}
+                    }}
+                }}
+                set_variable = {{
+                    name = OGAS_{building_type}_occupancy_max
+                    value = {{
+                        value = b:{building_type}.occupancy
+                        add = {threshold}
+                    }}
+                }}
+                set_variable = {{
+                    name = OGAS_{building_type}_occupancy_min
+                    value = {{
+                        value = b:{building_type}.occupancy
+                        subtract = {threshold}
+                    }}
+                }}
+            }}
+""")
+
+def pm_dirty_guard(building_type, indent, scope=''):
+    """脏标记守卫：本次PM管理需要重新计算该建筑类型时成立，未启用时为空；scope为从当前作用域到state的路径"""
+    if not GENERATION_OPTIONS['dirty_tracking']:
+        return ""
+    return f"{' ' * indent}{scope}var:OGAS_{building_type}_pm_dirty = owner.var:OGAS_pm_run\n"
+
+def pm_tracked_goods(model, building_type):
+    """建筑类型的balance/upgrade生产方式用到的所有物资（按goods文件顺序）"""
+    goods = set()
+    for pmg_name in model.building_groups.get(building_type, ()):
+        group = model.groups[pmg_name]
+        for pm_name in group.methods_by_type.get('balance', []) + group.methods_by_type.get('upgrade', []):
+            goods.update(model.methods[(pmg_name, pm_name)])
+    return sorted(goods, key=model.goods_index.__getitem__)
+
+def pm_choice_variables(model, building_type):
+    """建筑类型在按建筑类型选出生产方式时可能保存的state变量（每个balance/upgrade生产方式组一个）"""
+    choices = []
+    for pmg_name in model.building_groups.get(building_type, ()):
+        group = model.groups[pmg_name]
+        if 'balance' in group.methods_by_type:
+            choices.append(balance_choice_variable(pmg_name))
+        if 'upgrade' in group.methods_by_type:
+            choices.append(upgrade_choice_variable(pmg_name))
+    return choices
+
+def write_sharded_state_blocks(outfile, shards, render_building):
+    """在 every_scope_state 中写出每个建筑类型的块，分片时只处理本次的一份建筑类型，其他建筑类型保留上次的记录"""
+    for index, shard in enumerate(shards):
+        blocks = [render_building(building_type) for building_type in shard]
+        blocks = [block for block in blocks if block]
+        if len(shards) == 1:
+            outfile.write(''.join(blocks))
+        elif blocks:
+            outfile.write(f"        if = {{\n            limit = {{\n                root.var:OGAS_pm_shard = {index}\n"
+                          f"            }}\n")
+            outfile.write(textwrap.indent(''.join(blocks), '    '))
+            outfile.write("        }\n")
+
+def write_pm_dirty_script(outfile, model, shards):
+    """
+    生成 OGAS_refresh_pm_snapshots 和 OGAS_commit_pm_snapshots，
+    返回 (记录快照的物资数, 判断的建筑类型数, 没有物资快照、每次都重新计算的建筑类型数)
+    前者在PM管理开始时标记需要重新计算的state，后者在PM_upgrade、PM_balance之后只为选出的生产方式都已执行的state记录快照
+    """
+    if not GENERATION_OPTIONS['dirty_tracking']:
+        # 未启用时保留空的效果供手写脚本调用
+        outfile.write("OGAS_refresh_pm_snapshots = {\n}\n")
+        outfile.write("OGAS_commit_pm_snapshots = {\n}\n")
+        return 0, 0, 0
     
-    # 从文件读取物资列对应的英文名称
-    goods_columns = read_goods_from_file()
+    threshold = GENERATION_OPTIONS['dirty_threshold']
+    max_age = GENERATION_OPTIONS['dirty_max_age']
+    tracked = {building_type: pm_tracked_goods(model, building_type) for building_type in model.building_groups}
+    # PM管理中带有脏标记守卫的建筑类型都要设置OGAS_<建筑>_pm_dirty，否则守卫永远不成立
+    always_dirty = [building_type for building_type, goods in tracked.items()
+                    if not goods and pm_choice_variables(model, building_type)]
+    tracked = {building_type: goods for building_type, goods in tracked.items() if goods}
+    all_goods = sorted({goods_name for goods in tracked.values() for goods_name in goods},
+                       key=model.goods_index.__getitem__)
     
-    # 如果读取失败，使用空列表
-    if not goods_columns:
-        print("警告：无法读取物资列表，使用空列表")
-        goods_columns = []
+    def render_refresh(building_type):
+        if building_type in always_dirty:
+            return PM_DIRTY_BUILDING_ALWAYS_TEMPLATE.render(building_type=building_type)
+        if building_type not in tracked:
+            return ""
+        return (PM_DIRTY_BUILDING_HEAD_TEMPLATE.render(building_type=building_type)
+                + ''.join(PM_DIRTY_BUILDING_GOODS_TEMPLATE.render(goods_name=goods_name, building_type=building_type)
+                          for goods_name in tracked[building_type])
+                + PM_DIRTY_BUILDING_TAIL_TEMPLATE.render(building_type=building_type))
     
-    try:
-        # 使用统一函数读取CSV文件
-        rows = read_pm_goods_csv()
-        
-        if len(rows) < 2:
-            print("错误：CSV文件为空或格式不正确")
-            return
-        
-        # 构建数据结构：每个生产方式组对应的物资和生产方式
-        production_group_data = {}
-        
-        # 处理每一行数据（跳过标题行）
-        for row in rows[1:]:
-            if len(row) < 3:
-                continue
-            
-            building_type = row[0].strip()  # 建筑类型（第1列）
-            pmg_name = row[1].strip()  # 生产方式组名称（第2列）
-            pm_name = row[2].strip()  # 生产方式名称（第3列）
-            
-            # 初始化生产方式组数据
-            if pmg_name not in production_group_data:
-                production_group_data[pmg_name] = {
-                    'building_type': building_type,
-                    'production_methods': [],
-                    'goods_data': {}
-                }
-            
-            # 添加生产方式
-            if pm_name not in production_group_data[pmg_name]['production_methods']:
-                production_group_data[pmg_name]['production_methods'].append(pm_name)
-            
-            # 处理每个物资列
-            for i, goods_name in enumerate(goods_columns):
-                if i + 5 < len(row):  # 确保列索引有效（物资数据从第6列开始）
-                    goods_value = row[i + 5].strip()  # 物资数值（列索引从5开始）
-                    
-                    # 只处理有实际数值的条目（非空且非零）
-                    if goods_value and goods_value != '0' and goods_value != '0.0':
-                        if goods_name not in production_group_data[pmg_name]['goods_data']:
-                            production_group_data[pmg_name]['goods_data'][goods_name] = []
-                        production_group_data[pmg_name]['goods_data'][goods_name].append((pm_name, goods_value))
-        
-        # 生成输出文件
-        with open(output_file, 'w', encoding='utf-8-sig') as outfile:
-            for pmg_name, pmg_data in production_group_data.items():
-                building_type = pmg_data['building_type']
-                production_methods = pmg_data['production_methods']
-                goods_data = pmg_data['goods_data']
-                
-                # 为每个物资生成计算器
-                for goods_name, pm_list in goods_data.items():
-                    # 生成 pmg_生产组名_物资名_current 计算器
-                    current_script = f"""{pmg_name}_{goods_name}_current = {{
+    def render_commit(building_type):
+        if building_type not in tracked:
+            return ""
+        choices = pm_choice_variables(model, building_type)
+        return (PM_COMMIT_BUILDING_HEAD_TEMPLATE.render(building_type=building_type)
+                + ''.join(PM_COMMIT_BUILDING_CHOICE_TEMPLATE.render(choice=choice) for choice in choices)
+                + PM_COMMIT_BUILDING_TAIL_TEMPLATE.render(building_type=building_type, max_age=max_age,
+                                                          threshold=threshold)
+                + textwrap.indent(''.join(PM_SELECT_CLEAR_TEMPLATE.render(choice=choice) for choice in choices), '    ')
+                + "        }\n")
+    
+    PM_DIRTY_HEAD_TEMPLATE.emit(outfile)
+    for goods_name in all_goods:
+        PM_DIRTY_GOODS_TEMPLATE.emit(outfile, goods_name=goods_name, threshold=threshold)
+    write_sharded_state_blocks(outfile, shards, render_refresh)
+    outfile.write("    }\n")
+    outfile.write("}\n")
+    
+    outfile.write("\nOGAS_commit_pm_snapshots = {\n")
+    outfile.write("    every_scope_state = {\n")
+    write_sharded_state_blocks(outfile, shards, render_commit)
+    outfile.write("    }\n")
+    outfile.write("}\n")
+    return len(all_goods), len(tracked), len(always_dirty)
+
+def cached_pm_groups(model):
+    """需要缓存当前生产方式的生产方式组：只有balance/upgrade组的current会在PM管理中用到"""
+    if not GENERATION_OPTIONS['cache_active_pm']:
+        return set()
+    return {group.name for group in model.groups.values()
+            if 'balance' in group.methods_by_type or 'upgrade' in group.methods_by_type}
+
+def memoized_profit_methods(model):
+    """需要预先计算利润预测的生产方式：生产方式组 -> balance/upgrade生产方式（按出现顺序）"""
+    if not GENERATION_OPTIONS['memoize_profit_prediction']:
+        return {}
+    memoized = {}
+    for group in model.groups.values():
+        methods = dict.fromkeys(group.methods_by_type.get('balance', []) + group.methods_by_type.get('upgrade', []))
+        if methods:
+            memoized[group.name] = list(methods)
+    return memoized
+
+def duplicate_profit_methods(model):
+    """
+    预先计算的生产方式中物资与同组之前某个生产方式完全相同的：(生产方式组, 生产方式) -> 之前的生产方式，
+    两者的利润预测在任何state都相等，只计算一次，之后的直接复制变量
+    """
+    duplicates = {}
+    for pmg_name, production_methods in memoized_profit_methods(model).items():
+        for i, pm_name in enumerate(production_methods):
+            source = next((other_pm for other_pm in production_methods[:i]
+                           if model.same_goods(pmg_name, pm_name, other_pm)), None)
+            if source:
+                duplicates[(pmg_name, pm_name)] = source
+    return duplicates
+
+def hoisted_baseline_groups(model):
+    """利润预测读取预先保存的基准值的生产方式组：只有预先计算利润预测时，基准值才能在计算前统一保存"""
+    if not GENERATION_OPTIONS['hoist_pmg_baselines']:
+        return set()
+    return set(memoized_profit_methods(model))
+
+def profit_reference(building_type, pmg_name, pm_name, weighted=False):
+    """PM平衡/升级中读取利润预测的写法：预先计算时读取建筑变量，否则直接计算script value"""
+    suffix = '_weighted' if weighted else ''
+    if GENERATION_OPTIONS['memoize_profit_prediction']:
+        return f"b:{building_type}.var:{pmg_name}_{pm_name}_profit{suffix}"
+    return f"b:{building_type}.{pmg_name}_{pm_name}_profit_prediction{suffix}"
+
+# pmg_生产组名_物资名_current 计算器：开头（第一个生产方式）、其他生产方式、结尾
+GOODS_CURRENT_HEAD_TEMPLATE = Template("""{pmg_name}_{goods_name}_current = {{
     if = {{
         limit = {{
-            has_active_production_method = {production_methods[0]}
+            has_active_production_method = {pm_name}
         }}
-        value = {production_methods[0]}_{goods_name}
+        value = {pm_name}_{goods_name}
     }}
-"""
-                    
-                    # 添加其他生产方式的 else_if 块
-                    for i in range(1, len(production_methods)):
-                        current_script += f"""    else_if = {{
+""")
+
+GOODS_CURRENT_ELSE_IF_TEMPLATE = Template("""    else_if = {{
         limit = {{
-            has_active_production_method = {production_methods[i]}
+            has_active_production_method = {pm_name}
         }}
-        value = {production_methods[i]}_{goods_name}
+        value = {pm_name}_{goods_name}
     }}
-"""
-                    
-                    # 添加 else 块和结尾
-                    current_script += f"""    else = {{
+""")
+
+GOODS_CURRENT_TAIL_TEMPLATE = Template("""    else = {{
         value = 0.0
     }}
     multiply = building_work_efficiency
 }}
 
-"""
-                    
-                    # 生成其他4个计算器
-                    origin_scripts = f"""state_{goods_name}_production_if_no_{pmg_name} = {{
+""")
+
+# 读取缓存的 pmg_生产组名_物资名_current 计算器，缓存由OGAS_cache_active_pm在PM管理开始时写入
+GOODS_CURRENT_CACHED_TEMPLATE = Template("""{pmg_name}_{goods_name}_current = {{
+    value = var:{pmg_name}_{goods_name}_cache
+    multiply = building_work_efficiency
+}}
+
+""")
+
+# 去掉该生产方式组后的物资生产/消费计算器
+GOODS_ORIGIN_TEMPLATE = Template("""state_{goods_name}_production_if_no_{pmg_name} = {{
 \tvalue = state.sg:{goods_name}.state_goods_production
     if = {{
         limit = {{
@@ -449,230 +801,367 @@ market_{goods_name}_consumption_if_no_{pmg_name} = {{
     }}
 }}
 
-"""
+""")
+
+def generate_goods_origin_script():
+    """生成物资原始情况计算器脚本"""
+    
+    output_file = 'script_values/AUTO_goods_origin.txt'
+    
+    # 确保输出目录存在
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    
+    try:
+        # 使用共用的数据模型
+        model = get_pm_model()
+        
+        if not model:
+            print("错误：没有可用的生产方式数据")
+            return
+        
+        cached_groups = cached_pm_groups(model)
+        
+        # 生成输出文件
+        with open_output(output_file) as outfile:
+            for pmg_name, group in model.groups.items():
+                production_methods = group.production_methods
+                
+                # 为每个物资生成计算器（按物资在该组生产方式中第一次出现的顺序）
+                for goods_name in group.goods_by_first_use():
+                    if pmg_name in cached_groups:
+                        # 当前生产方式已缓存，不再逐个判断has_active_production_method
+                        GOODS_CURRENT_CACHED_TEMPLATE.emit(outfile, pmg_name=pmg_name, goods_name=goods_name)
+                        GOODS_ORIGIN_TEMPLATE.emit(outfile, goods_name=goods_name, pmg_name=pmg_name)
+                        continue
+                    
+                    # 生成 pmg_生产组名_物资名_current 计算器
+                    GOODS_CURRENT_HEAD_TEMPLATE.emit(outfile, pmg_name=pmg_name, goods_name=goods_name,
+                                                     pm_name=production_methods[0])
+                    
+                    # 添加其他生产方式的 else_if 块
+                    for i in range(1, len(production_methods)):
+                        GOODS_CURRENT_ELSE_IF_TEMPLATE.emit(outfile, pm_name=production_methods[i], goods_name=goods_name)
                     
-                    # 写入文件
-                    outfile.write(current_script)
-                    outfile.write(origin_scripts)
+                    # 添加 else 块和结尾
+                    GOODS_CURRENT_TAIL_TEMPLATE.emit(outfile)
+                    
+                    # 生成其他4个计算器
+                    GOODS_ORIGIN_TEMPLATE.emit(outfile, goods_name=goods_name, pmg_name=pmg_name)
         
         print(f"物资原始情况计算器生成完成！输出文件：{output_file}")
-        print(f"共处理了 {len(production_group_data)} 个生产方式组")
+        print(f"共处理了 {len(model.groups)} 个生产方式组，其中 {len(cached_groups)} 个读取缓存的当前生产方式")
+        return True
         
     except Exception as e:
         print(f"生成物资原始情况计算器时发生错误：{e}")
 
-def generate_building_profit_prediction_script():
-    """生成建筑利润预测计算器脚本"""
+# 当前生产方式缓存：建筑类型分支、生产方式分支、写入一个物资的变量
+ACTIVE_PM_CACHE_BUILDING_TEMPLATE = Template("""        {branch} = {{
+            limit = {{
+                is_building_type = {building_type}
+{guard}            }}
+""")
+
+ACTIVE_PM_CACHE_PM_TEMPLATE = Template("""            {branch} = {{
+                limit = {{
+                    has_active_production_method = {pm_name}
+                }}
+""")
+
+ACTIVE_PM_CACHE_SET_TEMPLATE = Template("""                set_variable = {{
+                    name = {pmg_name}_{goods_name}_cache
+                    value = {value}
+                }}
+""")
+
+# 生产方式组的基准值：去掉该组后的物资生产/消费，与生产方式无关，每个建筑只计算一次，供该组所有生产方式的利润预测读取
+PMG_BASELINE_TEMPLATE = Template("""            save_temporary_scope_value_as = {{
+                name = state_{goods_name}_production_if_no_{pmg_name}
+                value = state_{goods_name}_production_if_no_{pmg_name}
+            }}
+            save_temporary_scope_value_as = {{
+                name = state_{goods_name}_consumption_if_no_{pmg_name}
+                value = state_{goods_name}_consumption_if_no_{pmg_name}
+            }}
+            save_temporary_scope_value_as = {{
+                name = market_{goods_name}_production_if_no_{pmg_name}
+                value = market_{goods_name}_production_if_no_{pmg_name}
+            }}
+            save_temporary_scope_value_as = {{
+                name = market_{goods_name}_consumption_if_no_{pmg_name}
+                value = market_{goods_name}_consumption_if_no_{pmg_name}
+            }}
+""")
+
+# 预先计算一个生产方式的利润预测（以及乘以容忍倍数后的值）
+PROFIT_MEMO_TEMPLATE = Template("""            set_variable = {{
+                name = {pmg_name}_{pm_name}_profit
+                value = {value}
+            }}
+            set_variable = {{
+                name = {pmg_name}_{pm_name}_profit_weighted
+                value = {{
+                    value = var:{pmg_name}_{pm_name}_profit
+                    multiply = owner.var:cnm_upgrade_tolerance_pm_manager
+                }}
+            }}
+""")
+
+def generate_active_pm_cache_script():
+    """
+    生成当前生产方式缓存脚本
+    cnm_start_pm_manage在PM_upgrade、PM_balance之前执行一次OGAS_cache_active_pm，
+    对每个建筑只判断一次当前生产方式，把该生产方式的物资数值写入建筑变量，
+    之后所有 *_if_no_<pmg> 和利润预测读取的 {pmg}_{goods}_current 都直接使用变量；
+    同一次PM管理中切换生产方式后state的物资产量要到下一个tick才更新，缓存的数值与之保持一致。
+    随后每个balance/upgrade生产方式的利润预测只计算一次并保存到建筑变量，PM平衡/升级中的比较和排序都读取变量
+    """
     
-    output_file = 'script_values/AUTO_building_profit_prediction.txt'
+    output_file = 'scripted_effects/AUTO_active_pm_cache.txt'
     
     # 确保输出目录存在
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
     
-    # 从文件读取物资列对应的英文名称
-    goods_columns = read_goods_from_file()
-    
-    # 如果读取失败，使用空列表
-    if not goods_columns:
-        print("警告：无法读取物资列表，使用空列表")
-        goods_columns = []
-    
     try:
-        # 使用统一函数读取CSV文件
-        rows = read_pm_goods_csv()
+        # 使用共用的数据模型
+        model = get_pm_model()
         
-        if len(rows) < 2:
-            print("错误：CSV文件为空或格式不正确")
+        if not model:
+            print("错误：没有可用的生产方式数据")
             return
         
-        # 构建数据结构：每个生产方式对应的物资数据，使用pmg_name和pm_name的组合作为键
-        production_method_data = {}
-        
-        # 处理每一行数据（跳过标题行）
-        for row in rows[1:]:
-            if len(row) < 3:
-                continue
-            
-            building_type = row[0].strip()  # 建筑类型（第1列）
-            pmg_name = row[1].strip()  # 生产方式组名称（第2列）
-            pm_name = row[2].strip()  # 生产方式名称（第3列）
-            
-            # 使用pmg_name和pm_name的组合作为唯一键
-            key = f"{pmg_name}_{pm_name}"
-            
-            # 初始化生产方式数据
-            if key not in production_method_data:
-                production_method_data[key] = {
-                    'building_type': building_type,
-                    'pmg_name': pmg_name,
-                    'pm_name': pm_name,
-                    'goods_data': {}
-                }
-            
-            # 处理每个物资列
-            for i, goods_name in enumerate(goods_columns):
-                if i + 5 < len(row):  # 确保列索引有效（物资数据从第6列开始）
-                    goods_value = row[i + 5].strip()  # 物资数值（列索引从5开始）
-                    
-                    # 只记录有实际数值的条目（非空且非零）
-                    if goods_value and goods_value != '0' and goods_value != '0.0':
-                        production_method_data[key]['goods_data'][goods_name] = goods_value
-        
-        # 生成输出文件
-        with open(output_file, 'w', encoding='utf-8-sig') as outfile:
-            # 为每个生产方式生成利润预测计算器
-            for key, pm_data in production_method_data.items():
-                pmg_name = pm_data['pmg_name']
-                pm_name = pm_data['pm_name']
-                goods_data = pm_data['goods_data']
+        cached_groups = cached_pm_groups(model)
+        memoized_methods = memoized_profit_methods(model)
+        if not cached_groups and not memoized_methods:
+            # 不使用缓存时保留空的效果供手写脚本调用
+            with open_output(output_file) as outfile:
+                outfile.write("OGAS_cache_active_pm = {\n}\n")
+            print("未启用当前生产方式缓存和利润预测预先计算，生成空的OGAS_cache_active_pm")
+            return True
+        
+        hoisted_groups = hoisted_baseline_groups(model)
+        duplicates = duplicate_profit_methods(model)
+        shards = pm_manage_shards(model)
+        cached_buildings = memoized_count = hoisted_baselines = 0
+        with open_output(output_file) as outfile:
+            # 分片时每份建筑类型一个缓存效果，OGAS_cache_active_pm按OGAS_pm_shard调用当前一份
+            write_shard_dispatch(outfile, 'OGAS_cache_active_pm', shards, range(len(shards)))
+            for shard_index, shard in enumerate(shards):
+                outfile.write(f"{pm_manage_effect_name('OGAS_cache_active_pm', shards, shard_index)} = {{\n")
+                outfile.write("    every_scope_building = {\n")
+                # PM管理只处理有人工作的建筑
+                outfile.write("        limit = {\n")
+                outfile.write("            occupancy > 0.01\n")
+                outfile.write("        }\n")
                 
-                # 生成计算器开头
-                profit_script = f"""{pmg_name}_{pm_name}_profit_prediction = {{
-    value = 0
-"""
+                shard_buildings = 0
+                for building_type in shard:
+                    building_groups = model.building_groups[building_type]
+                    groups = [model.groups[pmg_name] for pmg_name in building_groups if pmg_name in cached_groups]
+                    memoized = [(pmg_name, memoized_methods[pmg_name])
+                                for pmg_name in building_groups if pmg_name in memoized_methods]
+                    if not groups and not memoized:
+                        continue
+                    
+                    ACTIVE_PM_CACHE_BUILDING_TEMPLATE.emit(outfile, branch='else_if' if shard_buildings else 'if',
+                                                           building_type=building_type,
+                                                           guard=pm_dirty_guard(building_type, 16, 'state.'))
+                    shard_buildings += 1
+                    cached_buildings += 1
+                    
+                    for group in groups:
+                        goods_names = group.goods_by_first_use()
+                        if not goods_names:
+                            continue
+                        
+                        # 每个生产方式一个分支，写入该生产方式在该组所有物资上的数值
+                        for index, pm_name in enumerate(group.production_methods):
+                            ACTIVE_PM_CACHE_PM_TEMPLATE.emit(outfile, branch='else_if' if index else 'if', pm_name=pm_name)
+                            for goods_name in goods_names:
+                                ACTIVE_PM_CACHE_SET_TEMPLATE.emit(outfile, pmg_name=group.name, goods_name=goods_name,
+                                                                  value=f"{pm_name}_{goods_name}")
+                            outfile.write("            }\n")
+                        
+                        # 没有任何生产方式处于激活状态
+                        outfile.write("            else = {\n")
+                        for goods_name in goods_names:
+                            ACTIVE_PM_CACHE_SET_TEMPLATE.emit(outfile, pmg_name=group.name, goods_name=goods_name, value=0)
+                        outfile.write("            }\n")
+                    
+                    # 当前生产方式已缓存，再计算每个生产方式的利润预测
+                    for pmg_name, production_methods in memoized:
+                        if pmg_name in hoisted_groups:
+                            # 先保存该组所有生产方式共用的基准值
+                            baseline_goods = dict.fromkeys(goods_name for pm_name in production_methods
+                                                           for goods_name in model.methods[(pmg_name, pm_name)])
+                            for goods_name in baseline_goods:
+                                PMG_BASELINE_TEMPLATE.emit(outfile, pmg_name=pmg_name, goods_name=goods_name)
+                            hoisted_baselines += len(baseline_goods)
+                        prediction = HOISTED_PROFIT_PREDICTION if pmg_name in hoisted_groups else 'profit_prediction'
+                        for pm_name in production_methods:
+                            if (pmg_name, pm_name) in duplicates:
+                                # 物资与之前的生产方式相同，复制其利润预测
+                                value = f"var:{pmg_name}_{duplicates[(pmg_name, pm_name)]}_profit"
+                            else:
+                                value = f"{pmg_name}_{pm_name}_{prediction}"
+                            PROFIT_MEMO_TEMPLATE.emit(outfile, pmg_name=pmg_name, pm_name=pm_name, value=value)
+                            memoized_count += 1
+                    
+                    outfile.write("        }\n")
                 
-                # 为每个物资生成 add 块
-                for goods_name, goods_value in goods_data.items():
-                    # 根据物资数值的正负生成不同的逻辑
-                    if float(goods_value) > 0:  # 生产物资
-                        profit_script += f"""    add = {{
+                outfile.write("    }\n")
+                outfile.write("}\n")
+        
+        print(f"当前生产方式缓存生成完成！输出文件：{output_file}")
+        print(f"共为 {cached_buildings} 个建筑类型的 {len(cached_groups)} 个生产方式组生成了缓存，"
+              f"预先计算 {memoized_count} 个生产方式的利润预测（其中 {len(duplicates)} 个与同组生产方式物资相同，直接复制），"
+              f"共用 {hoisted_baselines} 组物资基准值")
+        return True
+        
+    except Exception as e:
+        print(f"生成当前生产方式缓存时发生错误：{e}")
+
+# 建筑利润预测计算器：开头、生产物资、消费物资（负值）、结尾
+PROFIT_PREDICTION_HEAD_TEMPLATE = Template("""{pmg_name}_{pm_name}_{prediction} = {{
+    value = 0
+""")
+
+PROFIT_PREDICTION_OUTPUT_TEMPLATE = Template("""    add = {{
         value = {pm_name}_{goods_name}
         multiply = building_work_efficiency
         save_temporary_value_as = {pm_name}_{goods_name}_prediction
-        value = state_{goods_name}_production_if_no_{pmg_name}
+        value = {baseline}state_{goods_name}_production_if_no_{pmg_name}
         add = scope:{pm_name}_{goods_name}_prediction
         save_temporary_value_as = state_{goods_name}_production_prediction
-        value = state_{goods_name}_consumption_if_no_{pmg_name}
+        value = {baseline}state_{goods_name}_consumption_if_no_{pmg_name}
         save_temporary_value_as = state_{goods_name}_consumption_prediction
-        value = market_{goods_name}_production_if_no_{pmg_name}
+        value = {baseline}market_{goods_name}_production_if_no_{pmg_name}
         add = scope:{pm_name}_{goods_name}_prediction
         save_temporary_value_as = market_{goods_name}_production_prediction
-        value = market_{goods_name}_consumption_if_no_{pmg_name}
+        value = {baseline}market_{goods_name}_consumption_if_no_{pmg_name}
         save_temporary_value_as = market_{goods_name}_consumption_prediction
         value = {goods_name}_price_prediction
         multiply = scope:{pm_name}_{goods_name}_prediction
     }}
-"""
-                    else:  # 消费物资（负值）
-                        profit_script += f"""    add = {{
+""")
+
+PROFIT_PREDICTION_INPUT_TEMPLATE = Template("""    add = {{
         value = {pm_name}_{goods_name}
         multiply = building_work_efficiency
         save_temporary_value_as = {pm_name}_{goods_name}_prediction
-        value = state_{goods_name}_production_if_no_{pmg_name}
+        value = {baseline}state_{goods_name}_production_if_no_{pmg_name}
         save_temporary_value_as = state_{goods_name}_production_prediction
-        value = state_{goods_name}_consumption_if_no_{pmg_name}
+        value = {baseline}state_{goods_name}_consumption_if_no_{pmg_name}
         subtract = scope:{pm_name}_{goods_name}_prediction
         save_temporary_value_as = state_{goods_name}_consumption_prediction
-        value = market_{goods_name}_production_if_no_{pmg_name}
+        value = {baseline}market_{goods_name}_production_if_no_{pmg_name}
         save_temporary_value_as = market_{goods_name}_production_prediction
-        value = market_{goods_name}_consumption_if_no_{pmg_name}
+        value = {baseline}market_{goods_name}_consumption_if_no_{pmg_name}
         subtract = scope:{pm_name}_{goods_name}_prediction
         save_temporary_value_as = market_{goods_name}_consumption_prediction
         value = {goods_name}_price_prediction
         multiply = scope:{pm_name}_{goods_name}_prediction
     }}
-"""
-                
-                # 添加结尾
-                profit_script += f"""    divide = level
+""")
+
+# 读取预先保存的基准值时，*_if_no_<pmg> 前加上scope:
+HOISTED_BASELINE_PREFIX = "scope:"
+
+# 读取scope:基准值的利润预测只在OGAS_cache_active_pm保存基准值之后使用，与公开的计算器分开命名，
+# 在其他地方调用时是未定义的引用，而不会静默得到0
+HOISTED_PROFIT_PREDICTION = "profit_prediction_hoisted"
+
+PROFIT_PREDICTION_TAIL_TEMPLATE = Template("""    divide = level
 }}
 
-{pmg_name}_{pm_name}_profit_prediction_weighted = {{
+""")
+
+PROFIT_PREDICTION_WEIGHTED_TEMPLATE = Template("""{pmg_name}_{pm_name}_profit_prediction_weighted = {{
     value = {pmg_name}_{pm_name}_profit_prediction
     multiply = owner.var:cnm_upgrade_tolerance_pm_manager
 }}
 
-"""
-                
-                # 写入文件
-                outfile.write(profit_script)
-        
-        print(f"建筑利润预测计算器生成完成！输出文件：{output_file}")
-        print(f"共为 {len(production_method_data)} 个生产方式生成了利润预测计算器")
-        
-    except Exception as e:
-        print(f"生成建筑利润预测计算器时发生错误：{e}")
+""")
 
-def generate_pm_balance_script():
-    """生成PM排序计算器脚本"""
+def write_profit_prediction(outfile, pmg_name, pm_name, goods_data, prediction, baseline):
+    """写出一个生产方式的利润预测计算器"""
+    PROFIT_PREDICTION_HEAD_TEMPLATE.emit(outfile, pmg_name=pmg_name, pm_name=pm_name, prediction=prediction)
     
-    balance_output_file = 'scripted_effects/AUTO_PM_balance.txt'
-    upgrade_output_file = 'scripted_effects/AUTO_PM_upgrade.txt'
+    # 为每个物资生成 add 块
+    for goods_name, goods_value in goods_data.items():
+        # 根据物资数值的正负生成不同的逻辑
+        if goods_value > 0:  # 生产物资
+            PROFIT_PREDICTION_OUTPUT_TEMPLATE.emit(outfile, pmg_name=pmg_name, pm_name=pm_name,
+                                                   goods_name=goods_name, baseline=baseline)
+        else:  # 消费物资（负值）
+            PROFIT_PREDICTION_INPUT_TEMPLATE.emit(outfile, pmg_name=pmg_name, pm_name=pm_name,
+                                                  goods_name=goods_name, baseline=baseline)
+    
+    PROFIT_PREDICTION_TAIL_TEMPLATE.emit(outfile)
+
+def generate_building_profit_prediction_script():
+    """生成建筑利润预测计算器脚本"""
+    
+    output_file = 'script_values/AUTO_building_profit_prediction.txt'
     
     # 确保输出目录存在
-    os.makedirs(os.path.dirname(balance_output_file), exist_ok=True)
-    os.makedirs(os.path.dirname(upgrade_output_file), exist_ok=True)
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
     
     try:
-        # 使用统一函数读取CSV文件
-        rows = read_pm_goods_csv()
+        # 使用共用的数据模型
+        model = get_pm_model()
         
-        if len(rows) < 2:
-            print("错误：CSV文件为空或格式不正确")
+        if not model:
+            print("错误：没有可用的生产方式数据")
             return
         
-        # 构建数据结构：按type分类的生产方式组数据
-        balance_data = {}  # type为balance的数据
-        upgrade_data = {}  # type为upgrade的数据
+        hoisted_groups = hoisted_baseline_groups(model)
+        memoized = {(pmg_name, pm_name) for pmg_name, methods in memoized_profit_methods(model).items()
+                    for pm_name in methods}
+        duplicates = duplicate_profit_methods(model)
+        hoisted_count = memoized_count = 0
         
-        # 处理每一行数据（跳过标题行）
-        for row in rows[1:]:
-            # 检查行长度是否足够（至少需要4列，包括type列）
-            if len(row) < 4:
-                continue
-            
-            type_value = row[3].strip()  # type列（第4列）
-            building_type = row[0].strip()  # 建筑类型（第1列）
-            pmg_name = row[1].strip()  # 生产方式组名称（第2列）
-            pm_name = row[2].strip()  # 生产方式名称（第3列）
-            
-            # 根据type值分类处理
-            if type_value == "balance":
-                if pmg_name not in balance_data:
-                    balance_data[pmg_name] = {
-                        'building_type': building_type,
-                        'production_methods': []
-                    }
-                if pm_name not in balance_data[pmg_name]['production_methods']:
-                    balance_data[pmg_name]['production_methods'].append(pm_name)
-            
-            elif type_value == "upgrade":
-                if pmg_name not in upgrade_data:
-                    upgrade_data[pmg_name] = {
-                        'building_type': building_type,
-                        'production_methods': []
-                    }
-                if pm_name not in upgrade_data[pmg_name]['production_methods']:
-                    upgrade_data[pmg_name]['production_methods'].append(pm_name)
+        # 生成输出文件
+        with open_output(output_file) as outfile:
+            for (pmg_name, pm_name), goods_data in model.methods.items():
+                if (pmg_name, pm_name) in duplicates:
+                    # 预先计算时复制物资相同的生产方式的变量，不会调用
+                    continue
+                if (pmg_name, pm_name) not in memoized:
+                    # 公开的计算器自己计算基准值，在任何地方调用都有效
+                    write_profit_prediction(outfile, pmg_name, pm_name, goods_data, 'profit_prediction', "")
+                    PROFIT_PREDICTION_WEIGHTED_TEMPLATE.emit(outfile, pmg_name=pmg_name, pm_name=pm_name)
+                elif pmg_name in hoisted_groups:
+                    # 预先计算的生产方式只在OGAS_cache_active_pm中计算一次，只生成读取该组共用基准值的版本
+                    write_profit_prediction(outfile, pmg_name, pm_name, goods_data,
+                                            HOISTED_PROFIT_PREDICTION, HOISTED_BASELINE_PREFIX)
+                    hoisted_count += 1
+                else:
+                    # 比较时读取建筑变量，不需要乘以容忍倍数的版本
+                    write_profit_prediction(outfile, pmg_name, pm_name, goods_data, 'profit_prediction', "")
+                    memoized_count += 1
         
-        # 生成balance类型输出文件
-        if balance_data:
-            with open(balance_output_file, 'w', encoding='utf-8-sig') as outfile:
-                # 添加文件开头
-                outfile.write("PM_balance = {\n")
-                
-                # 为每个生产方式组生成排序计算器
-                for pmg_name, pmg_data in balance_data.items():
-                    building_type = pmg_data['building_type']
-                    production_methods = pmg_data['production_methods']
-                    
-                    # 为每个生产方式生成 ordered_scope_state 块
-                    for pm_name in production_methods:
-                        # 生成 ordered_scope_state 块开头
-                        balance_script = f"""    ordered_scope_state = {{
+        print(f"建筑利润预测计算器生成完成！输出文件：{output_file}")
+        print(f"共为 {len(model.methods)} 个生产方式生成了利润预测计算器，其中预先计算的 {hoisted_count + memoized_count} 个"
+              f"只生成OGAS_cache_active_pm使用的版本（读取共用基准值的 {hoisted_count} 个），"
+              f"{len(duplicates)} 个与同组生产方式物资相同，不再生成")
+        return True
+        
+    except Exception as e:
+        print(f"生成建筑利润预测计算器时发生错误：{e}")
+
+# PM平衡：ordered_scope_state 开头、与其他生产方式比较的 trigger_if、结尾
+PM_BALANCE_HEAD_TEMPLATE = Template("""    ordered_scope_state = {{
         limit = {{
             has_active_building = {building_type}
             b:{building_type}.occupancy > 0.01
-            can_activate_production_method = {{
+{guard}            can_activate_production_method = {{
                 building_type = {building_type}
                 production_method = {pm_name}
             }}
-"""
-                        
-                        # 为每个非当前生产方式生成 trigger_if 块
-                        for other_pm in production_methods:
-                            if other_pm != pm_name:
-                                balance_script += f"""            trigger_if = {{
+""")
+
+PM_BALANCE_TRIGGER_TEMPLATE = Template("""            trigger_if = {{
                 limit = {{
                     or = {{
                         can_activate_production_method = {{
@@ -685,13 +1174,26 @@ def generate_pm_balance_script():
                         }}
                     }}
                 }}
-                b:{building_type}.{pmg_name}_{pm_name}_profit_prediction > b:{building_type}.{pmg_name}_{other_pm}_profit_prediction_weighted
+                {comparison}
             }}
-"""
-                        
-                        # 生成 ordered_scope_state 块结尾
-                        balance_script += f"""        }}
-        order_by = b:{building_type}.{pmg_name}_{pm_name}_profit_prediction
+""")
+
+# other_pm与当前生产方式物资完全相同且没有投入时，两者利润预测相等且不为负，
+# 利润比较（需要高出容忍倍数）在other_pm可用时不可能成立，只需判断other_pm不可用
+PM_BALANCE_UNAVAILABLE_TEMPLATE = Template("""            nor = {{
+                can_activate_production_method = {{
+                    building_type = {building_type}
+                    production_method = {other_pm}
+                }}
+                is_production_method_active = {{
+                    building_type = {building_type}
+                    production_method = {other_pm}
+                }}
+            }}
+""")
+
+PM_BALANCE_TAIL_TEMPLATE = Template("""        }}
+        order_by = {profit}
         max = owner.var:cnm_pm_manage_amount
         check_range_bounds = no
         activate_production_method = {{
@@ -699,41 +1201,14 @@ def generate_pm_balance_script():
             production_method = {pm_name}
         }}
     }}
-"""
-                        
-                        # 写入文件
-                        outfile.write(balance_script)
-                
-                # 添加文件结尾
-                outfile.write("}\n")
-            
-            print(f"PM平衡计算器生成完成！输出文件：{balance_output_file}")
-            print(f"共为 {len(balance_data)} 个生产方式组生成了平衡计算器")
-        else:
-            print("未找到type为balance的数据，跳过生成平衡计算器")
-        
-        # 生成upgrade类型输出文件
-        if upgrade_data:
-            with open(upgrade_output_file, 'w', encoding='utf-8-sig') as outfile:
-                # 添加文件开头
-                outfile.write("PM_upgrade = {\n")
-                
-                # 为每个生产方式组生成升级计算器
-                for pmg_name, pmg_data in upgrade_data.items():
-                    building_type = pmg_data['building_type']
-                    production_methods = pmg_data['production_methods']
-                    
-                    # 按生产方式在列表中的顺序推断层级关系（假设按顺序就是层级关系）
-                    for i in range(len(production_methods) - 1):
-                        current_pm = production_methods[i]
-                        next_pm = production_methods[i + 1]
-                        
-                        # 生成升级块（从当前生产方式升级到下一级生产方式）
-                        upgrade_script = f"""    ordered_scope_state = {{
+""")
+
+# PM升级：从当前生产方式升级到下一级生产方式
+PM_UPGRADE_TEMPLATE = Template("""    ordered_scope_state = {{
         limit = {{
             has_active_building = {building_type}
             b:{building_type}.occupancy > 0.01
-            is_production_method_active = {{
+{guard}            is_production_method_active = {{
                 building_type = {building_type}
                 production_method = {current_pm}
             }}
@@ -741,9 +1216,9 @@ def generate_pm_balance_script():
                 building_type = {building_type}
                 production_method = {next_pm}
             }}
-            b:{building_type}.{pmg_name}_{next_pm}_profit_prediction_weighted > b:{building_type}.{pmg_name}_{current_pm}_profit_prediction
+            {next_profit_weighted} > {current_profit}
         }}
-        order_by = b:{building_type}.{pmg_name}_{next_pm}_profit_prediction_weighted
+        order_by = {next_profit_weighted}
         max = owner.var:cnm_pm_manage_amount
         check_range_bounds = no
         activate_production_method = {{
@@ -751,53 +1226,492 @@ def generate_pm_balance_script():
             production_method = {next_pm}
         }}
     }}
-"""
-                        outfile.write(upgrade_script)
-                
-                # 添加文件结尾
-                outfile.write("}\n")
+""")
+
+# 按建筑类型的PM平衡/升级：遍历有该建筑的state，选出每个生产方式组的最优生产方式保存到state变量，
+# 其中 {choice} 为 OGAS_balance_<pmg> 或 OGAS_upgrade_<pmg>，{choice}_profit 为其利润预测
+PM_SELECT_BUILDING_HEAD_TEMPLATE = Template("""    every_scope_state = {{
+        limit = {{
+            has_active_building = {building_type}
+        }}
+""")
+
+PM_SELECT_CLEAR_TEMPLATE = Template("""        remove_variable = {choice}
+        remove_variable = {choice}_profit
+""")
+
+PM_SELECT_OCCUPANCY_TEMPLATE = Template("""        if = {{
+            limit = {{
+                b:{building_type}.occupancy > 0.01
+{guard}            }}
+""")
+
+PM_BALANCE_CANDIDATE_HEAD_TEMPLATE = Template("""            if = {{
+                limit = {{
+                    can_activate_production_method = {{
+                        building_type = {building_type}
+                        production_method = {pm_name}
+                    }}
+""")
+
+PM_BALANCE_CANDIDATE_TRIGGER_TEMPLATE = Template("""                    trigger_if = {{
+                        limit = {{
+                            or = {{
+                                can_activate_production_method = {{
+                                    building_type = {building_type}
+                                    production_method = {other_pm}
+                                }}
+                                is_production_method_active = {{
+                                    building_type = {building_type}
+                                    production_method = {other_pm}
+                                }}
+                            }}
+                        }}
+                        {comparison}
+                    }}
+""")
+
+PM_BALANCE_CANDIDATE_UNAVAILABLE_TEMPLATE = Template("""                    nor = {{
+                        can_activate_production_method = {{
+                            building_type = {building_type}
+                            production_method = {other_pm}
+                        }}
+                        is_production_method_active = {{
+                            building_type = {building_type}
+                            production_method = {other_pm}
+                        }}
+                    }}
+""")
+
+# 同一组有多个生产方式满足条件时（利润为负时可能出现）保留利润预测最高的
+PM_BALANCE_CANDIDATE_TAIL_TEMPLATE = Template("""                    trigger_if = {{
+                        limit = {{
+                            has_variable = {choice}_profit
+                        }}
+                        {profit} > var:{choice}_profit
+                    }}
+                }}
+                set_variable = {{
+                    name = {choice}
+                    value = {index}
+                }}
+                set_variable = {{
+                    name = {choice}_profit
+                    value = {profit}
+                }}
+            }}
+""")
+
+# 按利润预测从高到低，最多对 cnm_pm_manage_amount 个state执行选出的生产方式
+PM_APPLY_HEAD_TEMPLATE = Template("""    ordered_scope_state = {{
+        limit = {{
+            has_variable = {choice}
+            has_active_building = {building_type}
+        }}
+        order_by = var:{choice}_profit
+        max = owner.var:cnm_pm_manage_amount
+        check_range_bounds = no
+""")
+
+PM_APPLY_TEMPLATE = Template("""        {branch} = {{
+            limit = {{
+                var:{choice} = {index}
+            }}
+            activate_production_method = {{
+                building_type = {building_type}
+                production_method = {pm_name}
+            }}
+        }}
+""")
+
+def write_apply_tail(outfile, choice):
+    """按利润执行的块结尾：记录脏标记时清除已执行的选择，剩下的选择即被 cnm_pm_manage_amount 截掉的state"""
+    if GENERATION_OPTIONS['dirty_tracking']:
+        outfile.write(f"        remove_variable = {choice}\n")
+    outfile.write("    }\n")
+
+# balance生产方式与同组其他生产方式的比较方式：
+# 比较利润预测；other_pm与其物资相同且没有投入时只需判断other_pm不可用；
+# 物资相同但有投入时两者利润预测相等，高出容忍倍数（大于1）当且仅当利润为负
+BALANCE_COMPARE_PROFIT = 'profit'
+BALANCE_COMPARE_UNAVAILABLE = 'unavailable'
+BALANCE_COMPARE_NEGATIVE = 'negative'
+
+def balance_choice_variable(pmg_name):
+    return f"OGAS_balance_{pmg_name}"
+
+def balance_candidates(model, group, prune_dominated):
+    """
+    生产方式组中可能被选中的balance生产方式：[(生产方式, 与其他生产方式的比较)]，
+    比较为 (其他生产方式, 比较方式)，比较方式为 BALANCE_COMPARE_PROFIT、BALANCE_COMPARE_UNAVAILABLE 或 BALANCE_COMPARE_NEGATIVE；
+    与其他生产方式都物资相同且没有投入时不会被选中，不列出
+    """
+    production_methods = group.methods_by_type["balance"]
+    candidates = []
+    for pm_name in production_methods:
+        comparisons = []
+        for other_pm in production_methods:
+            if other_pm == pm_name:
+                continue
+            if not prune_dominated or not model.same_goods(group.name, pm_name, other_pm):
+                comparisons.append((other_pm, BALANCE_COMPARE_PROFIT))
+            elif model.same_nonnegative_goods(group.name, pm_name, other_pm):
+                comparisons.append((other_pm, BALANCE_COMPARE_UNAVAILABLE))
+            else:
+                comparisons.append((other_pm, BALANCE_COMPARE_NEGATIVE))
+        if prune_dominated and all(kind == BALANCE_COMPARE_UNAVAILABLE for _, kind in comparisons):
+            continue
+        candidates.append((pm_name, comparisons))
+    return candidates
+
+def balance_pruning_counts(model, balance_data, prune_dominated):
+    """物资相同的生产方式的删减统计：(删去的生产方式数, 随之删去的比较数, 改为可用性判断的比较数, 改为利润为负判断的比较数)"""
+    skipped = removed = unavailable = negative = 0
+    for group in balance_data:
+        production_methods = group.methods_by_type["balance"]
+        candidates = balance_candidates(model, group, prune_dominated)
+        skipped += len(production_methods) - len(candidates)
+        removed += (len(production_methods) - len(candidates)) * (len(production_methods) - 1)
+        for _, comparisons in candidates:
+            unavailable += sum(kind == BALANCE_COMPARE_UNAVAILABLE for _, kind in comparisons)
+            negative += sum(kind == BALANCE_COMPARE_NEGATIVE for _, kind in comparisons)
+    return skipped, removed, unavailable, negative
+
+def balance_comparison(building_type, pmg_name, pm_name, other_pm, kind):
+    """trigger_if 中pm_name与other_pm的利润比较"""
+    profit = profit_reference(building_type, pmg_name, pm_name)
+    if kind == BALANCE_COMPARE_NEGATIVE:
+        return f"{profit} < 0"
+    return f"{profit} > {profit_reference(building_type, pmg_name, other_pm, weighted=True)}"
+
+def write_balance_by_building(outfile, model, balance_data, prune_dominated):
+    """按建筑类型生成PM平衡，返回 (选出生产方式时遍历state的次数, 按利润执行时遍历state的次数)"""
+    groups_by_building = {}
+    for group in balance_data:
+        groups_by_building.setdefault(group.building, []).append(group)
+    
+    selections = applications = 0
+    for building_type, groups in groups_by_building.items():
+        candidates = [(group, balance_candidates(model, group, prune_dominated)) for group in groups]
+        candidates = [(group, group_candidates) for group, group_candidates in candidates if group_candidates]
+        if not candidates:
+            continue
+        
+        # 每个建筑类型遍历一次state，选出各生产方式组的最优生产方式
+        PM_SELECT_BUILDING_HEAD_TEMPLATE.emit(outfile, building_type=building_type)
+        selections += 1
+        for group, _ in candidates:
+            PM_SELECT_CLEAR_TEMPLATE.emit(outfile, choice=balance_choice_variable(group.name))
+        PM_SELECT_OCCUPANCY_TEMPLATE.emit(outfile, building_type=building_type,
+                                           guard=pm_dirty_guard(building_type, 16))
+        for group, group_candidates in candidates:
+            choice = balance_choice_variable(group.name)
+            for index, (pm_name, comparisons) in enumerate(group_candidates, start=1):
+                profit = profit_reference(building_type, group.name, pm_name)
+                PM_BALANCE_CANDIDATE_HEAD_TEMPLATE.emit(outfile, building_type=building_type, pm_name=pm_name)
+                for other_pm, kind in comparisons:
+                    if kind == BALANCE_COMPARE_UNAVAILABLE:
+                        PM_BALANCE_CANDIDATE_UNAVAILABLE_TEMPLATE.emit(outfile, building_type=building_type,
+                                                                       other_pm=other_pm)
+                    else:
+                        PM_BALANCE_CANDIDATE_TRIGGER_TEMPLATE.emit(
+                            outfile, building_type=building_type, other_pm=other_pm,
+                            comparison=balance_comparison(building_type, group.name, pm_name, other_pm, kind))
+                PM_BALANCE_CANDIDATE_TAIL_TEMPLATE.emit(outfile, choice=choice, profit=profit, index=index)
+        outfile.write("        }\n")
+        outfile.write("    }\n")
+        
+        # 每个生产方式组按利润预测排序执行一次
+        for group, group_candidates in candidates:
+            choice = balance_choice_variable(group.name)
+            PM_APPLY_HEAD_TEMPLATE.emit(outfile, choice=choice, building_type=building_type)
+            applications += 1
+            for index, (pm_name, _) in enumerate(group_candidates, start=1):
+                PM_APPLY_TEMPLATE.emit(outfile, branch='if' if index == 1 else 'else_if', choice=choice,
+                                               index=index, building_type=building_type, pm_name=pm_name)
+            write_apply_tail(outfile, choice)
+    return selections, applications
+
+def write_balance_per_pm(outfile, model, balance_data, prune_dominated):
+    """为每个可能被选中的balance生产方式生成一个 ordered_scope_state 块"""
+    # 为每个生产方式组生成排序计算器
+    for group in balance_data:
+        pmg_name = group.name
+        building_type = group.building
+        
+        # 为每个生产方式生成 ordered_scope_state 块；与其他生产方式都物资相同且没有投入时，
+        # 只有在其他生产方式全部不可用（即它已经是当前生产方式）时才会执行，不需要生成
+        for pm_name, comparisons in balance_candidates(model, group, prune_dominated):
+            profit = profit_reference(building_type, pmg_name, pm_name)
             
-            print(f"PM升级计算器生成完成！输出文件：{upgrade_output_file}")
-            print(f"共为 {len(upgrade_data)} 个生产方式组生成了升级计算器")
+            # 生成 ordered_scope_state 块开头
+            PM_BALANCE_HEAD_TEMPLATE.emit(outfile, building_type=building_type, pm_name=pm_name,
+                                          guard=pm_dirty_guard(building_type, 12))
+            
+            # 为每个非当前生产方式生成 trigger_if 块
+            for other_pm, kind in comparisons:
+                if kind == BALANCE_COMPARE_UNAVAILABLE:
+                    PM_BALANCE_UNAVAILABLE_TEMPLATE.emit(outfile, building_type=building_type, other_pm=other_pm)
+                else:
+                    PM_BALANCE_TRIGGER_TEMPLATE.emit(
+                        outfile, building_type=building_type, other_pm=other_pm,
+                        comparison=balance_comparison(building_type, pmg_name, pm_name, other_pm, kind))
+            
+            # 生成 ordered_scope_state 块结尾
+            PM_BALANCE_TAIL_TEMPLATE.emit(outfile, building_type=building_type, pm_name=pm_name, profit=profit)
+
+# 直接升级到最优的更高级生产方式：当前生产方式分支、其中每个更高级生产方式的比较
+PM_UPGRADE_CURRENT_TEMPLATE = Template("""            {branch} = {{
+                limit = {{
+                    is_production_method_active = {{
+                        building_type = {building_type}
+                        production_method = {current_pm}
+                    }}
+                }}
+""")
+
+PM_UPGRADE_TARGET_TEMPLATE = Template("""                if = {{
+                    limit = {{
+                        can_activate_production_method = {{
+                            building_type = {building_type}
+                            production_method = {next_pm}
+                        }}
+                        {next_profit_weighted} > {current_profit}
+                        trigger_if = {{
+                            limit = {{
+                                has_variable = {choice}_profit
+                            }}
+                            {next_profit_weighted} > var:{choice}_profit
+                        }}
+                    }}
+                    set_variable = {{
+                        name = {choice}
+                        value = {index}
+                    }}
+                    set_variable = {{
+                        name = {choice}_profit
+                        value = {next_profit_weighted}
+                    }}
+                }}
+""")
+
+def upgrade_choice_variable(pmg_name):
+    return f"OGAS_upgrade_{pmg_name}"
+
+def write_upgrade_by_building(outfile, upgrade_data):
+    """
+    按建筑类型生成直接升级：每个state对当前生产方式之后的所有生产方式比较一次，选出利润预测（乘以容忍倍数）最高的一个，
+    再按利润排序执行；只有两级的生产方式组直接使用逐级升级的块（一次遍历即可），
+    记录脏标记时也按建筑类型选出，以便判断哪些state被 cnm_pm_manage_amount 截掉。
+    返回 (选出生产方式时遍历state的次数, 按利润执行时遍历state的次数)
+    """
+    groups_by_building = {}
+    single_step = []
+    for group in upgrade_data:
+        if len(group.methods_by_type["upgrade"]) > 2 or GENERATION_OPTIONS['dirty_tracking']:
+            groups_by_building.setdefault(group.building, []).append(group)
         else:
-            print("未找到type为upgrade的数据，跳过生成升级计算器")
-        
-    except Exception as e:
-        print(f"生成PM计算器时发生错误：{e}")
+            single_step.append(group)
+    
+    write_pm_upgrade(outfile, single_step)
+    selections = 0
+    applications = sum(len(group.methods_by_type["upgrade"]) - 1 for group in single_step)
+    for building_type, groups in groups_by_building.items():
+        PM_SELECT_BUILDING_HEAD_TEMPLATE.emit(outfile, building_type=building_type)
+        selections += 1
+        for group in groups:
+            PM_SELECT_CLEAR_TEMPLATE.emit(outfile, choice=upgrade_choice_variable(group.name))
+        PM_SELECT_OCCUPANCY_TEMPLATE.emit(outfile, building_type=building_type,
+                                          guard=pm_dirty_guard(building_type, 16))
+        for group in groups:
+            choice = upgrade_choice_variable(group.name)
+            production_methods = group.methods_by_type["upgrade"]
+            # 只执行当前生产方式所在的一个分支
+            for i, current_pm in enumerate(production_methods[:-1]):
+                PM_UPGRADE_CURRENT_TEMPLATE.emit(outfile, branch='else_if' if i else 'if',
+                                                 building_type=building_type, current_pm=current_pm)
+                current_profit = profit_reference(building_type, group.name, current_pm)
+                for j in range(i + 1, len(production_methods)):
+                    PM_UPGRADE_TARGET_TEMPLATE.emit(
+                        outfile, building_type=building_type, next_pm=production_methods[j], choice=choice,
+                        index=j + 1, current_profit=current_profit,
+                        next_profit_weighted=profit_reference(building_type, group.name, production_methods[j],
+                                                              weighted=True))
+                outfile.write("            }\n")
+        outfile.write("        }\n")
+        outfile.write("    }\n")
+        
+        for group in groups:
+            choice = upgrade_choice_variable(group.name)
+            PM_APPLY_HEAD_TEMPLATE.emit(outfile, choice=choice, building_type=building_type)
+            applications += 1
+            for j, next_pm in enumerate(group.methods_by_type["upgrade"][1:], start=2):
+                PM_APPLY_TEMPLATE.emit(outfile, branch='if' if j == 2 else 'else_if', choice=choice,
+                                       index=j, building_type=building_type, pm_name=next_pm)
+            write_apply_tail(outfile, choice)
+    return selections, applications
 
-def generate_building_control_scripts():
-    """生成建筑控制流程脚本"""
+def write_pm_upgrade(outfile, upgrade_data):
+    """为每个upgrade生产方式组生成升级块"""
+    for group in upgrade_data:
+        pmg_name = group.name
+        building_type = group.building
+        production_methods = group.methods_by_type["upgrade"]
+        
+        # 按生产方式在列表中的顺序推断层级关系（假设按顺序就是层级关系）
+        for i in range(len(production_methods) - 1):
+            current_pm = production_methods[i]
+            next_pm = production_methods[i + 1]
+            
+            # 生成升级块（从当前生产方式升级到下一级生产方式）
+            PM_UPGRADE_TEMPLATE.emit(
+                outfile, building_type=building_type, current_pm=current_pm, next_pm=next_pm,
+                guard=pm_dirty_guard(building_type, 12),
+                current_profit=profit_reference(building_type, pmg_name, current_pm),
+                next_profit_weighted=profit_reference(building_type, pmg_name, next_pm, weighted=True))
+
+def generate_pm_balance_script():
+    """生成PM排序计算器脚本"""
+    
+    balance_output_file = 'scripted_effects/AUTO_PM_balance.txt'
+    upgrade_output_file = 'scripted_effects/AUTO_PM_upgrade.txt'
+    shard_output_file = 'scripted_effects/AUTO_PM_shard.txt'
+    dirty_output_file = 'scripted_effects/AUTO_PM_dirty.txt'
+    
+    # 确保输出目录存在
+    os.makedirs(os.path.dirname(balance_output_file), exist_ok=True)
+    os.makedirs(os.path.dirname(upgrade_output_file), exist_ok=True)
     
     try:
-        # 使用统一函数读取CSV文件
-        rows = read_pm_goods_csv()
+        # 使用共用的数据模型
+        model = get_pm_model()
         
-        if len(rows) < 2:
-            print("错误：CSV文件为空或格式不正确")
+        if not model:
+            print("错误：没有可用的生产方式数据")
             return
         
-        # 提取所有唯一的建筑类型，保持出现顺序
-        building_types = []
-        seen = set()
+        # 按type分类的生产方式组
+        balance_data = model.groups_of_type("balance")  # type为balance的数据
+        upgrade_data = model.groups_of_type("upgrade")  # type为upgrade的数据
         
-        # 处理每一行数据（跳过标题行）
-        for row in rows[1:]:
-            if len(row) < 3:
-                continue
+        # 直接升级需要比较多个生产方式的利润预测，只在利润预测已预先计算时使用，否则比较次数会超过逐级升级
+        upgrade_jump = GENERATION_OPTIONS['upgrade_jump'] and bool(memoized_profit_methods(model))
+        
+        # 分片：每次PM管理只处理其中一份建筑类型
+        shards = pm_manage_shards(model)
+        balance_shards = shard_groups(shards, balance_data)
+        upgrade_shards = shard_groups(shards, upgrade_data)
+        
+        # 生成balance类型输出文件
+        if balance_data:
+            with open_output(balance_output_file) as outfile:
+                prune_dominated = GENERATION_OPTIONS['prune_dominated_pms']
+                selections = applications = 0
+                
+                # 每个生产方式一个 ordered_scope_state 块时遍历state的次数
+                per_pm_iterations = sum(len(balance_candidates(model, group, prune_dominated))
+                                        for group in balance_data)
+                
+                write_shard_dispatch(outfile, 'PM_balance', shards, balance_shards)
+                for index, groups in balance_shards.items():
+                    # 添加文件开头
+                    outfile.write(f"{pm_manage_effect_name('PM_balance', shards, index)} = {{\n")
+                    
+                    if GENERATION_OPTIONS['balance_by_building']:
+                        shard_selections, shard_applications = write_balance_by_building(
+                            outfile, model, groups, prune_dominated)
+                        selections += shard_selections
+                        applications += shard_applications
+                    else:
+                        write_balance_per_pm(outfile, model, groups, prune_dominated)
+                    
+                    # 添加文件结尾
+                    outfile.write("}\n")
             
-            building_type = row[0].strip()  # 建筑类型（第1列）
-            if building_type and building_type not in seen:
-                seen.add(building_type)
-                building_types.append(building_type)
+            print(f"PM平衡计算器生成完成！输出文件：{balance_output_file}")
+            print(f"共为 {len(balance_data)} 个生产方式组生成了平衡计算器")
+            if prune_dominated:
+                skipped, removed, unavailable, negative = balance_pruning_counts(model, balance_data, prune_dominated)
+                print(f"物资相同的生产方式：删去 {skipped} 个不会被选中的生产方式（及其 {removed} 个利润比较），"
+                      f"{unavailable} 个利润比较改为可用性判断，{negative} 个改为利润为负判断")
+            else:
+                print("物资相同的生产方式：保留完整的利润比较（--keep-dominated-pms）")
+            if GENERATION_OPTIONS['balance_by_building']:
+                # 按利润执行时只按state变量筛选，不再判断建筑、利润比较等条件
+                print(f"PM_balance每次执行遍历所有state的次数：每个生产方式一次 {per_pm_iterations} → "
+                      f"每个建筑类型一次 {selections + applications}"
+                      f"（选出生产方式 {selections} 次，按利润执行 {applications} 次）")
+            else:
+                print(f"PM_balance每次执行遍历所有state的次数：{per_pm_iterations}")
+        else:
+            print("未找到type为balance的数据，跳过生成平衡计算器")
         
-        # 生成建筑按钮脚本
-        buttons_output_file = 'scripted_buttons/AUTO_building_weight_button.txt'
-        os.makedirs(os.path.dirname(buttons_output_file), exist_ok=True)
+        # 生成upgrade类型输出文件
+        if upgrade_data:
+            upgrade_selections = upgrade_applications = 0
+            with open_output(upgrade_output_file) as outfile:
+                write_shard_dispatch(outfile, 'PM_upgrade', shards, upgrade_shards)
+                for index, groups in upgrade_shards.items():
+                    # 添加文件开头
+                    outfile.write(f"{pm_manage_effect_name('PM_upgrade', shards, index)} = {{\n")
+                    
+                    # 为每个生产方式组生成升级计算器
+                    if upgrade_jump:
+                        shard_selections, shard_applications = write_upgrade_by_building(outfile, groups)
+                        upgrade_selections += shard_selections
+                        upgrade_applications += shard_applications
+                    else:
+                        write_pm_upgrade(outfile, groups)
+                    
+                    # 添加文件结尾
+                    outfile.write("}\n")
+            
+            print(f"PM升级计算器生成完成！输出文件：{upgrade_output_file}")
+            print(f"共为 {len(upgrade_data)} 个生产方式组生成了升级计算器")
+            # 逐级升级每次执行最多升一级，落后n级的建筑需要n次PM管理
+            ladder_iterations = sum(len(group.methods_by_type["upgrade"]) - 1 for group in upgrade_data)
+            max_steps = max(len(group.methods_by_type["upgrade"]) - 1 for group in upgrade_data)
+            if upgrade_jump:
+                print(f"PM_upgrade每次执行遍历所有state的次数：逐级升级 {ladder_iterations} → 直接升级 "
+                      f"{upgrade_selections + upgrade_applications}"
+                      f"（选出生产方式 {upgrade_selections} 次，按利润执行 {upgrade_applications} 次）；"
+                      f"升到最高级最多需要的PM管理次数：{max_steps} → 1")
+            else:
+                print(f"PM_upgrade每次执行遍历所有state的次数：{ladder_iterations}，"
+                      f"升到最高级最多需要的PM管理次数：{max_steps}")
+        else:
+            print("未找到type为upgrade的数据，跳过生成升级计算器")
         
-        with open(buttons_output_file, 'w', encoding='utf-8-sig') as outfile:
-            for building_type in building_types:
-                # 生成increase按钮
-                increase_button = f"""increase_{building_type} = {{
+        # 生成脏标记快照
+        with open_output(dirty_output_file) as outfile:
+            tracked_goods, tracked_buildings, always_dirty = write_pm_dirty_script(outfile, model, shards)
+        if GENERATION_OPTIONS['dirty_tracking']:
+            print(f"PM脏标记生成完成！输出文件：{dirty_output_file}")
+            print(f"每个state记录 {tracked_goods} 种物资的价格快照，{tracked_buildings} 个建筑类型只在价格或雇佣率"
+                  f"变化超过 {GENERATION_OPTIONS['dirty_threshold']}（或超过 {GENERATION_OPTIONS['dirty_max_age']} 次未计算）时重新计算")
+            if always_dirty:
+                print(f"{always_dirty} 个建筑类型的balance/upgrade生产方式没有用到物资，每次PM管理都重新计算")
+        
+        # 生成分片轮换计数器
+        with open_output(shard_output_file) as outfile:
+            if len(shards) > 1:
+                PM_SHARD_NEXT_TEMPLATE.emit(outfile, last_shard=len(shards) - 1)
+            else:
+                # 不分片时保留空的效果供手写脚本调用
+                outfile.write("OGAS_next_pm_shard = {\n}\n")
+        
+        if len(shards) > 1:
+            loads = [sum(model.pm_manage_cost(building_type) for building_type in shard) for shard in shards]
+            print(f"PM管理分片完成！输出文件：{shard_output_file}")
+            print(f"建筑类型分为 {len(shards)} 份轮流处理，每份估计计算量：{' / '.join(map(str, loads))}"
+                  f"（不分片时每次 {sum(loads)}）")
+        return True
+        
+    except Exception as e:
+        print(f"生成PM计算器时发生错误：{e}")
+
+# 建筑权重按钮
+INCREASE_BUTTON_TEMPLATE = Template("""increase_{building_type} = {{
     name = "increase_{building_type}"
     desc = "increase_{building_type}_desc"
     effect = {{
@@ -807,9 +1721,9 @@ def generate_building_control_scripts():
         }}
     }}
 }}
-"""
-                # 生成decrease按钮
-                decrease_button = f"""decrease_{building_type} = {{
+""")
+
+DECREASE_BUTTON_TEMPLATE = Template("""decrease_{building_type} = {{
     name = "decrease_{building_type}"
     desc = "decrease_{building_type}_desc"
     effect = {{
@@ -819,38 +1733,233 @@ def generate_building_control_scripts():
         }}
     }}
 }}
-"""
-                outfile.write(increase_button)
-                outfile.write(decrease_button)
+""")
+
+# OGAS_construct_building_configure 中的 trigger_if
+CONFIGURE_TRIGGER_TEMPLATE = Template("""    trigger_if = {{
+        limit = {{ 
+            root.var:cnm_auto_construct_{building_type} <= 0
+        }}
+        not = {{
+            is_building_type = {building_type}
+        }}
+    }}
+""")
+
+# OGAS_find_best_profit_building 中的 if
+CONSTRUCT_IF_TEMPLATE = Template("""        if = {{
+            limit = {{ 
+                is_building_type = {building_type}
+            }}
+            state = {{
+                start_building_construction = {building_type}
+            }}
+        }}
+""")
+
+# 建筑权重管理初始化名单
+WEIGHT_SET_VARIABLE_TEMPLATE = Template("""    set_variable = {{
+        name = cnm_auto_construct_{building_type}
+        value = 1
+    }}
+""")
+
+# 建筑权重计算器中的 if
+PROFIT_WEIGHT_IF_TEMPLATE = Template("""    if = {{
+        limit = {{
+            is_building_type = {building_type}
+        }}
+        value = owner.var:cnm_auto_construct_{building_type}
+    }}
+""")
+
+# 建筑类型编号：OGAS_index_building_types为每个建筑保存一次类型编号（0为不由OGAS管理的建筑），
+# 之后按建筑类型分派的脚本都按编号二分查找
+BUILDING_TYPE_INDEX_VARIABLE = 'cnm_building_type_index'
+
+# 编号守卫：建筑已编号且由OGAS管理
+BUILDING_TYPE_GUARD = f"has_variable = {BUILDING_TYPE_INDEX_VARIABLE}\n{{pad}}var:{BUILDING_TYPE_INDEX_VARIABLE} > 0\n"
+
+def building_type_indices(model):
+    """建筑类型 -> 编号（从1开始，按出现顺序）"""
+    return {building_type: index for index, building_type in enumerate(model.building_types, start=1)}
+
+def building_type_index_version(model):
+    """建筑类型列表的版本号，列表变化后存档中已保存的编号会全部重新计算"""
+    return int(hashlib.sha1('\n'.join(model.building_types).encode('utf-8')).hexdigest(), 16) % 1000000
+
+def write_building_type_guard(outfile, indent):
+    pad = ' ' * indent
+    outfile.write(f"{pad}limit = {{\n")
+    outfile.write(f"{pad}    " + BUILDING_TYPE_GUARD.format(pad=pad + '    '))
+    outfile.write(f"{pad}}}\n")
+
+def write_building_type_dispatch(outfile, leaves, indent, write_leaf, trigger=False):
+    """
+    按建筑类型编号写出平衡的二分分支树
+    leaves为按编号排列的 (编号, 内容)，每个叶子由write_leaf(outfile, 内容, 缩进)写出；
+    返回每个叶子需要判断的条件数
+    """
+    if len(leaves) == 1:
+        write_leaf(outfile, leaves[0][1], indent)
+        return [0]
+    
+    middle = len(leaves) // 2
+    pad = ' ' * indent
+    branch, other_branch = ('trigger_if', 'trigger_else') if trigger else ('if', 'else')
+    outfile.write(f"{pad}{branch} = {{\n")
+    outfile.write(f"{pad}    limit = {{\n")
+    outfile.write(f"{pad}        var:{BUILDING_TYPE_INDEX_VARIABLE} < {leaves[middle][0]}\n")
+    outfile.write(f"{pad}    }}\n")
+    depths = write_building_type_dispatch(outfile, leaves[:middle], indent + 4, write_leaf, trigger)
+    outfile.write(f"{pad}}}\n")
+    outfile.write(f"{pad}{other_branch} = {{\n")
+    depths += write_building_type_dispatch(outfile, leaves[middle:], indent + 4, write_leaf, trigger)
+    outfile.write(f"{pad}}}\n")
+    return [depth + 1 for depth in depths]
+
+def print_dispatch_branches(name, before, depths):
+    """打印每次查找平均判断的条件数（由OGAS管理的建筑，编号守卫计为1）"""
+    after = 1 + sum(depths) / len(depths) if depths else 1
+    print(f"{name}：每次查找判断的条件 {before:.1f} → {after:.1f}")
+
+# 为每个建筑保存类型编号：开头（建筑类型列表变化时清除旧编号）、每个建筑类型的分支
+BUILDING_TYPE_INDEX_HEAD_TEMPLATE = Template("""OGAS_index_building_types = {{
+    if = {{
+        limit = {{
+            not = {{
+                var:{variable}_version = {version}
+            }}
+        }}
+        every_scope_building = {{
+            remove_variable = {variable}
+        }}
+        set_variable = {{
+            name = {variable}_version
+            value = {version}
+        }}
+    }}
+    every_scope_building = {{
+        limit = {{
+            not = {{
+                has_variable = {variable}
+            }}
+        }}
+        set_variable = {{
+            name = {variable}
+            value = 0
+        }}
+""")
+
+BUILDING_TYPE_INDEX_IF_TEMPLATE = Template("""        {branch} = {{
+            limit = {{
+                is_building_type = {building_type}
+            }}
+            set_variable = {{
+                name = {variable}
+                value = {index}
+            }}
+        }}
+""")
+
+def write_configure_leaf(outfile, building_type, indent):
+    pad = ' ' * indent
+    outfile.write(f"{pad}not = {{\n")
+    outfile.write(f"{pad}    root.var:cnm_auto_construct_{building_type} <= 0\n")
+    outfile.write(f"{pad}}}\n")
+
+def write_construct_leaf(outfile, building_type, indent):
+    pad = ' ' * indent
+    outfile.write(f"{pad}state = {{\n")
+    outfile.write(f"{pad}    start_building_construction = {building_type}\n")
+    outfile.write(f"{pad}}}\n")
+
+def write_profit_weight_leaf(outfile, building_type, indent):
+    outfile.write(f"{' ' * indent}value = owner.var:cnm_auto_construct_{building_type}\n")
+
+def write_construction_cost_leaf(outfile, construction_cost, indent):
+    outfile.write(f"{' ' * indent}value = {construction_cost or 0}\n")
+
+def generate_building_control_scripts():
+    """生成建筑控制流程脚本"""
+    
+    try:
+        # 使用共用的数据模型
+        model = get_pm_model()
+        
+        if not model:
+            print("错误：没有可用的生产方式数据")
+            return
+        
+        # 所有唯一的建筑类型，保持出现顺序
+        building_types = list(model.building_types)
+        
+        # 生成建筑按钮脚本
+        buttons_output_file = 'scripted_buttons/AUTO_building_weight_button.txt'
+        os.makedirs(os.path.dirname(buttons_output_file), exist_ok=True)
+        
+        with open_output(buttons_output_file) as outfile:
+            for building_type in building_types:
+                # 生成increase按钮
+                INCREASE_BUTTON_TEMPLATE.emit(outfile, building_type=building_type)
+                # 生成decrease按钮
+                DECREASE_BUTTON_TEMPLATE.emit(outfile, building_type=building_type)
         
         print(f"建筑按钮脚本生成完成！输出文件：{buttons_output_file}")
         
+        dispatch = GENERATION_OPTIONS['building_type_dispatch']
+        indices = building_type_indices(model)
+        
+        # 生成建筑类型编号脚本效果
+        index_output_file = 'scripted_effects/AUTO_building_type_index.txt'
+        os.makedirs(os.path.dirname(index_output_file), exist_ok=True)
+        
+        with open_output(index_output_file) as outfile:
+            if dispatch:
+                BUILDING_TYPE_INDEX_HEAD_TEMPLATE.emit(outfile, variable=BUILDING_TYPE_INDEX_VARIABLE,
+                                                      version=building_type_index_version(model))
+                for building_type, index in indices.items():
+                    BUILDING_TYPE_INDEX_IF_TEMPLATE.emit(outfile, branch='if' if index == 1 else 'else_if',
+                                                         building_type=building_type,
+                                                         variable=BUILDING_TYPE_INDEX_VARIABLE, index=index)
+                outfile.write("    }\n")
+                outfile.write("}\n")
+            else:
+                # 按建筑类型逐个判断时不需要编号，保留空的效果供手写脚本调用
+                outfile.write("OGAS_index_building_types = {\n}\n")
+        
+        print(f"建筑类型编号脚本效果生成完成！输出文件：{index_output_file}")
+        
+        leaves = [(index, building_type) for building_type, index in indices.items()]
+        
         # 生成脚本触发器
         triggers_output_file = 'scripted_triggers/AUTO_OGAS_scripted_triggers.txt'
         os.makedirs(os.path.dirname(triggers_output_file), exist_ok=True)
         
-        with open(triggers_output_file, 'w', encoding='utf-8-sig') as outfile:
+        with open_output(triggers_output_file) as outfile:
             # 生成OGAS_construct_building_configure
             outfile.write("OGAS_construct_building_configure = {\n")
-            for building_type in building_types:
-                trigger_if = f"""    trigger_if = {{
-        limit = {{ 
-            root.var:cnm_auto_construct_{building_type} <= 0
-        }}
-        not = {{
-            is_building_type = {building_type}
-        }}
-    }}
-"""
-                outfile.write(trigger_if)
+            if dispatch:
+                outfile.write("    trigger_if = {\n")
+                write_building_type_guard(outfile, 8)
+                depths = write_building_type_dispatch(outfile, leaves, 8, write_configure_leaf, trigger=True)
+                outfile.write("    }\n")
+                print_dispatch_branches("OGAS_construct_building_configure", len(building_types), depths)
+            else:
+                for building_type in building_types:
+                    CONFIGURE_TRIGGER_TEMPLATE.emit(outfile, building_type=building_type)
             outfile.write("}\n\n")
             
             # 生成OGAS_possible_building
             outfile.write("OGAS_possible_building = {\n")
-            outfile.write("    or = {\n")
-            for building_type in building_types:
-                outfile.write(f"        is_building_type = {building_type}\n")
-            outfile.write("    }\n")
+            if dispatch:
+                outfile.write("    " + BUILDING_TYPE_GUARD.format(pad='    '))
+                print_dispatch_branches("OGAS_possible_building", (len(building_types) + 1) / 2, [])
+            else:
+                outfile.write("    or = {\n")
+                for building_type in building_types:
+                    outfile.write(f"        is_building_type = {building_type}\n")
+                outfile.write("    }\n")
             outfile.write("}\n")
         
         print(f"脚本触发器生成完成！输出文件：{triggers_output_file}")
@@ -859,22 +1968,20 @@ def generate_building_control_scripts():
         effects_output_file = 'scripted_effects/AUTO_OGAS_construct.txt'
         os.makedirs(os.path.dirname(effects_output_file), exist_ok=True)
         
-        with open(effects_output_file, 'w', encoding='utf-8-sig') as outfile:
+        with open_output(effects_output_file) as outfile:
             outfile.write("OGAS_find_best_profit_building = {\n")
             outfile.write("    while = {\n")
             outfile.write("        count = root.var:OGAS_building_unit_config\n")
             
-            for building_type in building_types:
-                if_block = f"""        if = {{
-            limit = {{ 
-                is_building_type = {building_type}
-            }}
-            state = {{
-                start_building_construction = {building_type}
-            }}
-        }}
-"""
-                outfile.write(if_block)
+            if dispatch:
+                outfile.write("        if = {\n")
+                write_building_type_guard(outfile, 12)
+                depths = write_building_type_dispatch(outfile, leaves, 12, write_construct_leaf)
+                outfile.write("        }\n")
+                print_dispatch_branches("OGAS_find_best_profit_building", len(building_types), depths)
+            else:
+                for building_type in building_types:
+                    CONSTRUCT_IF_TEMPLATE.emit(outfile, building_type=building_type)
             
             outfile.write("    }\n")
             outfile.write("}\n")
@@ -885,18 +1992,13 @@ def generate_building_control_scripts():
         weight_manager_output_file = 'scripted_effects/AUTO_building_weight_manager.txt'
         os.makedirs(os.path.dirname(weight_manager_output_file), exist_ok=True)
         
-        with open(weight_manager_output_file, 'w', encoding='utf-8-sig') as outfile:
+        with open_output(weight_manager_output_file) as outfile:
             # 添加文件开头
             outfile.write("OGAS_default_building_weight_manager = {\n")
             
             # 为每个建筑类型生成set_variable块
             for building_type in building_types:
-                set_variable_block = f"""    set_variable = {{
-        name = cnm_auto_construct_{building_type}
-        value = 1
-    }}
-"""
-                outfile.write(set_variable_block)
+                WEIGHT_SET_VARIABLE_TEMPLATE.emit(outfile, building_type=building_type)
             
             # 添加文件结尾
             outfile.write("}\n")
@@ -907,32 +2009,33 @@ def generate_building_control_scripts():
         profit_weight_output_file = 'script_values/AUTO_get_building_profit_weight.txt'
         os.makedirs(os.path.dirname(profit_weight_output_file), exist_ok=True)
         
-        with open(profit_weight_output_file, 'w', encoding='utf-8-sig') as outfile:
+        with open_output(profit_weight_output_file) as outfile:
             # 添加文件开头
             outfile.write("get_building_profit_weight = {\n")
             
-            # 为每个建筑类型生成if块
-            for building_type in building_types:
-                if_block = f"""    if = {{
-        limit = {{
-            is_building_type = {building_type}
-        }}
-        value = owner.var:cnm_auto_construct_{building_type}
-    }}
-"""
-                outfile.write(if_block)
+            if dispatch:
+                outfile.write("    if = {\n")
+                write_building_type_guard(outfile, 8)
+                depths = write_building_type_dispatch(outfile, leaves, 8, write_profit_weight_leaf)
+                outfile.write("    }\n")
+                print_dispatch_branches("get_building_profit_weight", len(building_types), depths)
+            else:
+                # 为每个建筑类型生成if块
+                for building_type in building_types:
+                    PROFIT_WEIGHT_IF_TEMPLATE.emit(outfile, building_type=building_type)
             
             # 添加文件结尾
             outfile.write("}\n")
         
         print(f"建筑权重计算器生成完成！输出文件：{profit_weight_output_file}")
         print(f"共为 {len(building_types)} 个建筑类型生成了控制流程、初始化名单和权重计算器")
+        return True
         
     except Exception as e:
         print(f"生成建筑控制流程时发生错误：{e}")
 
 def generate_building_construction_cost_script():
-    """生成建筑construction_cost脚本，基于pm_goods.csv中的required_construction数据"""
+    """生成建筑construction_cost脚本，基于生产方式记录中的required_construction数据"""
     
     output_file = 'script_values/AUTO_database_building_construction_cost.txt'
     
@@ -940,49 +2043,46 @@ def generate_building_construction_cost_script():
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
     
     try:
-        # 使用统一函数读取CSV文件
-        rows = read_pm_goods_csv()
+        # 使用共用的数据模型
+        model = get_pm_model()
         
-        if len(rows) < 2:
-            print("错误：CSV文件为空或格式不正确")
+        if not model:
+            print("错误：没有可用的生产方式数据")
             return
         
-        # 构建数据结构：每个建筑对应的construction_cost类型
-        building_construction_costs = {}
-        
-        # 处理每一行数据（跳过标题行）
-        for row in rows[1:]:
-            if len(row) < 5:
-                continue
-            
-            building_name = row[0].strip()  # 建筑名称（第1列）
-            construction_cost = row[4].strip()  # construction_cost类型（第5列）
-            
-            # 只处理有construction_cost数据的行
-            if construction_cost and construction_cost != '':
-                # 如果建筑还没有记录，或者需要更新construction_cost（取第一个非空值）
-                if building_name not in building_construction_costs:
-                    building_construction_costs[building_name] = construction_cost
+        # 每个建筑对应的construction_cost类型（取第一个非空值）
+        building_construction_costs = model.building_construction_costs
         
         # 生成construction_cost脚本
-        with open(output_file, 'w', encoding='utf-8-sig') as outfile:
+        with open_output(output_file) as outfile:
             # 添加文件开头
             outfile.write("building_construction_cost = {\n")
             
-            # 为每个建筑生成IF块
-            for building_name, construction_cost in sorted(building_construction_costs.items()):
+            if GENERATION_OPTIONS['building_type_dispatch']:
+                # 按建筑类型编号查找，没有construction_cost的建筑为0（与没有匹配的if时相同）
+                leaves = [(index, building_construction_costs.get(building_type))
+                          for building_type, index in building_type_indices(model).items()]
                 outfile.write("    if = {\n")
-                outfile.write("        limit = {\n")
-                outfile.write(f"            is_building_type = {building_name}\n")
-                outfile.write("        }\n")
-                outfile.write(f"        value = {construction_cost}\n")
+                write_building_type_guard(outfile, 8)
+                depths = write_building_type_dispatch(outfile, leaves, 8, write_construction_cost_leaf)
                 outfile.write("    }\n")
+                print_dispatch_branches("building_construction_cost", len(building_construction_costs), depths)
+            else:
+                # 为每个建筑生成IF块
+                for building_name, construction_cost in sorted(building_construction_costs.items()):
+                    outfile.write("    if = {\n")
+                    outfile.write("        limit = {\n")
+                    outfile.write(f"            is_building_type = {building_name}\n")
+                    outfile.write("        }\n")
+                    outfile.write(f"        value = {construction_cost}\n")
+                    outfile.write("    }\n")
             
             # 添加文件结尾
             outfile.write("}\n")
         
         print(f"建筑construction_cost脚本生成完成！输出文件：{output_file}")
         print(f"共处理了 {len(building_construction_costs)} 个建筑的construction_cost信息")
+        return True
         
     except Exception as e:
         print(f"生成建筑construction_cost脚本时发生错误：{e}")
@@ -996,29 +2096,18 @@ def generate_journal_entry_buttons():
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
     
     try:
-        # 使用统一函数读取CSV文件
-        rows = read_pm_goods_csv()
+        # 使用共用的数据模型
+        model = get_pm_model()
         
-        if len(rows) < 2:
-            print("错误：CSV文件为空或格式不正确")
+        if not model:
+            print("错误：没有可用的生产方式数据")
             return
         
-        # 提取所有唯一的建筑类型，保持出现顺序
-        building_types = []
-        seen = set()
-        
-        # 处理每一行数据（跳过标题行）
-        for row in rows[1:]:
-            if len(row) < 3:
-                continue
-            
-            building_type = row[0].strip()  # 建筑类型（第1列）
-            if building_type and building_type not in seen:
-                seen.add(building_type)
-                building_types.append(building_type)
+        # 所有唯一的建筑类型，保持出现顺序
+        building_types = list(model.building_types)
         
         # 生成journal entry文件
-        with open(output_file, 'w', encoding='utf-8-sig') as outfile:
+        with open_output(output_file) as outfile:
             # 添加文件开头
             outfile.write("je_OGAS_building_weight_manager = {\n")
             outfile.write("    icon = \"gfx/interface/icons/event_icons/event_industry.dds\"\n")
@@ -1037,31 +2126,247 @@ def generate_journal_entry_buttons():
         
         print(f"journal entry按钮脚本生成完成！输出文件：{output_file}")
         print(f"共为 {len(building_types)} 个建筑类型生成了按钮配置")
+        return True
         
     except Exception as e:
         print(f"生成journal entry按钮脚本时发生错误：{e}")
 
+# 生成阶段：(阶段名称, 生成函数, 依赖的输入数据)，依赖名称见PMModel.dependency
+GENERATION_STAGES = (
+    ("database_pm_goods", convert_pm_goods_to_script_values, ("goods", "pm_goods")),
+    ("base_goods_price", generate_base_goods_price_script, ("goods_costs",)),
+    ("price_prediction", generate_price_prediction_script, ("goods",)),
+    ("goods_origin", generate_goods_origin_script, ("goods", "pm_goods", "pm_types")),
+    ("active_pm_cache", generate_active_pm_cache_script, ("goods", "pm_goods", "pm_types", "building_groups")),
+    ("building_profit_prediction", generate_building_profit_prediction_script, ("goods", "methods", "pm_types")),
+    ("pm_balance", generate_pm_balance_script, ("pm_types", "methods", "building_groups")),
+    ("building_control", generate_building_control_scripts, ("building_types",)),
+    ("building_construction_cost", generate_building_construction_cost_script,
+     ("construction_costs", "building_types")),
+    ("journal_entry", generate_journal_entry_buttons, ("building_types",)),
+)
+
+# 生成程序的源代码，修改后所有阶段都会重新生成
+SOURCE_FILES = ('main.py', 'pm_model.py', 'pm_records.py', 'incremental.py', 'script_emitter.py', 'script_graph.py')
+
+# mod中手写脚本的默认位置（相对于本工具目录），删除无用定义时其中引用的名字都会保留
+DEFAULT_MOD_COMMON_DIR = os.path.join('..', 'common')
+
+# --profile未指定文件时的性能报告文件
+DEFAULT_PROFILE_FILE = 'profile_report.json'
+
+def prune_generated_scripts(pending, external_references):
+    """删除本次生成的script_values中从入口和手写脚本都无法到达的定义，并输出节省的行数和字节数"""
+    results = prune_unreachable(pending, external_references)
+    
+    total_definitions = total_lines = total_bytes = 0
+    for output_path, result in results.items():
+        if result.definitions:
+            print(f"{output_path}：删除 {result.definitions} 个定义，{result.lines} 行，{result.bytes} 字节")
+        total_definitions += result.definitions
+        total_lines += result.lines
+        total_bytes += result.bytes
+    
+    remaining_bytes = sum(os.path.getsize(temp_path) for temp_path, output_path in pending if output_path in results)
+    original_bytes = remaining_bytes + total_bytes
+    print(f"删除无用定义：共删除 {total_definitions} 个定义，{total_lines} 行，{total_bytes} 字节"
+          f"（script_values减少 {total_bytes / original_bytes:.1%}）" if original_bytes else
+          "删除无用定义：没有生成script_values")
+
+def run_generation_stages(force=False, prune_references=None):
+    """
+    依次执行各生成阶段
+    依赖的输入数据和输出文件都没有变化的阶段直接跳过；执行的阶段只改写内容变化的文件
+    prune_references为手写脚本引用的名字时，所有阶段写完后先删除script_values中不可达的定义再统一写入
+    """
+    source_dir = os.path.dirname(os.path.abspath(__file__))
+    manifest = BuildManifest(MANIFEST_FILE, source_digest(os.path.join(source_dir, f) for f in SOURCE_FILES))
+    model = get_pm_model()
+    prune = prune_references is not None
+    prune_digest = digest([ENTRY_POINTS, sorted(prune_references)]) if prune else 'off'
+    options_digest = digest(GENERATION_OPTIONS)
+    dependency_digests = {}
+    skipped = 0
+    
+    stage_inputs = []
+    for stage, generate, dependencies in GENERATION_STAGES:
+        inputs = {}
+        for name in dependencies:
+            if name not in dependency_digests:
+                dependency_digests[name] = digest(model.dependency(name))
+            inputs[name] = dependency_digests[name]
+        inputs['prune'] = prune_digest
+        inputs['options'] = options_digest
+        stage_inputs.append(inputs)
+    
+    if not force:
+        stage_reasons = [manifest.changed_inputs(stage, inputs)
+                         for (stage, _, _), inputs in zip(GENERATION_STAGES, stage_inputs)]
+        # 可达性取决于所有生成文件，删除无用定义时任一阶段需要重新生成就全部重新生成
+        if prune and any(stage_reasons):
+            stage_reasons = [reasons or ['删除无用定义需要全部生成文件'] for reasons in stage_reasons]
+    
+    stage_outputs = {}
+    with deferred_commit() if prune else nullcontext() as pending:
+        for index, (stage, generate, _) in enumerate(GENERATION_STAGES):
+            if index:
+                print("=" * 50)
+            
+            if not force:
+                reasons = stage_reasons[index]
+                if not reasons:
+                    print(f"{stage}：输入未变化，跳过")
+                    skipped += 1
+                    if _profiler is not None:
+                        _profiler.skip(stage)
+                    continue
+                print(f"{stage}：需要重新生成（{', '.join(reasons)}）")
+            
+            del committed_outputs[:]
+            first_pending = len(pending) if prune else 0
+            with _profiler.stage(stage) if _profiler is not None else nullcontext() as record:
+                generated = generate()
+            if record is not None:
+                # 删除无用定义前的临时文件即本阶段生成的内容
+                _profiler.count_output_files(
+                    record, [temp_path for temp_path, _ in pending[first_pending:]] if prune else committed_outputs)
+            if generated:
+                stage_outputs[stage] = [path for _, path in pending[first_pending:]] if prune else committed_outputs[:]
+            else:
+                stage_outputs[stage] = None
+        
+        if pending:
+            print("=" * 50)
+            with _profiler.stage('prune') if _profiler is not None else nullcontext():
+                prune_generated_scripts(pending, prune_references)
+    
+    # 输出文件全部提交后再记录其状态
+    for (stage, _, _), inputs in zip(GENERATION_STAGES, stage_inputs):
+        if stage not in stage_outputs:
+            continue
+        if stage_outputs[stage] is None:
+            manifest.forget_stage(stage)
+        else:
+            manifest.record_stage(stage, inputs, stage_outputs[stage])
+    
+    manifest.save()
+    print("=" * 50)
+    print(f"增量生成：跳过 {skipped} 个阶段，改写 {write_stats['written']} 个文件，"
+          f"{write_stats['unchanged']} 个文件内容未变化")
+
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="Victoria 3 PM Goods to Script Values Converter")
+    parser.add_argument('--csv', default='pm_goods.csv',
+                        help="生产方式表格，默认pm_goods.csv；pm_goods_full.csv为mod中已生成数据对应的完整表格")
+    parser.add_argument('--from-analyzer', nargs='?', const=DEFAULT_ANALYZER_DIR, metavar='DIR',
+                        help=f"直接在内存中运行Victoria3 building PM分析程序取得数据，不再读取CSV（默认目录 {DEFAULT_ANALYZER_DIR}）")
+    parser.add_argument('--selection', default='pm_goods.csv',
+                        help="配合--from-analyzer使用：按整理好的表格筛选建筑和生产方式组，并沿用其中的顺序和type，默认pm_goods.csv")
+    parser.add_argument('--no-selection', action='store_true',
+                        help="配合--from-analyzer使用：不做筛选，使用分析程序的全部结果")
+    parser.add_argument('--jobs', '-j', type=int, default=1, help="分析程序并行解析文件的进程数")
+    parser.add_argument('--no-cache', action='store_true', help="分析程序不使用解析缓存")
+    parser.add_argument('--export-csv', metavar='FILE', help="把本次使用的生产方式数据导出为CSV（可选）")
+    parser.add_argument('--force', action='store_true', help="忽略增量生成清单，重新执行所有生成阶段")
+    parser.add_argument('--prune', action='store_true',
+                        help=f"删除script_values中从{'、'.join(ENTRY_POINTS)}和手写脚本都无法到达的定义")
+    parser.add_argument('--mod-common', default=DEFAULT_MOD_COMMON_DIR, metavar='DIR',
+                        help=f"配合--prune使用：mod的common目录，其中手写脚本引用的定义都会保留，默认 {DEFAULT_MOD_COMMON_DIR}")
+    parser.add_argument('--keep-dominated-pms', action='store_true',
+                        help="PM平衡中保留物资相同且没有投入的生产方式的完整比较（默认跳过或简化）")
+    parser.add_argument('--no-pm-cache', action='store_true',
+                        help="不缓存建筑的当前生产方式，{pmg}_{goods}_current每次都逐个判断生产方式")
+    parser.add_argument('--no-profit-memo', action='store_true',
+                        help="PM平衡/升级中每次比较都重新计算利润预测，不预先保存到建筑变量")
+    parser.add_argument('--no-hoist-baselines', action='store_true',
+                        help="利润预测中每个生产方式都重新计算 *_if_no_<pmg> 基准值，不在预先计算时按生产方式组共用")
+    parser.add_argument('--inline-price-formula', action='store_true',
+                        help="物资价格预测中state和market各自展开完整的供需公式，不使用共用的价格系数计算器")
+    parser.add_argument('--linear-building-dispatch', action='store_true',
+                        help="按建筑类型分派的脚本逐个判断is_building_type，不使用建筑类型编号")
+    parser.add_argument('--balance-per-pm', action='store_true',
+                        help="PM平衡为每个生产方式生成一个ordered_scope_state块，不按建筑类型合并遍历")
+    parser.add_argument('--pm-shards', type=int, default=1, metavar='N',
+                        help="PM管理的建筑类型按估计计算量分为N份，每次PM管理轮流处理其中一份（默认1，不分片）")
+    parser.add_argument('--no-dirty-tracking', action='store_true',
+                        help="每次PM管理都重新计算所有建筑，不记录物资价格和雇佣率快照")
+    parser.add_argument('--dirty-threshold', type=float, default=GENERATION_OPTIONS['dirty_threshold'],
+                        help="物资价格（state_goods_pricier）或雇佣率变化超过该值时重新计算建筑（默认0.05）")
+    parser.add_argument('--dirty-max-age', type=int, default=GENERATION_OPTIONS['dirty_max_age'], metavar='N',
+                        help="超过N次PM管理未重新计算的建筑强制重新计算（默认12）")
+    parser.add_argument('--upgrade-ladder', action='store_true',
+                        help="PM升级每次只从当前生产方式升到下一级，不直接升级到最优的更高级生产方式")
+    parser.add_argument('--profile', nargs='?', const=DEFAULT_PROFILE_FILE, metavar='FILE',
+                        help=f"记录各生成阶段的耗时和读写统计并保存为JSON报告（默认 {DEFAULT_PROFILE_FILE}）")
+    parser.add_argument('--cprofile', metavar='FILE',
+                        help="同时用cProfile记录函数级开销并保存到指定文件（会开启--profile）")
+    args = parser.parse_args()
+    
+    global _profiler, _pm_goods_csv
+    _pm_goods_csv = args.csv
+    if args.profile or args.cprofile:
+        _profiler = stage_profiler.StageProfiler('OGAS script generator', cprofile=bool(args.cprofile))
+    
+    GENERATION_OPTIONS['prune_dominated_pms'] = not args.keep_dominated_pms
+    GENERATION_OPTIONS['cache_active_pm'] = not args.no_pm_cache
+    GENERATION_OPTIONS['memoize_profit_prediction'] = not args.no_profit_memo
+    GENERATION_OPTIONS['hoist_pmg_baselines'] = not args.no_hoist_baselines
+    GENERATION_OPTIONS['shared_price_formula'] = not args.inline_price_formula
+    GENERATION_OPTIONS['building_type_dispatch'] = not args.linear_building_dispatch
+    GENERATION_OPTIONS['balance_by_building'] = not args.balance_per_pm
+    GENERATION_OPTIONS['pm_manage_shards'] = args.pm_shards
+    GENERATION_OPTIONS['upgrade_jump'] = not args.upgrade_ladder
+    GENERATION_OPTIONS['dirty_tracking'] = not args.no_dirty_tracking
+    GENERATION_OPTIONS['dirty_threshold'] = args.dirty_threshold
+    GENERATION_OPTIONS['dirty_max_age'] = args.dirty_max_age
+    if GENERATION_OPTIONS['dirty_tracking'] and (args.balance_per_pm or args.upgrade_ladder or args.no_profit_memo):
+        # 脏标记依靠按建筑类型选出生产方式时保存的state变量判断哪些state被 cnm_pm_manage_amount 截掉
+        GENERATION_OPTIONS['dirty_tracking'] = False
+        print("提示：--balance-per-pm、--upgrade-ladder或--no-profit-memo时不记录脏标记，每次PM管理重新计算所有建筑")
+    
     print("Victoria 3 PM Goods to Script Values Converter")
     print("=" * 50)
-    convert_pm_goods_to_script_values()
-    print("=" * 50)
-    generate_base_goods_price_script()
-    print("=" * 50)
-    generate_price_prediction_script()
-    print("=" * 50)
-    generate_goods_origin_script()
-    print("=" * 50)
-    generate_building_profit_prediction_script()
-    print("=" * 50)
-    generate_pm_balance_script()
-    print("=" * 50)
-    generate_building_control_scripts()
-    print("=" * 50)
-    generate_building_construction_cost_script()
-    print("=" * 50)
-    generate_journal_entry_buttons()
+    
+    if args.from_analyzer:
+        try:
+            records = records_from_analyzer(args.from_analyzer, jobs=args.jobs, use_cache=not args.no_cache,
+                                            profiler=_profiler)
+        except Exception as e:
+            print(f"运行分析程序时发生错误：{e}")
+            return
+        if not args.no_selection:
+            if os.path.exists(args.selection):
+                records = apply_selection(records, read_pm_goods_csv(args.selection))
+            else:
+                print(f"警告：找不到筛选表格 {args.selection}，使用分析程序的全部结果")
+        use_pm_records(records)
+        print(f"从分析程序取得了 {len(records)} 条生产方式记录")
+        print("=" * 50)
+    
+    if args.export_csv:
+        try:
+            write_pm_records_csv(load_pm_records(), get_pm_model().goods, args.export_csv)
+            print(f"生产方式数据已导出到 {args.export_csv}")
+        except Exception as e:
+            print(f"导出CSV时发生错误：{e}")
+        print("=" * 50)
+    
+    prune_references = None
+    if args.prune:
+        # 没有手写脚本的引用时无法判断哪些定义仍被使用，不删除任何定义
+        if os.path.isdir(args.mod_common):
+            try:
+                prune_references = collect_handwritten_references(args.mod_common)
+            except Exception as e:
+                print(f"读取手写脚本时发生错误，不删除无用定义：{e}")
+        else:
+            print(f"警告：找不到mod的common目录 {args.mod_common}，不删除无用定义")
+    
+    run_generation_stages(force=args.force, prune_references=prune_references)
+    
+    if _profiler is not None:
+        _profiler.finish(args.profile or DEFAULT_PROFILE_FILE, args.cprofile)
 
 if __name__ == "__main__":
     main()
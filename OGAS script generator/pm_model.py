@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生产方式数据模型
+由生产方式记录和goods文件一次性建立 建筑 → 生产方式组 → 生产方式 → 物资向量 的索引，
+所有生成函数共用同一个模型，不再各自重复整理数据，成员判断都使用字典/集合
+"""
+
+import re
+from typing import Dict, Iterable, List, Tuple, Union
+
+from pm_records import PMRecord
+
+Number = Union[int, float]
+
+# goods文件中的物资定义：物资名称 = {
+GOODS_NAME_PATTERN = re.compile(r'^(\w+)\s*=\s*\{', re.MULTILINE)
+# 物资定义中的价格：物资名称 = { ... cost = 价格 ... }
+GOODS_COST_PATTERN = re.compile(r'^(\w+)\s*=\s*\{[^}]*?cost\s*=\s*(\d+)', re.MULTILINE | re.DOTALL)
+
+
+def parse_goods_file(content: str) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """从goods文件内容中提取物资名称列表和 (物资名称, 基础价格) 列表"""
+    goods = [name for name in GOODS_NAME_PATTERN.findall(content) if name and not name.startswith('#')]
+    return goods, GOODS_COST_PATTERN.findall(content)
+
+
+class ProductionMethodGroup:
+    """一个生产方式组：所属建筑、按出现顺序排列的生产方式以及每个生产方式的物资向量"""
+    __slots__ = ('name', 'building', 'production_methods', 'goods', 'methods_by_type', '_typed_members')
+
+    def __init__(self, name: str, building: str):
+        self.name = name
+        self.building = building  # 第一次出现时的建筑
+        self.production_methods: List[str] = []  # 按出现顺序，不重复
+        self.goods: Dict[str, Dict[str, Number]] = {}  # 生产方式 -> 物资向量（按goods文件顺序，只含非零物资）
+        self.methods_by_type: Dict[str, List[str]] = {}  # type -> 该type下的生产方式（按出现顺序，不重复）
+        self._typed_members: Dict[str, set] = {}
+
+    def add(self, pm: str, pm_type: str, goods: Dict[str, Number]):
+        if pm not in self.goods:
+            self.production_methods.append(pm)
+        # 同一生产方式重复出现时以后出现的数据为准
+        self.goods[pm] = goods
+
+        members = self._typed_members.setdefault(pm_type, set())
+        if pm not in members:
+            members.add(pm)
+            self.methods_by_type.setdefault(pm_type, []).append(pm)
+
+    def used_goods(self, goods_order: List[str]) -> List[str]:
+        """该组实际使用的物资（任一生产方式有非零值），按goods文件顺序"""
+        used = set()
+        for pm_goods in self.goods.values():
+            used.update(pm_goods)
+        return [goods_name for goods_name in goods_order if goods_name in used]
+
+    def goods_by_first_use(self) -> List[str]:
+        """该组使用的物资，按生产方式的先后顺序第一次出现的位置排列"""
+        ordered = {}
+        for pm in self.production_methods:
+            for goods_name in self.goods[pm]:
+                ordered.setdefault(goods_name, None)
+        return list(ordered)
+
+
+class PMModel:
+    """所有生成函数共用的生产方式数据索引"""
+
+    def __init__(self, goods: List[str], goods_costs: List[Tuple[str, str]] = ()):
+        self.goods = goods  # 物资名称，顺序与goods文件一致
+        self.goods_index = {name: i for i, name in enumerate(goods)}
+        self.goods_costs = list(goods_costs)  # (物资名称, 基础价格)
+        self.groups: Dict[str, ProductionMethodGroup] = {}  # 生产方式组名称 -> 生产方式组，按出现顺序
+        self.methods: Dict[Tuple[str, str], Dict[str, Number]] = {}  # (生产方式组, 生产方式) -> 物资向量，按出现顺序
+        self.building_types: Dict[str, None] = {}  # 按出现顺序的建筑类型（作为有序集合使用）
+        self.building_construction_costs: Dict[str, str] = {}  # 建筑 -> 第一个非空的required_construction
+        self.building_groups: Dict[str, Dict[str, None]] = {}  # 建筑 -> 该建筑的生产方式组（按出现顺序的有序集合）
+
+    @classmethod
+    def build(cls, records: Iterable[PMRecord], goods: List[str],
+              goods_costs: List[Tuple[str, str]] = ()) -> 'PMModel':
+        model = cls(goods, goods_costs)
+        for record in records:
+            model.add(record)
+        return model
+
+    def goods_vector(self, goods: Dict[str, Number]) -> Dict[str, Number]:
+        """只保留goods文件中存在的物资，并按goods文件顺序排列"""
+        goods_index = self.goods_index
+        return {goods_name: goods[goods_name]
+                for goods_name in sorted((g for g in goods if g in goods_index), key=goods_index.__getitem__)}
+
+    def add(self, record: PMRecord):
+        vector = self.goods_vector(record.goods)
+
+        group = self.groups.get(record.pmg)
+        if group is None:
+            group = self.groups[record.pmg] = ProductionMethodGroup(record.pmg, record.building)
+        group.add(record.pm, record.type, vector)
+
+        key = (record.pmg, record.pm)
+        if key in self.methods:
+            self.methods[key].update(vector)
+        else:
+            self.methods[key] = dict(vector)
+
+        if record.building:
+            self.building_types.setdefault(record.building, None)
+            self.building_groups.setdefault(record.building, {}).setdefault(record.pmg, None)
+            if record.required_construction:
+                self.building_construction_costs.setdefault(record.building, record.required_construction)
+
+    def groups_of_type(self, pm_type: str) -> List[ProductionMethodGroup]:
+        """包含指定type生产方式的生产方式组"""
+        return [group for group in self.groups.values() if pm_type in group.methods_by_type]
+
+    def same_goods(self, pmg: str, pm: str, other_pm: str) -> bool:
+        """pm与other_pm的物资向量完全相同，此时两者的利润预测在任何state都相等"""
+        return self.methods[(pmg, pm)] == self.methods[(pmg, other_pm)]
+
+    def same_nonnegative_goods(self, pmg: str, pm: str, other_pm: str) -> bool:
+        """
+        pm与other_pm的物资向量完全相同且没有投入
+        此时两者的利润预测相等且不为负，pm的利润不可能高出other_pm乘以容忍倍数（不小于1）的利润；
+        只是产出更多、投入更少并不够：产出增加会压低预测价格，利润为负时乘以容忍倍数反而更低
+        """
+        return (self.same_goods(pmg, pm, other_pm)
+                and all(value >= 0 for value in self.methods[(pmg, pm)].values()))
+
+    def pm_manage_cost(self, building: str) -> int:
+        """
+        估计PM管理中一个建筑类型的计算量：balance/upgrade生产方式的利润预测项数（每种物资一项），
+        加上balance生产方式两两之间、upgrade相邻生产方式之间的利润比较次数
+        """
+        cost = 0
+        for pmg in self.building_groups.get(building, ()):
+            group = self.groups[pmg]
+            balance = group.methods_by_type.get('balance', [])
+            upgrade = group.methods_by_type.get('upgrade', [])
+            for pm in dict.fromkeys(balance + upgrade):
+                cost += 1 + len(self.methods[(pmg, pm)])
+            cost += len(balance) * (len(balance) - 1) + max(len(upgrade) - 1, 0)
+        return cost
+
+    def dependency(self, name: str):
+        """
+        返回某一类输入数据（可序列化为JSON），供增量生成判断哪些输出需要重新生成
+        goods：物资列表；goods_costs：物资价格；pm_goods：各组的生产方式和物资向量；
+        methods：按(生产方式组, 生产方式)合并的物资向量；pm_types：各组所属建筑和按type分类的生产方式；
+        building_types：建筑类型列表；construction_costs：各建筑的required_construction；
+        building_groups：各建筑的生产方式组
+        """
+        if name == 'goods':
+            return self.goods
+        if name == 'goods_costs':
+            return self.goods_costs
+        if name == 'pm_goods':
+            return [[group.name, [[pm, list(group.goods[pm].items())] for pm in group.production_methods]]
+                    for group in self.groups.values()]
+        if name == 'methods':
+            return [[pmg, pm, list(goods.items())] for (pmg, pm), goods in self.methods.items()]
+        if name == 'pm_types':
+            return [[group.name, group.building, list(group.methods_by_type.items())]
+                    for group in self.groups.values()]
+        if name == 'building_types':
+            return list(self.building_types)
+        if name == 'construction_costs':
+            return sorted(self.building_construction_costs.items())
+        if name == 'building_groups':
+            return [[building, list(groups)] for building, groups in self.building_groups.items()]
+        raise KeyError(name)
+
+    def __bool__(self):
+        return bool(self.methods)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生产方式记录
+每条记录对应pm_goods表格中的一行（建筑→生产方式组→生产方式），物资按名字保存为数值，
+既可以从pm_goods.csv读取，也可以直接在内存中从Victoria3 building PM分析程序取得，不再经过CSV
+"""
+
+import csv
+import importlib.util
+import os
+import sys
+from collections import namedtuple
+from typing import Dict, List, Optional, Union
+
+# 表格中物资列之前的描述列
+ROW_HEADERS = ["buildings", "production_method_groups", "production_methods", "type", "required_construction"]
+
+# goods为 物资名 -> 数值，只包含不为0的物资（输入为负、输出为正）
+PMRecord = namedtuple('PMRecord', ['building', 'pmg', 'pm', 'type', 'required_construction', 'goods'])
+
+# 分析程序的默认位置（相对于本工具目录）
+DEFAULT_ANALYZER_DIR = os.path.join('..', 'Victoria3 building PM')
+# 分析程序源代码所在目录（相对于本文件），用于导入其脚本解析器
+ANALYZER_SOURCE_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                    '..', 'Victoria3 building PM'))
+
+
+def parse_goods_value(text: str) -> Union[int, float]:
+    """把表格中的物资数值转换为数字，空值为0"""
+    if not text:
+        return 0
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def format_goods_value(value: Union[int, float]) -> str:
+    """把物资数值格式化为脚本中的写法，整数不带小数点"""
+    if float(value).is_integer():
+        return str(int(value))
+    return f"{value:g}"
+
+
+def records_from_csv_rows(rows: List[List[str]]) -> List[PMRecord]:
+    """
+    把pm_goods.csv的行转换为生产方式记录
+    物资列按表头中的名字对应，不依赖列的位置与goods文件中的顺序一致
+    """
+    if len(rows) < 2:
+        return []
+
+    goods_columns = [(index, name.strip().lstrip('\ufeff'))
+                     for index, name in enumerate(rows[0]) if index >= len(ROW_HEADERS)]
+
+    records = []
+    for line_number, row in enumerate(rows[1:], start=2):
+        if len(row) < 3:
+            continue
+
+        goods = {}
+        for index, goods_name in goods_columns:
+            if index >= len(row):
+                break
+            text = row[index].strip()
+            try:
+                value = parse_goods_value(text)
+            except ValueError:
+                print(f"警告：第{line_number}行 {row[2].strip()} 的 {goods_name} 数值无法识别：{text}")
+                continue
+            if value != 0:
+                goods[goods_name] = value
+
+        records.append(PMRecord(
+            building=row[0].strip(),
+            pmg=row[1].strip(),
+            pm=row[2].strip(),
+            type=row[3].strip() if len(row) > 3 else '',
+            required_construction=row[4].strip() if len(row) > 4 else '',
+            goods=goods,
+        ))
+    return records
+
+
+def read_pm_records_csv(input_file: str) -> List[PMRecord]:
+    """读取CSV文件并转换为生产方式记录"""
+    with open(input_file, 'r', encoding='utf-8') as csvfile:
+        return records_from_csv_rows(list(csv.reader(csvfile)))
+
+
+def write_pm_records_csv(records: List[PMRecord], goods_columns: List[str], output_file: str):
+    """把生产方式记录导出为与pm_goods.csv相同格式的表格，0显示为空"""
+    with open(output_file, 'w', encoding='utf-8-sig', newline='') as csvfile:
+        writer = csv.writer(csvfile, lineterminator='\n')
+        writer.writerow(ROW_HEADERS + goods_columns)
+        for record in records:
+            writer.writerow([record.building, record.pmg, record.pm, record.type, record.required_construction]
+                            + [format_goods_value(record.goods[goods_name]) if goods_name in record.goods else ''
+                               for goods_name in goods_columns])
+
+
+def load_analyzer_module(analyzer_dir: str):
+    """
+    从分析程序目录导入其main.py
+    两个工具的入口都叫main.py，因此以单独的模块名导入，并把分析程序目录加入搜索路径以便找到它的其他模块
+    """
+    analyzer_dir = os.path.abspath(analyzer_dir)
+    if analyzer_dir not in sys.path:
+        sys.path.insert(0, analyzer_dir)
+    spec = importlib.util.spec_from_file_location('victoria3_building_pm_analyzer',
+                                                  os.path.join(analyzer_dir, 'main.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def import_analyzer_source(module_name: str):
+    """导入分析程序目录中两个工具共用的模块"""
+    if ANALYZER_SOURCE_DIR not in sys.path:
+        sys.path.insert(0, ANALYZER_SOURCE_DIR)
+    return importlib.import_module(module_name)
+
+
+def import_paradox_parser():
+    """导入分析程序中的Paradox脚本解析器，两个工具使用同一套词法规则"""
+    return import_analyzer_source('paradox_parser')
+
+
+def records_from_analyzer(analyzer_dir: str, jobs: int = 1, use_cache: bool = True,
+                          profiler=None) -> List[PMRecord]:
+    """运行分析程序并直接取得生产方式记录，不经过CSV；profiler不为None时分析程序的各阶段也记录在其中"""
+    module = load_analyzer_module(analyzer_dir)
+    cache_file = os.path.join(analyzer_dir, module.DEFAULT_CACHE_FILE) if use_cache else None
+    analyzer = module.Victoria3DataAnalyzer(base_path=analyzer_dir, jobs=jobs, cache_file=cache_file,
+                                            profiler=profiler)
+    return [PMRecord(building, pmg, pm, pmg_type, construction_cost, goods)
+            for (building, pmg, pm, pmg_type, construction_cost), goods in analyzer.pm_goods_records()]
+
+
+def apply_selection(records: List[PMRecord], selection: List[PMRecord]) -> List[PMRecord]:
+    """
+    按整理好的pm_goods.csv筛选分析程序的结果
+    只保留其中列出的 建筑+生产方式组，顺序和type都以整理好的表格为准，物资数值和required_construction取分析程序的最新结果；
+    mod更新后新增的生产方式排在同一生产方式组的最后，并沿用该组的type；已经不存在的生产方式会被跳过
+    """
+    analyzed: Dict[tuple, Dict[str, PMRecord]] = {}
+    for record in records:
+        analyzed.setdefault((record.building, record.pmg), {})[record.pm] = record
+
+    # 每个生产方式组在整理好的表格中最后出现的位置和type
+    last_index = {}
+    group_type = {}
+    for index, record in enumerate(selection):
+        last_index[(record.building, record.pmg)] = index
+        group_type[(record.building, record.pmg)] = record.type
+
+    selected = []
+    listed = set()
+    for index, record in enumerate(selection):
+        group = (record.building, record.pmg)
+        group_records = analyzed.get(group)
+        if group_records is None:
+            if last_index[group] == index:
+                print(f"警告：分析结果中没有 {record.building} 的生产方式组 {record.pmg}，已跳过")
+            continue
+
+        current: Optional[PMRecord] = group_records.get(record.pm)
+        if current is None:
+            print(f"警告：分析结果中没有生产方式 {record.pm}（{record.pmg}），已跳过")
+        else:
+            selected.append(current._replace(type=record.type))
+            listed.add((record.building, record.pmg, record.pm))
+
+        if last_index[group] == index:
+            for pm_name, new_record in group_records.items():
+                if (record.building, record.pmg, pm_name) not in listed:
+                    print(f"新增生产方式 {pm_name}（{record.pmg}），type沿用 {group_type[group]}")
+                    selected.append(new_record._replace(type=group_type[group]))
+                    listed.add((record.building, record.pmg, pm_name))
+
+    return selected
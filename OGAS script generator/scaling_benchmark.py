@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+规模扩展基准测试
+按指定规模生成与游戏文件相同目录结构的合成数据（goods、buildings、production_method_groups、production_methods），
+依次测量分析程序的 Victoria3DataAnalyzer.save_to_csv 以及生成程序每个 generate_* 阶段的耗时、CPU时间、阶段内峰值内存和输出字节数，
+结果追加保存到JSON文件，并与同一规模的上一次结果比较，便于发现不同版本之间的性能退化
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import incremental
+import main as generator
+from incremental import source_digest
+from pm_records import PMRecord, load_analyzer_module
+
+# 合成数据每个文件中的定义数
+DEFINITIONS_PER_FILE = 500
+
+# 生产方式组的texture依次使用的图标，对应分析程序中的type
+PMG_TEXTURES = ('mixed_icon_base', 'mixed_icon_refining', 'mixed_icon_automation')
+
+# 分析程序的type在生成程序中的处理方式：base组按balance处理，automation组按upgrade处理，其余不生成PM管理
+GENERATOR_TYPES = {'base': 'balance', 'automation': 'upgrade'}
+
+DEFAULT_RESULTS_FILE = 'scaling_benchmark.json'
+
+# 比较结果时，耗时增加超过该比例且超过REGRESSION_MIN_SECONDS的阶段标记为变慢（很短的阶段计时误差较大）
+REGRESSION_THRESHOLD = 0.2
+REGRESSION_MIN_SECONDS = 0.01
+
+
+def _write_definitions(directory, prefix, definitions):
+    """把定义分成多个文件写入目录，文件名按加载顺序编号"""
+    os.makedirs(directory, exist_ok=True)
+    for index in range(0, len(definitions), DEFINITIONS_PER_FILE):
+        filepath = os.path.join(directory, f"{prefix}_{index // DEFINITIONS_PER_FILE:03d}.txt")
+        with open(filepath, 'w', encoding='utf-8-sig') as f:
+            f.write(''.join(definitions[index:index + DEFINITIONS_PER_FILE]))
+
+
+def write_synthetic_game_data(base_dir, buildings, production_methods, goods, groups_per_building=3, seed=0):
+    """
+    在base_dir中生成合成的游戏数据：每个建筑groups_per_building个生产方式组，
+    production_methods个生产方式平均分配到各组（每组至少一个），每个生产方式有1~3种投入和1~2种产出
+    """
+    rng = random.Random(seed)
+    goods_names = [f"goods_{i}" for i in range(goods)]
+    os.makedirs(os.path.join(base_dir, 'goods'), exist_ok=True)
+    with open(os.path.join(base_dir, 'goods', '00_goods.txt'), 'w', encoding='utf-8-sig') as f:
+        for goods_name in goods_names:
+            f.write(f"{goods_name} = {{\n\ttexture = \"gfx/interface/icons/goods_icons/{goods_name}.dds\"\n"
+                    f"\tcost = {rng.randrange(10, 100)}\n\tcategory = industrial\n}}\n\n")
+
+    group_count = buildings * groups_per_building
+    building_definitions, group_definitions, pm_definitions = [], [], []
+    for building in range(buildings):
+        group_names = [f"pmg_synthetic_{building}_{k}" for k in range(groups_per_building)]
+        building_definitions.append(
+            f"building_synthetic_{building} = {{\n\trequired_construction = construction_cost_medium\n"
+            f"\tproduction_method_groups = {{\n\t\t{' '.join(group_names)}\n\t}}\n}}\n\n")
+
+        for k, group_name in enumerate(group_names):
+            group = building * groups_per_building + k
+            count = production_methods // group_count + (group < production_methods % group_count)
+            pm_names = [f"pm_synthetic_{building}_{k}_{j}" for j in range(max(count, 1))]
+            group_definitions.append(
+                f"{group_name} = {{\n\ttexture = \"gfx/interface/icons/generic_icons/{PMG_TEXTURES[k % 3]}.dds\"\n"
+                f"\tproduction_methods = {{\n\t\t{' '.join(pm_names)}\n\t}}\n}}\n\n")
+
+            for pm_name in pm_names:
+                modifiers = [f"\t\t\tgoods_input_{goods_name}_add = {rng.randrange(5, 50)}\n"
+                             for goods_name in rng.sample(goods_names, min(rng.randint(1, 3), goods))]
+                modifiers += [f"\t\t\tgoods_output_{goods_name}_add = {rng.randrange(5, 80)}\n"
+                              for goods_name in rng.sample(goods_names, min(rng.randint(1, 2), goods))]
+                pm_definitions.append(
+                    f"{pm_name} = {{\n\tbuilding_modifiers = {{\n\t\tworkforce_scaled = {{\n"
+                    f"{''.join(modifiers)}\t\t}}\n\t}}\n}}\n\n")
+
+    _write_definitions(os.path.join(base_dir, 'buildings'), 'synthetic_buildings', building_definitions)
+    _write_definitions(os.path.join(base_dir, 'production_method_groups'), 'synthetic_pmgs', group_definitions)
+    _write_definitions(os.path.join(base_dir, 'production_methods'), 'synthetic_pms', pm_definitions)
+    return {'buildings': buildings, 'production_method_groups': len(group_definitions),
+            'production_methods': len(pm_definitions), 'goods': goods}
+
+
+def process_peak_rss_bytes():
+    """进程到目前为止的峰值常驻内存（字节），只增不减，无法取得时为None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux以KB为单位，macOS以字节为单位
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _proc_status_bytes(field):
+    """从 /proc/self/status 读取内存字段（VmRSS、VmHWM等，单位kB），不是Linux时为None"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """
+    把Linux记录的峰值常驻内存（VmHWM）重置为当前值，之后读取的VmHWM就是从此刻起的峰值
+    ru_maxrss只增不减，先运行的阶段占用的内存会掩盖后面的阶段，因此每个阶段开始前重置；不支持时返回False
+    重置后ru_maxrss也随之失效，进程峰值改为取各阶段峰值的最大值
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def measure(name, function, output_files):
+    """
+    执行一个阶段并记录耗时、CPU时间、阶段内峰值内存和输出字节数
+    峰值内存只统计该阶段执行期间，增长量是峰值减去阶段开始时的常驻内存；不是Linux时这两项为None
+    output_files在阶段执行后调用，返回该阶段写出的文件
+    """
+    rss_before = _proc_status_bytes('VmRSS')
+    peak_reset = rss_before is not None and reset_peak_rss()
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        function()
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    peak = _proc_status_bytes('VmHWM') if peak_reset else None
+    return {
+        'stage': name,
+        'wall_seconds': round(wall, 6),
+        'cpu_seconds': round(cpu, 6),
+        'rss_before_bytes': rss_before,
+        'peak_rss_bytes': peak,
+        'peak_rss_growth_bytes': None if peak is None else peak - rss_before,
+        'output_bytes': sum(os.path.getsize(path) for path in output_files()),
+    }
+
+
+def run_benchmark(work_dir, scale, seed=0):
+    """在work_dir中生成合成数据并依次执行各阶段，返回每个阶段的测量结果"""
+    data_dir = os.path.join(work_dir, 'game_data')
+    counts = write_synthetic_game_data(data_dir, seed=seed, **scale)
+    analyzer_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Victoria3 building PM')
+    with contextlib.redirect_stdout(io.StringIO()):
+        analyzer_module = load_analyzer_module(analyzer_dir)
+
+    stages = []
+    csv_file = os.path.join(work_dir, 'victoria3_building_pm_goods.csv')
+    analyzer = analyzer_module.Victoria3DataAnalyzer(base_path=data_dir, cache_file=None)
+    stages.append(measure('analyzer.save_to_csv', lambda: analyzer.save_to_csv(csv_file), lambda: [csv_file]))
+
+    # 生成程序的输入和输出都相对于当前目录
+    generator_dir = os.path.join(work_dir, 'generator')
+    os.makedirs(os.path.join(generator_dir, 'goods'))
+    shutil.copy(os.path.join(data_dir, 'goods', '00_goods.txt'), os.path.join(generator_dir, 'goods'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        analyzer_records = analyzer.pm_goods_records()
+    records = [PMRecord(building, pmg, pm, GENERATOR_TYPES.get(pmg_type, pmg_type), construction_cost, goods)
+               for (building, pmg, pm, pmg_type, construction_cost), goods in analyzer_records]
+
+    previous_dir = os.getcwd()
+    os.chdir(generator_dir)
+    try:
+        def build_model():
+            generator.use_pm_records(records)
+            generator.get_pm_model()
+        stages.append(measure('generator.pm_model', build_model, lambda: []))
+
+        for stage, generate, _ in generator.GENERATION_STAGES:
+            del incremental.committed_outputs[:]
+            stages.append(measure(f"generator.{generate.__name__}", generate,
+                                  lambda: list(incremental.committed_outputs)))
+    finally:
+        os.chdir(previous_dir)
+        generator.use_pm_records([])
+    return counts, stages
+
+
+def load_results(results_file):
+    try:
+        with open(results_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+    except Exception as e:
+        print(f"读取 {results_file} 时出错，将重新建立：{e}")
+        return []
+
+
+def print_comparison(run, previous):
+    """与同一规模的上一次结果比较每个阶段的耗时"""
+    previous_stages = {stage['stage']: stage for stage in previous['stages']}
+    print(f"与上一次同规模的结果比较（{previous['timestamp']}，源代码 {previous['source'][:8]}）：")
+    for stage in run['stages']:
+        old = previous_stages.get(stage['stage'])
+        if old is None or not old['wall_seconds']:
+            continue
+        change = stage['wall_seconds'] / old['wall_seconds'] - 1
+        slower = (change > REGRESSION_THRESHOLD
+                  and stage['wall_seconds'] - old['wall_seconds'] > REGRESSION_MIN_SECONDS)
+        print(f"  {stage['stage']:<56}{old['wall_seconds'] * 1000:>10.1f} → {stage['wall_seconds'] * 1000:>10.1f} ms"
+              f"（{change:+.1%}）" + ("  变慢！" if slower else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在合成数据上测试分析程序和生成程序的规模扩展性能")
+    parser.add_argument('--buildings', type=int, default=2000, help="建筑数量")
+    parser.add_argument('--pms', type=int, default=10000, help="生产方式数量")
+    parser.add_argument('--goods', type=int, default=400, help="物资数量")
+    parser.add_argument('--groups-per-building', type=int, default=3, help="每个建筑的生产方式组数量")
+    parser.add_argument('--seed', type=int, default=0, help="随机数种子")
+    parser.add_argument('--output', default=DEFAULT_RESULTS_FILE, help=f"保存结果的JSON文件，默认 {DEFAULT_RESULTS_FILE}")
+    parser.add_argument('--keep-data', metavar='DIR', help="把合成数据和生成结果保留在指定目录（默认使用临时目录并在结束后删除）")
+    args = parser.parse_args()
+
+    scale = {'buildings': args.buildings, 'production_methods': args.pms, 'goods': args.goods,
+             'groups_per_building': args.groups_per_building}
+    work_dir = args.keep_data or tempfile.mkdtemp(prefix='ogas_scaling_')
+    if args.keep_data:
+        os.makedirs(work_dir, exist_ok=True)
+
+    print(f"规模扩展基准测试：{args.buildings} 个建筑，{args.pms} 个生产方式，{args.goods} 个物资")
+    print("=" * 50)
+    try:
+        counts, stages = run_benchmark(work_dir, scale, args.seed)
+    finally:
+        if not args.keep_data:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    source_dir = os.path.dirname(os.path.abspath(__file__))
+    run = {
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'source': source_digest(os.path.join(source_dir, f) for f in generator.SOURCE_FILES),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': dict(scale, seed=args.seed),
+        'counts': counts,
+        'stages': stages,
+        'process_peak_rss_bytes': max((stage['peak_rss_bytes'] for stage in stages
+                                       if stage['peak_rss_bytes'] is not None),
+                                      default=process_peak_rss_bytes()),
+    }
+
+    print(f"{'阶段':<54}{'耗时(ms)':>12}{'CPU(ms)':>12}{'阶段峰值(MB)':>14}{'增长(MB)':>10}{'输出(MB)':>10}")
+    for stage in stages:
+        peak, growth = ('', '') if stage['peak_rss_bytes'] is None else (
+            f"{stage['peak_rss_bytes'] / 1e6:.1f}", f"{stage['peak_rss_growth_bytes'] / 1e6:+.1f}")
+        print(f"{stage['stage']:<56}{stage['wall_seconds'] * 1000:>12.1f}{stage['cpu_seconds'] * 1000:>12.1f}"
+              f"{peak:>14}{growth:>10}{stage['output_bytes'] / 1e6:>10.2f}")
+    print(f"合计耗时：{sum(stage['wall_seconds'] for stage in stages):.2f} 秒")
+    if run['process_peak_rss_bytes'] is not None:
+        print(f"最高峰值内存：{run['process_peak_rss_bytes'] / 1e6:.1f} MB")
+
+    results = load_results(args.output)
+    previous = [result for result in results if result.get('scale') == run['scale']]
+    if previous:
+        print("=" * 50)
+        print_comparison(run, previous[-1])
+
+    results.append(run)
+    try:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+        print(f"结果已追加到 {args.output}")
+    except OSError as e:
+        print(f"保存结果时出错：{e}")
+
+
+if __name__ == "__main__":
+    main()
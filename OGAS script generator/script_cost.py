@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+mod脚本运行开销的静态估计
+解析mod的common目录（生成的AUTO_*文件和手写脚本），建立scripted_effects、scripted_triggers、script_values之间的调用图，
+从journal_entries的 on_*_pulse 出发，按每个节点计算一次、遍历作用域（every_scope_state、ordered_in_list等）乘以估计的对象数，
+估计每周需要计算的节点数，输出按开销排序的热点报告和火焰图工具可读的折叠栈文件（flamegraph.pl、speedscope等）
+"""
+
+import argparse
+import os
+import re
+from collections import namedtuple
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pm_records import import_paradox_parser
+from script_graph import referenced_names
+
+paradox_parser = import_paradox_parser()
+
+# 可以被调用的定义所在的目录和类型
+DEFINITION_DIRECTORIES = {
+    'scripted_effects': 'effect',
+    'scripted_triggers': 'trigger',
+    'script_values': 'value',
+}
+
+# journal_entries中的脉冲及其每周执行的次数
+PULSE_WEIGHTS = {
+    'on_weekly_pulse': 1.0,
+    'on_monthly_pulse': 7 / 30.4,
+    'on_yearly_pulse': 7 / 365,
+}
+
+# 遍历作用域：every_/ordered_/random_/any_ 加作用域类型
+ITERATOR_PATTERN = re.compile(r'^(every|ordered|random|any)_(.+)$')
+
+# 各种作用域遍历的估计对象数（一个国家中），可以用 --scope-size 修改
+SCOPE_SIZES = {
+    'state': 40,
+    'building': 25,
+    'country': 150,
+    'pop': 400,
+    'character': 20,
+    'interest_group': 8,
+    'market_goods': 50,
+    'list': 40,
+}
+DEFAULT_SCOPE_SIZE = 10
+
+# while没有count时的估计循环次数，ordered_*的max不是数值时的估计执行次数
+WHILE_ITERATIONS = 10
+ORDERED_MAX = 10
+
+# 只在筛选和排序时对每个对象计算的条目，其余条目只对选中的对象执行
+SELECTION_KEYS = ('limit', 'order_by')
+
+ScriptDefinition = namedtuple('ScriptDefinition', ['name', 'kind', 'path', 'block'])
+
+# 一个定义每计算一次的开销：自身计算的节点数，以及 被调用的定义 -> 调用次数
+DefinitionCost = namedtuple('DefinitionCost', ['nodes', 'calls'])
+
+
+def scope_size(iterator: str, scope_sizes: Dict[str, float]) -> float:
+    """遍历作用域的估计对象数，例如 every_scope_state -> state，ordered_in_list -> list"""
+    scope = iterator[len('scope_'):] if iterator.startswith('scope_') else iterator
+    if scope.endswith('in_list') or scope.endswith('in_global_list'):
+        scope = 'list'
+    return scope_sizes.get(scope, DEFAULT_SCOPE_SIZE)
+
+
+def load_definitions(common_dir: str) -> Tuple[Dict[str, ScriptDefinition], List[ScriptDefinition]]:
+    """
+    读取common目录下的所有脚本
+    返回 (定义名 -> 定义, journal_entries中的脉冲入口列表)，入口的名字为 <journal entry>.<pulse>
+    """
+    definitions: Dict[str, ScriptDefinition] = {}
+    roots: List[ScriptDefinition] = []
+    for dirpath, _, filenames in sorted(os.walk(common_dir)):
+        directory = os.path.basename(dirpath)
+        for filename in sorted(filenames):
+            if not filename.endswith('.txt'):
+                continue
+            path = os.path.join(dirpath, filename)
+            with open(path, 'r', encoding='utf-8-sig') as f:
+                root = paradox_parser.parse(f.read())
+
+            kind = DEFINITION_DIRECTORIES.get(directory)
+            for name, _, value in root.keyed():
+                if kind is not None:
+                    # 后读取的定义覆盖先读取的（与游戏的规则一致）
+                    definitions[name] = ScriptDefinition(name, kind, path, value)
+                elif directory == 'journal_entries' and isinstance(value, paradox_parser.Block):
+                    for pulse in PULSE_WEIGHTS:
+                        block = value.get(pulse)
+                        if isinstance(block, paradox_parser.Block):
+                            roots.append(ScriptDefinition(f"{name}.{pulse}", 'pulse', path, block))
+    return definitions, roots
+
+
+class ScriptCostModel:
+    """按调用图估计每个定义的运行开销"""
+
+    def __init__(self, definitions: Dict[str, ScriptDefinition], scope_sizes: Optional[Dict[str, float]] = None,
+                 while_iterations: float = WHILE_ITERATIONS, ordered_max: float = ORDERED_MAX):
+        self.definitions = definitions
+        self.scope_sizes = dict(SCOPE_SIZES, **(scope_sizes or {}))
+        self.while_iterations = while_iterations
+        self.ordered_max = ordered_max
+        self._costs: Dict[str, DefinitionCost] = {}
+        self._inclusive: Dict[str, float] = {}
+
+    def cost(self, definition: ScriptDefinition) -> DefinitionCost:
+        """定义每计算一次的开销（结果按名字缓存）"""
+        cost = self._costs.get(definition.name)
+        if cost is None:
+            calls: Dict[str, float] = {}
+            if isinstance(definition.block, paradox_parser.Block):
+                nodes = self._walk(definition.block, 1.0, calls)
+            else:
+                # 常数 script value
+                nodes = 1.0
+                self._add_references(definition.block, 1.0, calls)
+            calls.pop(definition.name, None)
+            cost = self._costs[definition.name] = DefinitionCost(nodes, calls)
+        return cost
+
+    def _add_references(self, token: str, multiplier: float, calls: Dict[str, float]):
+        for name in referenced_names(token):
+            if name in self.definitions:
+                calls[name] = calls.get(name, 0.0) + multiplier
+
+    def _walk(self, block, multiplier: float, calls: Dict[str, float]) -> float:
+        """计算块中所有条目的节点数（乘以所在循环的次数），并记录调用的定义"""
+        nodes = 0.0
+        for key, _, value in block:
+            nodes += multiplier
+            if key is not None:
+                self._add_references(key, multiplier, calls)
+            if not isinstance(value, paradox_parser.Block):
+                self._add_references(value, multiplier, calls)
+                continue
+
+            iterator = ITERATOR_PATTERN.match(key) if key is not None else None
+            if iterator is not None:
+                kind, scope = iterator.groups()
+                size = scope_size(scope, self.scope_sizes)
+                if kind in ('ordered', 'random'):
+                    # 筛选和排序对每个对象计算，其余条目只对选中的对象执行
+                    executed = 1.0
+                    if kind == 'ordered':
+                        limit = paradox_parser.to_number(value.get('max'))
+                        executed = min(size, self.ordered_max if limit is None else limit)
+                    for entry_key, _, entry_value in value:
+                        entry_multiplier = multiplier * (size if entry_key in SELECTION_KEYS else executed)
+                        nodes += entry_multiplier
+                        if isinstance(entry_value, paradox_parser.Block):
+                            nodes += self._walk(entry_value, entry_multiplier, calls)
+                        else:
+                            self._add_references(entry_value, entry_multiplier, calls)
+                else:
+                    nodes += self._walk(value, multiplier * size, calls)
+            elif key == 'while':
+                count = paradox_parser.to_number(value.get('count'))
+                nodes += self._walk(value, multiplier * (self.while_iterations if count is None else count), calls)
+            else:
+                nodes += self._walk(value, multiplier, calls)
+        return nodes
+
+    def inclusive_cost(self, name: str, _active: Optional[set] = None) -> float:
+        """定义每计算一次的总开销（包括调用的定义），递归调用只计算一次"""
+        if name in self._inclusive:
+            return self._inclusive[name]
+        active = set() if _active is None else _active
+        active.add(name)
+        cost = self.cost(self.definitions[name])
+        total = cost.nodes + sum(multiplier * self.inclusive_cost(callee, active)
+                                 for callee, multiplier in cost.calls.items() if callee not in active)
+        active.discard(name)
+        self._inclusive[name] = total
+        return total
+
+    def evaluations(self, roots: Iterable[Tuple[ScriptDefinition, float]]) -> Dict[str, float]:
+        """从入口（入口, 每周执行次数）出发，求每个定义每周被计算的次数"""
+        for root, _ in roots:
+            self.definitions.setdefault(root.name, root)
+
+        # 按调用关系的拓扑顺序累加调用次数（递归调用的边被忽略）
+        order: List[str] = []
+        state: Dict[str, int] = {}
+        for root, _ in roots:
+            stack = [(root.name, iter(self.cost(root).calls))]
+            state[root.name] = 1
+            while stack:
+                name, children = stack[-1]
+                for child in children:
+                    if child not in state:
+                        state[child] = 1
+                        stack.append((child, iter(self.cost(self.definitions[child]).calls)))
+                        break
+                else:
+                    state[name] = 2
+                    order.append(name)
+                    stack.pop()
+
+        counts = {name: 0.0 for name in order}
+        for root, weight in roots:
+            counts[root.name] += weight
+        position = {name: index for index, name in enumerate(order)}
+        for name in reversed(order):
+            for callee, multiplier in self.cost(self.definitions[name]).calls.items():
+                if position[callee] < position[name]:
+                    counts[callee] += counts[name] * multiplier
+        return counts
+
+    def folded_stacks(self, roots: Iterable[Tuple[ScriptDefinition, float]],
+                      min_nodes: float = 1.0) -> Dict[Tuple[str, ...], float]:
+        """
+        火焰图的折叠栈：调用路径 -> 该路径上最后一个定义自身每周计算的节点数
+        总开销低于min_nodes的调用路径不再展开，其总开销计入路径上最后一个定义
+        """
+        stacks: Dict[Tuple[str, ...], float] = {}
+
+        def expand(path: Tuple[str, ...], count: float):
+            name = path[-1]
+            cost = self.cost(self.definitions[name])
+            stacks[path] = stacks.get(path, 0.0) + cost.nodes * count
+            for callee, multiplier in cost.calls.items():
+                if callee in path:
+                    continue
+                callee_count = count * multiplier
+                callee_nodes = callee_count * self.inclusive_cost(callee)
+                if callee_nodes >= min_nodes:
+                    expand(path + (callee,), callee_count)
+                else:
+                    # 不再展开的调用路径把总开销计入该定义自身，火焰图的总宽度不变
+                    callee_path = path + (callee,)
+                    stacks[callee_path] = stacks.get(callee_path, 0.0) + callee_nodes
+
+        for root, weight in roots:
+            self.definitions.setdefault(root.name, root)
+            expand((root.name,), weight)
+        return stacks
+
+
+def write_folded_stacks(stacks: Dict[Tuple[str, ...], float], output_file: str):
+    """写出折叠栈文件：每行为 以分号分隔的调用路径 + 空格 + 节点数"""
+    with open(output_file, 'w', encoding='utf-8') as f:
+        for path, nodes in sorted(stacks.items()):
+            count = round(nodes)
+            if count > 0:
+                f.write(f"{';'.join(path)} {count}\n")
+
+
+def parse_scope_sizes(values: List[str]) -> Dict[str, float]:
+    sizes = {}
+    for value in values:
+        scope, sep, size = value.partition('=')
+        if not sep:
+            raise ValueError(f"作用域大小的格式应为 作用域=数量：{value}")
+        sizes[scope] = float(size)
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="静态估计mod脚本每周的运行开销，输出热点报告和火焰图折叠栈")
+    parser.add_argument('--mod-common', default=os.path.join('..', 'common'), help="mod的common目录")
+    parser.add_argument('--root', nargs='+', default=[], metavar='NAME',
+                        help="额外作为入口的定义（例如按钮调用的效果），每个按每周执行一次计算")
+    parser.add_argument('--scope-size', nargs='+', default=[], metavar='SCOPE=N',
+                        help="修改作用域遍历的估计对象数，例如 state=60 building=30")
+    parser.add_argument('--top', type=int, default=25, help="热点报告列出的定义数")
+    parser.add_argument('--flamegraph', metavar='FILE', help="写出火焰图折叠栈文件（flamegraph.pl / speedscope）")
+    args = parser.parse_args()
+
+    try:
+        scope_sizes = parse_scope_sizes(args.scope_size)
+        definitions, pulse_roots = load_definitions(args.mod_common)
+    except ValueError as e:
+        print(f"错误：{e}")
+        return
+    except OSError as e:
+        print(f"读取mod脚本时出错：{e}")
+        return
+
+    definition_count = len(definitions)
+    model = ScriptCostModel(definitions, scope_sizes)
+    roots = [(root, PULSE_WEIGHTS[root.name.rsplit('.', 1)[1]]) for root in pulse_roots]
+    for name in args.root:
+        if name in definitions:
+            roots.append((definitions[name], 1.0))
+        else:
+            print(f"警告：找不到定义 {name}，已跳过")
+    if not roots:
+        print(f"错误：{args.mod_common} 中没有可以作为入口的脉冲或定义")
+        return
+
+    counts = model.evaluations(roots)
+    total = sum(counts[root.name] * model.inclusive_cost(root.name) for root, _ in roots)
+    kinds = {'effect': '效果', 'trigger': '触发器', 'value': '数值', 'pulse': '入口'}
+
+    print(f"共 {definition_count} 个定义，{len(roots)} 个入口，估计每周计算 {total:,.0f} 个节点")
+    print("=" * 50)
+    print(f"{'入口':<48}{'每周次数':>10}{'每周节点数':>16}{'占比':>8}")
+    for root, _ in roots:
+        nodes = counts[root.name] * model.inclusive_cost(root.name)
+        print(f"{root.name:<48}{counts[root.name]:>10.2f}{nodes:>16,.0f}{nodes / max(total, 1):>8.1%}")
+
+    rows = []
+    for name, count in counts.items():
+        definition = definitions[name]
+        if definition.kind == 'pulse':
+            continue
+        cost = model.cost(definition)
+        rows.append((count * cost.nodes, count * model.inclusive_cost(name), count, name, definition))
+    rows.sort(reverse=True)
+
+    print()
+    print(f"热点（按自身每周节点数排序，前 {args.top} 个）")
+    print("=" * 50)
+    print(f"{'定义':<48}{'类型':>6}{'每周次数':>12}{'自身节点数':>14}{'总节点数':>14}{'自身占比':>8}  文件")
+    for self_nodes, inclusive_nodes, count, name, definition in rows[:args.top]:
+        print(f"{name:<48}{kinds[definition.kind]:>6}{count:>12,.1f}{self_nodes:>14,.0f}{inclusive_nodes:>14,.0f}"
+              f"{self_nodes / max(total, 1):>8.1%}  {os.path.relpath(definition.path, args.mod_common)}")
+
+    if args.flamegraph:
+        try:
+            write_folded_stacks(model.folded_stacks(roots, min_nodes=total * 1e-5), args.flamegraph)
+            print(f"\n火焰图折叠栈已保存到 {args.flamegraph}（例如 flamegraph.pl {args.flamegraph} > cost.svg）")
+        except OSError as e:
+            print(f"保存火焰图折叠栈时出错：{e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+脚本模板
+模板在程序启动时预先编译，生成时只填入变量并一次写出整个块，
+不再对不断变长的字符串反复 += 拼接，每个块占用的内存与块本身大小相当
+"""
+
+import keyword
+import string
+from typing import List
+
+
+class Template:
+    """
+    预编译的脚本模板，语法与str.format相同：{name}为变量，{{ }}为大括号本身
+    变量只支持简单名字，不支持格式说明和下标；
+    模板在创建时被编译为等价的f-string函数，生成时不再解析模板，也没有额外的函数调用层
+    """
+    __slots__ = ('source', 'fields', 'render', 'emit')
+
+    def __init__(self, source: str):
+        self.source = source
+        fields = []
+        for _, field, format_spec, conversion in string.Formatter().parse(source):
+            if field is None:
+                continue
+            if (not field.isidentifier() or keyword.iskeyword(field) or field == 'outfile'
+                    or format_spec or conversion):
+                raise ValueError(f"模板变量只支持简单名字：{{{field}}}")
+            if field not in fields:
+                fields.append(field)
+        self.fields: List[str] = fields  # 模板中用到的变量名（按出现顺序，不重复）
+
+        # 模板语法与f-string一致，直接编译为只接受关键字参数的函数：
+        # render(**values) 返回整个块，emit(outfile, **values) 把整个块一次写入文件
+        keyword_arguments = f", *, {', '.join(fields)}" if fields else ""
+        body = f"f{source!r}"
+        self.render = eval(compile(f"lambda {keyword_arguments[2:]}: {body}", '<template>', 'eval'), {})
+        self.emit = eval(compile(f"lambda outfile{keyword_arguments}: outfile.write({body})",
+                                 '<template>', 'eval'), {})
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生成脚本的引用图与无用定义删除
+扫描生成文件中的顶层定义及其引用的名字，从入口（PM_balance、PM_upgrade、OGAS_find_best_profit_building）
+和手写脚本引用的名字出发求可达集合，删除script_values中不可达的定义，减少游戏启动时需要解析和保存的脚本
+词法规则与分析程序的paradox_parser相同
+"""
+
+import os
+import re
+from collections import namedtuple
+from typing import Dict, Iterable, List, Set, Tuple
+
+from pm_records import import_paradox_parser
+
+paradox_parser = import_paradox_parser()
+
+# 游戏实际调用的生成脚本入口
+ENTRY_POINTS = ('PM_balance', 'PM_upgrade', 'OGAS_find_best_profit_building')
+
+# 只删除这些目录中的定义：script_values只在被引用时计算，删除不可达的定义不会影响游戏行为
+PRUNABLE_DIRECTORIES = ('script_values',)
+
+# 作用域路径和作用域前缀的分隔符，例如 b:building_xxx.pmg_xxx_profit_prediction
+NAME_SEPARATOR_PATTERN = re.compile(r'[.:]')
+
+# 顶层定义：名字以及在文件中的 [开始, 结束) 范围（已扩展到整行并包含其后的空行）
+Definition = namedtuple('Definition', ['name', 'start', 'end'])
+
+PruneResult = namedtuple('PruneResult', ['definitions', 'lines', 'bytes'])
+
+
+def referenced_names(token_value: str) -> List[str]:
+    """把一个词法单元拆分为可能引用的名字"""
+    return [part for part in NAME_SEPARATOR_PATTERN.split(token_value) if part]
+
+
+def _expand_to_lines(content: str, start: int, end: int) -> Tuple[int, int]:
+    """把定义的范围扩展到整行，并包含其后的空行（删除后不会留下多余的空行）"""
+    line_start = content.rfind('\n', 0, start) + 1
+    if content[line_start:start].strip(' \t\ufeff'):
+        line_start = start
+    elif content.startswith('\ufeff', line_start):
+        # 文件开头的BOM保留在文件中
+        line_start += 1
+
+    line_end = content.find('\n', end)
+    line_end = len(content) if line_end < 0 else line_end + 1
+    while line_end < len(content):
+        next_end = content.find('\n', line_end)
+        next_end = len(content) if next_end < 0 else next_end + 1
+        if content[line_end:next_end].strip():
+            break
+        line_end = next_end
+    return line_start, line_end
+
+
+def scan_definitions(content: str) -> Tuple[List[Definition], Dict[str, Set[str]], Set[str]]:
+    """
+    扫描脚本中的顶层定义
+    返回 (定义列表, 定义名字 -> 定义体中引用的名字, 不属于任何定义的引用)
+    """
+    definitions = []
+    references: Dict[str, Set[str]] = {}
+    loose_references: Set[str] = set()
+
+    tokens = list(paradox_parser.tokenize(content))
+    index = 0
+    while index < len(tokens):
+        kind, value, offset = tokens[index]
+        if kind == 'atom' and index + 2 < len(tokens) and tokens[index + 1][0] == 'op':
+            # 顶层的 名字 = 值 或 名字 = { ... }
+            name = value
+            value_index = index + 2
+            body = references.setdefault(name, set())
+            if tokens[value_index][0] == 'lbrace':
+                depth = 0
+                end_index = value_index
+                while end_index < len(tokens):
+                    token_kind = tokens[end_index][0]
+                    if token_kind == 'lbrace':
+                        depth += 1
+                    elif token_kind == 'rbrace':
+                        depth -= 1
+                        if depth == 0:
+                            break
+                    elif token_kind == 'atom':
+                        body.update(referenced_names(tokens[end_index][1]))
+                    end_index += 1
+                if end_index == len(tokens):
+                    # 大括号不匹配，之后的内容不再作为定义处理
+                    loose_references.update(body)
+                    del references[name]
+                    return definitions, references, loose_references
+            else:
+                end_index = value_index
+                if tokens[value_index][0] == 'atom':
+                    body.update(referenced_names(tokens[value_index][1]))
+
+            end_kind, end_value, end_offset = tokens[end_index]
+            if end_kind == 'string':
+                # 字符串的值已去掉引号，结束位置以右引号为准
+                end = content.find('"', end_offset + 1) + 1 or end_offset + len(end_value) + 1
+            else:
+                end = end_offset + len(end_value)
+            definitions.append(Definition(name, *_expand_to_lines(content, offset, end)))
+            index = end_index + 1
+        else:
+            if kind == 'atom':
+                loose_references.update(referenced_names(value))
+            index += 1
+    return definitions, references, loose_references
+
+
+def count_script_nodes(content: str) -> int:
+    """脚本中的节点数：所有层级中的条目（键值对、块和裸值）"""
+    count = 0
+    stack = [paradox_parser.parse(content)]
+    while stack:
+        block = stack.pop()
+        count += len(block)
+        stack.extend(value for _, _, value in block if isinstance(value, paradox_parser.Block))
+    return count
+
+
+def collect_handwritten_references(mod_common_dir: str) -> Set[str]:
+    """收集mod中手写脚本（文件名不以AUTO_开头）引用的所有名字，这些定义必须保留"""
+    names: Set[str] = set()
+    for dirpath, _, filenames in os.walk(mod_common_dir):
+        for filename in sorted(filenames):
+            if not filename.endswith('.txt') or filename.startswith('AUTO_'):
+                continue
+            with open(os.path.join(dirpath, filename), 'r', encoding='utf-8-sig') as f:
+                for kind, value, _ in paradox_parser.tokenize(f.read()):
+                    if kind == 'atom':
+                        names.update(referenced_names(value))
+    return names
+
+
+def reachable_names(references: Dict[str, Set[str]], roots: Iterable[str]) -> Set[str]:
+    """从入口出发，沿定义体中的引用求所有可达的定义"""
+    reachable = set()
+    stack = [name for name in roots if name in references]
+    while stack:
+        name = stack.pop()
+        if name in reachable:
+            continue
+        reachable.add(name)
+        stack.extend(child for child in references[name] if child in references and child not in reachable)
+    return reachable
+
+
+def is_prunable(output_path: str) -> bool:
+    return os.path.basename(os.path.dirname(os.path.normpath(output_path))) in PRUNABLE_DIRECTORIES
+
+
+def prune_unreachable(files: List[Tuple[str, str]], external_references: Iterable[str],
+                      roots: Iterable[str] = ENTRY_POINTS) -> Dict[str, PruneResult]:
+    """
+    删除生成文件中不可达的定义
+    files为 (实际读写的文件, 输出文件路径) 列表，输出文件路径用于判断能否删除；
+    返回 输出文件路径 -> 删除的定义数、行数、字节数
+    """
+    contents = {}
+    scanned = {}
+    references: Dict[str, Set[str]] = {}
+    roots = set(roots) | set(external_references)
+    for file_path, output_path in files:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        definitions, file_references, loose_references = scan_definitions(content)
+        for name, names in file_references.items():
+            references.setdefault(name, set()).update(names)
+        # 不能删除的文件中的定义全部保留，文件中不属于定义的引用也视为入口
+        roots.update(loose_references)
+        if is_prunable(output_path):
+            contents[file_path] = content
+            scanned[file_path] = definitions
+        else:
+            roots.update(file_references)
+
+    reachable = reachable_names(references, roots)
+
+    results = {}
+    for file_path, output_path in files:
+        if file_path not in scanned:
+            continue
+        content = contents[file_path]
+        kept = []
+        position = 0
+        removed = PruneResult(0, 0, 0)
+        for definition in scanned[file_path]:
+            if definition.name in reachable:
+                continue
+            text = content[definition.start:definition.end]
+            kept.append(content[position:definition.start])
+            position = definition.end
+            removed = PruneResult(removed.definitions + 1, removed.lines + text.count('\n'),
+                                  removed.bytes + len(text.encode('utf-8')))
+        if removed.definitions:
+            kept.append(content[position:])
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(''.join(kept))
+        results[output_path] = removed
+    return results
@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+OGAS经济模型的离线模拟
+使用与生成程序相同的pm_goods数据，按生成脚本中的公式（building_work_efficiency、<goods>_price_prediction、
+<pmg>_<pm>_profit_prediction、cnm_building_profit_weight）在numpy数组上批量计算：
+一次调用即可为一批state中每个建筑的每个生产方式计算利润预测，再模拟PM_balance、PM_upgrade的选择，
+用于在大量合成市场上比较cnm_upgrade_tolerance_pm_manager等设置，不需要进入游戏
+"""
+
+import argparse
+import math
+import os
+import time
+from collections import namedtuple
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from pm_model import PMModel, parse_goods_file
+from pm_records import DEFAULT_ANALYZER_DIR, apply_selection, read_pm_records_csv, records_from_analyzer
+
+# 游戏中可选的容忍倍数（script_values/OGAS_version.txt 中的 pm_upgrade_tolerance_low/medium/high）
+DEFAULT_TOLERANCES = (1.20, 1.35, 1.50)
+
+# PM_balance、PM_upgrade 只处理雇佣率高于此值的建筑
+MIN_OCCUPANCY = 0.01
+
+# 带有balance/upgrade type的完整表格（pm_goods.csv只是基础生产方式的示例，模拟结果全为0）
+DEFAULT_CSV = 'pm_goods_full.csv'
+
+# 一批state的游戏数据，S为state数，G为物资数，B为建筑类型数，K为生产方式组数：
+# state_production / state_consumption：state_goods_production / state_goods_consumption，(S, G)
+# market_sell_orders / market_buy_orders：所在市场的 market_goods_sell_orders / market_goods_buy_orders，(S, G)
+# market_access、price_impact（state_market_access_price_impact）、construction_mult（state_construction_mult）：(S,)
+# occupancy、level、throughput（building_throughput_add）：该state中每种建筑的数值，(S, B)，没有该建筑时level为0
+# active_pm：每个生产方式组当前的生产方式在 EconomyModel.methods 中的编号，(S, K)，没有时为-1
+Markets = namedtuple('Markets', ['state_production', 'state_consumption', 'market_sell_orders', 'market_buy_orders',
+                                 'market_access', 'price_impact', 'construction_mult',
+                                 'occupancy', 'level', 'throughput', 'active_pm'])
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("离线模拟需要numpy，请先执行 pip install numpy")
+
+
+def supply_demand_price_factor(production, consumption):
+    """OGAS_supply_demand_price_factor：供过于求时降价、供不应求时涨价，系数在0.25到1.75之间"""
+    divisor = np.maximum(np.minimum(production, consumption), 0.1)
+    return np.clip((production - consumption) / divisor * -0.75, -0.75, 0.75) + 1
+
+
+class EconomyModel:
+    """
+    由数据模型建立的向量化计算所需的索引数组
+    每个 (生产方式组, 生产方式) 的非零物资展开为一个条目，按生产方式排列，条目数等于生成的利润预测中的 add 块数
+    """
+
+    def __init__(self, model: PMModel):
+        _require_numpy()
+        self.model = model
+        self.goods = list(model.goods)
+        goods_costs = dict(model.goods_costs)
+        self.base_price = np.array([float(goods_costs.get(goods_name, 0)) for goods_name in self.goods])
+
+        self.groups = list(model.groups.values())
+        self.group_index = {group.name: k for k, group in enumerate(self.groups)}
+        self.buildings = list(dict.fromkeys([*model.building_types, *(group.building for group in self.groups)]))
+        self.building_index = {building: b for b, building in enumerate(self.buildings)}
+        self.group_building = np.array([self.building_index[group.building] for group in self.groups], dtype=np.intp)
+
+        # 生产方式 (生产方式组, 生产方式)，顺序与 PMModel.methods 一致
+        self.methods = list(model.methods)
+        self.method_index = {key: r for r, key in enumerate(self.methods)}
+        self.method_group = np.array([self.group_index[pmg] for pmg, _ in self.methods], dtype=np.intp)
+
+        # 物资数值的稠密矩阵，最后多一行0，对应没有当前生产方式（{pmg}_{goods}_current 的 else 分支）
+        self.amounts = np.zeros((len(self.methods) + 1, len(self.goods)))
+        entry_method, entry_goods = [], []
+        for r, (key, goods) in enumerate(model.methods.items()):
+            for goods_name, value in goods.items():
+                g = model.goods_index[goods_name]
+                self.amounts[r, g] = value
+                entry_method.append(r)
+                entry_goods.append(g)
+        self.entry_method = np.array(entry_method, dtype=np.intp)
+        self.entry_goods = np.array(entry_goods, dtype=np.intp)
+        self.entry_amount = self.amounts[self.entry_method, self.entry_goods]
+        self.entry_group = self.method_group[self.entry_method]
+        self.entry_building = self.group_building[self.entry_group]
+        # 每个有物资的生产方式在条目中的起始位置，用于按生产方式求和
+        self.scored_methods = np.unique(self.entry_method)
+        self.entry_starts = np.searchsorted(self.entry_method, self.scored_methods)
+
+        self.balance = self._padded_methods('balance')
+        self.upgrade = self._padded_methods('upgrade')
+
+    def _padded_methods(self, pm_type: str):
+        """
+        某一type的生产方式组：(生产方式组编号, 生产方式编号矩阵)，
+        矩阵每行为一个组中该type的生产方式（按出现顺序），不足的位置为-1
+        """
+        groups = [group for group in self.groups if pm_type in group.methods_by_type]
+        width = max((len(group.methods_by_type[pm_type]) for group in groups), default=0)
+        methods = np.full((len(groups), width), -1, dtype=np.intp)
+        for i, group in enumerate(groups):
+            for j, pm in enumerate(group.methods_by_type[pm_type]):
+                methods[i, j] = self.method_index[(group.name, pm)]
+        return np.array([self.group_index[group.name] for group in groups], dtype=np.intp), methods
+
+    def dominated_balance(self):
+        """balance生产方式是否与同组其他balance生产方式都物资相同且没有投入（生成时会删去它的PM平衡块）"""
+        groups, methods = self.balance
+        dominated = np.zeros(methods.shape, dtype=bool)
+        for i, k in enumerate(groups):
+            group = self.groups[k]
+            production_methods = group.methods_by_type['balance']
+            for j, pm in enumerate(production_methods):
+                dominated[i, j] = all(self.model.same_nonnegative_goods(group.name, pm, other_pm)
+                                      for other_pm in production_methods if other_pm != pm)
+        return dominated
+
+    def work_efficiency(self, markets: Markets):
+        """building_work_efficiency：雇佣率 × (1 + building_throughput_add) × 等级，(S, B)"""
+        return markets.occupancy * (1 + markets.throughput) * markets.level
+
+    def profit_predictions(self, markets: Markets, chunk_size: int = 2048):
+        """
+        <pmg>_<pm>_profit_prediction：每个state中每个生产方式的利润预测，(S, 生产方式数)
+        先从state和市场的供需中去掉该组当前生产方式的物资（*_if_no_<pmg>），再加上该生产方式的物资，
+        按预测的价格求和后除以等级；没有该建筑的state为0
+        """
+        states = markets.market_access.shape[0]
+        profits = np.zeros((states, len(self.methods)))
+        for start in range(0, states, chunk_size):
+            chunk = slice(start, min(start + chunk_size, states))
+            profits[chunk] = self._profit_chunk(Markets(*(field[chunk] for field in markets)))
+        return profits
+
+    def _profit_chunk(self, markets: Markets):
+        efficiency = self.work_efficiency(markets)[:, self.entry_building]
+        goods = self.entry_goods
+        access = markets.market_access[:, None]
+
+        # {pmg}_{goods}_current
+        active = markets.active_pm[:, self.entry_group]
+        active = np.where(active < 0, len(self.methods), active)
+        current = self.amounts[active, goods] * efficiency
+
+        # *_if_no_<pmg>，市场部分与生成的脚本一致：扣除后整体乘以market_access
+        produced = current > 0
+        consumed = current < 0
+        state_production = markets.state_production[:, goods] - np.where(produced, current, 0)
+        state_consumption = markets.state_consumption[:, goods] + np.where(consumed, current, 0)
+        sell_orders = markets.market_sell_orders[:, goods]
+        buy_orders = markets.market_buy_orders[:, goods]
+        market_production = np.where(produced, (sell_orders - current) * access, sell_orders)
+        market_consumption = np.where(consumed, (buy_orders + current) * access, buy_orders)
+
+        # 该生产方式的产出加到生产上，投入（负数）加到消费上
+        prediction = self.entry_amount * efficiency
+        output = self.entry_amount > 0
+        state_production = np.where(output, state_production + prediction, state_production)
+        market_production = np.where(output, market_production + prediction, market_production)
+        state_consumption = np.where(output, state_consumption, state_consumption - prediction)
+        market_consumption = np.where(output, market_consumption, market_consumption - prediction)
+
+        # <goods>_price_prediction
+        impact = (markets.price_impact * markets.market_access)[:, None]
+        base_price = self.base_price[goods]
+        price = (supply_demand_price_factor(state_production, state_consumption) * (1 - impact) * base_price
+                 + supply_demand_price_factor(market_production, market_consumption) * impact * base_price)
+
+        profits = np.zeros((len(markets.market_access), len(self.methods)))
+        if len(goods):
+            profits[:, self.scored_methods] = np.add.reduceat(price * prediction, self.entry_starts, axis=1)
+        level = markets.level[:, self.group_building[self.method_group]]
+        return np.divide(profits, level, out=np.zeros_like(profits), where=level > 0)
+
+    def balance_choices(self, markets: Markets, profits, tolerance: float, prune_dominated: bool = False):
+        """
+        模拟PM_balance：balance生产方式的利润预测高于同组其他每个balance生产方式的利润预测乘以容忍倍数时可以被选中，
+        多个满足时选利润预测最高的一个（假设所有生产方式都可用）；
+        默认按完整的规则计算，prune_dominated为True时按生成程序删去物资相同且没有投入的生产方式后的脚本计算
+        返回 (生产方式组编号, 每个state选出的生产方式编号 (S, 组数)，没有选出或已经是当前生产方式时为-1)
+        """
+        groups, methods = self.balance
+        if not len(groups):
+            return groups, np.empty((len(profits), 0), dtype=np.intp)
+        candidates = np.where(methods >= 0, profits[:, np.maximum(methods, 0)], -np.inf)
+        weighted = np.where(methods >= 0, candidates * tolerance, -np.inf)
+
+        # 除自身以外的最高加权利润：最高值属于自身时取第二高的值
+        order = np.sort(weighted, axis=2)
+        best = order[:, :, -1:]
+        second = order[:, :, -2:-1] if methods.shape[1] > 1 else np.full_like(best, -np.inf)
+        best_others = np.where(weighted == best, second, best)
+
+        selectable = (methods >= 0) & (candidates > best_others)
+        if prune_dominated:
+            selectable &= ~self.dominated_balance()
+        chosen = np.argmax(np.where(selectable, candidates, -np.inf), axis=2)
+        chosen_methods = methods[np.arange(len(groups)), chosen]
+        active = markets.active_pm[:, groups]
+        managed = markets.occupancy[:, self.group_building[groups]] > MIN_OCCUPANCY
+        switch = selectable.any(axis=2) & managed & (chosen_methods != active)
+        return groups, np.where(switch, chosen_methods, -1)
+
+    def upgrade_choices(self, markets: Markets, profits, tolerance: float, jump: bool = True):
+        """
+        模拟PM_upgrade：更高级生产方式的利润预测乘以容忍倍数高于当前生产方式的利润预测时升级，
+        jump为True时在所有更高级生产方式中选加权利润最高的一个，否则只考虑下一级
+        返回值与balance_choices相同
+        """
+        groups, methods = self.upgrade
+        if not len(groups):
+            return groups, np.empty((len(profits), 0), dtype=np.intp)
+        active = markets.active_pm[:, groups]
+        # 当前生产方式的层级，不是该组的upgrade生产方式时为-1
+        tier = np.argmax(methods[None, :, :] == active[:, :, None], axis=2)
+        tier = np.where((methods[np.arange(len(groups)), tier] == active) & (active >= 0), tier, -1)
+
+        candidates = np.where(methods >= 0, profits[:, np.maximum(methods, 0)], -np.inf)
+        current_profit = np.take_along_axis(candidates, np.maximum(tier, 0)[:, :, None], axis=2)
+        weighted = candidates * tolerance
+        levels = np.arange(methods.shape[1])
+        higher = (levels > tier[:, :, None]) & (tier[:, :, None] >= 0) & (methods >= 0)
+        if not jump:
+            higher &= levels == tier[:, :, None] + 1
+        selectable = higher & (weighted > current_profit)
+        chosen = np.argmax(np.where(selectable, weighted, -np.inf), axis=2)
+        managed = markets.occupancy[:, self.group_building[groups]] > MIN_OCCUPANCY
+        upgrade = selectable.any(axis=2) & managed
+        return groups, np.where(upgrade, methods[np.arange(len(groups)), chosen], -1)
+
+    def building_profit_weight(self, markets: Markets, profits, construction_costs: Dict[str, float],
+                               profit_weights: Optional[Dict[str, float]] = None,
+                               use_construction_mult: bool = True):
+        """
+        cnm_building_profit_weight：每级利润 / building_construction_cost × (1 + state_construction_mult) × get_building_profit_weight，(S, B)
+        每级利润（weekly_profit / level）取建筑各生产方式组当前生产方式的利润预测之和；
+        construction_costs为 required_construction -> 建造点数，未列出的建筑为0
+        """
+        profit_per_level = np.zeros(markets.level.shape)
+        active = markets.active_pm
+        for k in range(len(self.groups)):
+            current = np.where(active[:, k] >= 0, profits[np.arange(len(active)), np.maximum(active[:, k], 0)], 0)
+            profit_per_level[:, self.group_building[k]] += current
+
+        costs = np.array([float(construction_costs.get(self.model.building_construction_costs.get(building, ''), 0))
+                          for building in self.buildings])
+        weights = np.array([float((profit_weights or {}).get(building, 1)) for building in self.buildings])
+        weight = np.divide(profit_per_level, costs, out=np.zeros_like(profit_per_level), where=costs > 0) * weights
+        if use_construction_mult:
+            weight *= (1 + markets.construction_mult)[:, None]
+        return weight
+
+
+def synthetic_markets(economy: EconomyModel, states: int, seed: int = 0) -> Markets:
+    """
+    随机生成一批state：供需按物资基础价格以对数正态分布围绕同一水平波动，每种建筑随机等级和雇佣率，
+    每个生产方式组随机选一个当前生产方式
+    """
+    _require_numpy()
+    rng = np.random.default_rng(seed)
+    goods = len(economy.goods)
+    buildings = len(economy.buildings)
+
+    state_production = rng.lognormal(math.log(50), 1.0, (states, goods))
+    state_consumption = rng.lognormal(math.log(50), 1.0, (states, goods))
+    market_sell_orders = state_production * rng.lognormal(math.log(20), 0.5, (states, goods))
+    market_buy_orders = state_consumption * rng.lognormal(math.log(20), 0.5, (states, goods))
+
+    level = np.where(rng.random((states, buildings)) < 0.7, rng.integers(1, 31, (states, buildings)), 0)
+    occupancy = np.where(level > 0, rng.uniform(0.0, 1.0, (states, buildings)), 0.0)
+
+    active_pm = np.full((states, len(economy.groups)), -1, dtype=np.intp)
+    for k, group in enumerate(economy.groups):
+        methods = [economy.method_index[(group.name, pm)] for pm in group.production_methods]
+        active_pm[:, k] = rng.choice(methods, states)
+    active_pm[level[:, economy.group_building] == 0] = -1
+
+    return Markets(
+        state_production=state_production,
+        state_consumption=state_consumption,
+        market_sell_orders=market_sell_orders,
+        market_buy_orders=market_buy_orders,
+        market_access=rng.uniform(0.3, 1.0, states),
+        price_impact=rng.uniform(0.5, 0.9, states),
+        construction_mult=rng.uniform(0.0, 0.5, states),
+        occupancy=occupancy,
+        level=level.astype(float),
+        throughput=rng.uniform(0.0, 0.5, (states, buildings)),
+        active_pm=active_pm,
+    )
+
+
+def reference_profit(economy: EconomyModel, markets: Markets, state: int, method: int) -> float:
+    """逐个物资按生成脚本的计算顺序求一个生产方式的利润预测，用于检查向量化计算的结果"""
+    pmg, pm = economy.methods[method]
+    group = economy.group_index[pmg]
+    b = economy.group_building[group]
+    level = markets.level[state, b]
+    if level <= 0:
+        return 0.0
+    efficiency = markets.occupancy[state, b] * (1 + markets.throughput[state, b]) * level
+    access = markets.market_access[state]
+    impact = markets.price_impact[state] * access
+    active = markets.active_pm[state, group]
+
+    def factor(production, consumption):
+        value = (production - consumption) / max(min(production, consumption), 0.1) * -0.75
+        return min(max(value, -0.75), 0.75) + 1
+
+    total = 0.0
+    for goods_name, amount in economy.model.methods[(pmg, pm)].items():
+        g = economy.model.goods_index[goods_name]
+        current = economy.amounts[active, g] * efficiency if active >= 0 else 0.0
+        state_production = markets.state_production[state, g] - (current if current > 0 else 0)
+        state_consumption = markets.state_consumption[state, g] + (current if current < 0 else 0)
+        market_production = markets.market_sell_orders[state, g]
+        market_consumption = markets.market_buy_orders[state, g]
+        if current > 0:
+            market_production = (market_production - current) * access
+        if current < 0:
+            market_consumption = (market_consumption + current) * access
+
+        prediction = amount * efficiency
+        if amount > 0:
+            state_production += prediction
+            market_production += prediction
+        else:
+            state_consumption -= prediction
+            market_consumption -= prediction
+        base_price = economy.base_price[g]
+        price = (factor(state_production, state_consumption) * (1 - impact) * base_price
+                 + factor(market_production, market_consumption) * impact * base_price)
+        total += price * prediction
+    return total / level
+
+
+def sweep_tolerances(economy: EconomyModel, markets: Markets, profits, tolerances: Sequence[float],
+                     jump: bool = True, prune_dominated: bool = False) -> List[dict]:
+    """
+    对每个容忍倍数模拟一次PM管理，统计切换/升级的比例和切换带来的利润预测变化
+    利润预测与容忍倍数无关，只计算一次；
+    PM平衡同时按完整的规则和生成程序删减后的脚本各选一次，pruning_divergence为两者选择不同的次数（应为0）
+    """
+    results = []
+    for tolerance in tolerances:
+        result = {'tolerance': tolerance}
+        groups, unpruned = economy.balance_choices(markets, profits, tolerance)
+        _, pruned = economy.balance_choices(markets, profits, tolerance, prune_dominated=True)
+        balance = (groups, pruned if prune_dominated else unpruned)
+        for label, (groups, choices) in (
+                ('balance', balance),
+                ('upgrade', economy.upgrade_choices(markets, profits, tolerance, jump))):
+            active = markets.active_pm[:, groups]
+            managed = (active >= 0) & (markets.occupancy[:, economy.group_building[groups]] > MIN_OCCUPANCY)
+            changed = choices >= 0
+            rows = np.arange(len(profits))[:, None]
+            gain = np.where(changed, profits[rows, np.maximum(choices, 0)] - profits[rows, np.maximum(active, 0)], 0)
+            result[label] = {
+                'managed': int(managed.sum()),
+                'changed': int(changed.sum()),
+                'rate': float(changed.sum() / max(managed.sum(), 1)),
+                'mean_gain': float(gain.sum() / max(changed.sum(), 1)),
+                'worse': int((gain < 0).sum()),
+            }
+        result['balance']['pruning_divergence'] = int((unpruned != pruned).sum())
+        results.append(result)
+    return results
+
+
+def load_economy(records, goods_file: str) -> EconomyModel:
+    with open(goods_file, 'r', encoding='utf-8') as f:
+        goods, goods_costs = parse_goods_file(f.read())
+    return EconomyModel(PMModel.build(records, goods, goods_costs))
+
+
+def load_records(args):
+    """与生成程序相同：读取CSV，或运行分析程序并按整理好的表格筛选"""
+    if not args.from_analyzer:
+        return read_pm_records_csv(args.csv)
+    records = records_from_analyzer(args.from_analyzer, jobs=args.jobs, use_cache=not args.no_cache)
+    if not args.no_selection:
+        if os.path.exists(args.selection):
+            records = apply_selection(records, read_pm_records_csv(args.selection))
+        else:
+            print(f"警告：找不到筛选表格 {args.selection}，使用分析程序的全部结果")
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在合成市场上离线模拟OGAS的利润预测和PM管理")
+    parser.add_argument('--csv', default=DEFAULT_CSV, help=f"生产方式表格，需要带有balance/upgrade的type，默认{DEFAULT_CSV}")
+    parser.add_argument('--from-analyzer', nargs='?', const=DEFAULT_ANALYZER_DIR, metavar='DIR',
+                        help=f"直接在内存中运行Victoria3 building PM分析程序取得数据，不再读取CSV（默认目录 {DEFAULT_ANALYZER_DIR}）")
+    parser.add_argument('--selection', default=DEFAULT_CSV,
+                        help=f"配合--from-analyzer使用：按整理好的表格筛选建筑和生产方式组，并沿用其中的顺序和type，默认{DEFAULT_CSV}")
+    parser.add_argument('--no-selection', action='store_true',
+                        help="配合--from-analyzer使用：不做筛选，使用分析程序的全部结果（没有type，只能检查利润预测）")
+    parser.add_argument('--jobs', '-j', type=int, default=1, help="分析程序并行解析文件的进程数")
+    parser.add_argument('--no-cache', action='store_true', help="分析程序不使用解析缓存")
+    parser.add_argument('--goods', default='goods/00_goods.txt', help="物资文件")
+    parser.add_argument('--states', type=int, default=5000, help="合成state的数量")
+    parser.add_argument('--seed', type=int, default=0, help="随机数种子")
+    parser.add_argument('--tolerance', type=float, nargs='+', default=list(DEFAULT_TOLERANCES),
+                        help="要比较的容忍倍数（cnm_upgrade_tolerance_pm_manager）")
+    parser.add_argument('--upgrade-ladder', action='store_true', help="模拟逐级升级（与生成程序的同名选项对应）")
+    parser.add_argument('--prune-dominated-pms', action='store_true',
+                        help="按删减后的PM平衡脚本统计（不可被选中的物资相同且没有投入的生产方式被删去；"
+                             "生成程序默认删减，使用--keep-dominated-pms时不删减），默认按完整的规则统计")
+    parser.add_argument('--check', type=int, default=200, metavar='N',
+                        help="随机抽取N个利润预测与逐个物资的计算结果比较，0为不检查")
+    args = parser.parse_args()
+
+    try:
+        economy = load_economy(load_records(args), args.goods)
+    except ImportError as e:
+        print(f"错误：{e}")
+        return
+    except FileNotFoundError as e:
+        print(f"错误：找不到输入文件 {e.filename}")
+        return
+    except Exception as e:
+        print(f"读取生产方式数据时发生错误：{e}")
+        return
+
+    print(f"{len(economy.buildings)} 个建筑类型，{len(economy.groups)} 个生产方式组，{len(economy.methods)} 个生产方式，"
+          f"{len(economy.entry_method)} 个利润预测项")
+    if not len(economy.balance[0]) and not len(economy.upgrade[0]):
+        print("警告：数据中没有type为balance或upgrade的生产方式组，PM平衡和升级的模拟结果都为0")
+
+    start = time.perf_counter()
+    markets = synthetic_markets(economy, args.states, args.seed)
+    generated = time.perf_counter() - start
+
+    start = time.perf_counter()
+    profits = economy.profit_predictions(markets)
+    scored = time.perf_counter() - start
+    print(f"生成 {args.states} 个state：{generated * 1000:.1f} ms；"
+          f"计算利润预测：{scored * 1000:.1f} ms（{args.states * len(economy.methods) / max(scored, 1e-9) / 1e6:.2f} M个/秒）")
+
+    if args.check:
+        rng = np.random.default_rng(args.seed + 1)
+        samples = zip(rng.integers(0, args.states, args.check), rng.integers(0, len(economy.methods), args.check))
+        error = max((abs(profits[s, r] - reference_profit(economy, markets, s, r)) for s, r in samples), default=0.0)
+        print(f"与逐个物资计算的最大误差：{error:.3g}")
+
+    start = time.perf_counter()
+    results = sweep_tolerances(economy, markets, profits, args.tolerance,
+                               jump=not args.upgrade_ladder, prune_dominated=args.prune_dominated_pms)
+    swept = time.perf_counter() - start
+
+    print(f"容忍倍数比较（{len(args.tolerance)} 个设置，{swept * 1000:.1f} ms）")
+    print("=" * 50)
+    print(f"{'容忍倍数':<10}{'平衡切换率':>12}{'平均利润变化':>14}{'变差':>8}{'剪枝差异':>8}"
+          f"{'升级率':>10}{'平均利润变化':>14}{'变差':>8}")
+    for result in results:
+        balance, upgrade = result['balance'], result['upgrade']
+        print(f"{result['tolerance']:<10.2f}{balance['rate']:>12.2%}{balance['mean_gain']:>14.2f}{balance['worse']:>8}"
+              f"{balance['pruning_divergence']:>12}"
+              f"{upgrade['rate']:>10.2%}{upgrade['mean_gain']:>14.2f}{upgrade['worse']:>8}")
+    if any(result['balance']['pruning_divergence'] for result in results):
+        print("警告：生成程序删减后的PM平衡脚本与完整规则的选择不同，请使用--keep-dominated-pms生成")
+
+
+if __name__ == "__main__":
+    main()
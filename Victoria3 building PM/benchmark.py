@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+解析器性能对比程序
+在同一份游戏数据（本体+mod）上，对比旧的逐块正则提取与新的语法解析器（不使用缓存）的耗时和提取到的定义数量；
+使用 --save 或 --synthetic-save 时改为测试明文存档的流式读取吞吐量
+"""
+
+import argparse
+import os
+import random
+import re
+import tempfile
+import time
+
+from main import Victoria3DataAnalyzer
+from paradox_parser import parse
+from save_reader import SaveReader
+
+def _read_script(filepath):
+    with open(filepath, 'r', encoding='utf-8') as f:
+        content = f.read()
+    if content.startswith('\ufeff'):
+        content = content[1:]
+    return content
+
+class LegacyRegexAnalyzer:
+    """旧版基于正则表达式的提取逻辑，仅保留用于性能和结果对比"""
+
+    block_pattern = r'^(\w+)\s*=\s*\{([\s\S]*?)^\}$'
+
+    def __init__(self, base_path="."):
+        self.base_path = base_path
+        self.buildings_hierarchy = []
+        self.production_method_groups_data = {}
+        self.goods_relations = {}
+
+    def extract_buildings_hierarchy(self):
+        pmg_dir = os.path.join(self.base_path, "production_method_groups")
+        for filename in os.listdir(pmg_dir):
+            if filename.endswith('.txt') and not filename.startswith('.'):
+                content = _read_script(os.path.join(pmg_dir, filename))
+                for pmg_name, pmg_content in re.findall(self.block_pattern, content, re.MULTILINE):
+                    pm_match = re.search(r'production_methods\s*=\s*\{([^}]*)\}', pmg_content, re.DOTALL)
+                    if pm_match:
+                        self.production_method_groups_data[pmg_name] = re.findall(r'(\w+)', pm_match.group(1))
+
+        buildings_dir = os.path.join(self.base_path, "buildings")
+        for filename in sorted(os.listdir(buildings_dir)):
+            if filename.endswith('.txt') and not filename.startswith('.'):
+                content = _read_script(os.path.join(buildings_dir, filename))
+                for building_name, building_content in re.findall(self.block_pattern, content, re.MULTILINE):
+                    re.search(r'required_construction\s*=\s*(\w+)', building_content)
+                    pmg_match = re.search(r'production_method_groups\s*=\s*\{([^}]*)\}', building_content, re.DOTALL)
+                    if pmg_match:
+                        for pmg_name in re.findall(r'(\w+)', pmg_match.group(1)):
+                            if pmg_name in self.production_method_groups_data:
+                                self.buildings_hierarchy.append((building_name, pmg_name))
+
+    def analyze_production_method_goods(self):
+        pm_dir = os.path.join(self.base_path, "production_methods")
+        for filename in os.listdir(pm_dir):
+            if filename.endswith('.txt') and not filename.startswith('.'):
+                content = _read_script(os.path.join(pm_dir, filename))
+                for pm_name, pm_content in re.findall(self.block_pattern, content, re.MULTILINE):
+                    self.goods_relations[pm_name] = {
+                        "input": {g: -int(v) for g, v in re.findall(r'goods_input_(\w+)_add\s*=\s*(-?\d+)', pm_content)},
+                        "output": {g: int(v) for g, v in re.findall(r'goods_output_(\w+)_add\s*=\s*(-?\d+)', pm_content)}
+                    }
+
+def _time_best(function, repeat):
+    """重复执行取最短耗时，减少系统抖动的影响"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def _run(analyzer_class, base_path):
+    analyzer = analyzer_class(base_path)
+    analyzer.extract_buildings_hierarchy()
+    analyzer.analyze_production_method_goods()
+    return analyzer
+
+def write_synthetic_save(filepath, megabytes, seed=0):
+    """
+    生成结构与明文存档相同的合成存档：state、市场、建筑各一个database，
+    其余大部分为读取时需要整体跳过的数据（人口），直到文件达到指定大小
+    """
+    rng = random.Random(seed)
+    goods_count = 50
+    target = int(megabytes * 1e6)
+
+    def goods_block(indent):
+        lines = [f"{indent}goods={{\n"]
+        for goods_id in range(goods_count):
+            lines.append(f"{indent}\t{goods_id}={{ supply={rng.uniform(0, 5000):.3f} "
+                         f"demand={rng.uniform(0, 5000):.3f} price={rng.uniform(5, 100):.2f} }}\n")
+        lines.append(f"{indent}}}\n")
+        return ''.join(lines)
+
+    with open(filepath, 'w', encoding='utf-8') as f:
+        f.write("SAV0103000000000000000000\nmeta_data={\n\tversion=\"1.7.0\"\n}\ndate=1836.1.1\n")
+        f.write("states={\n\tdatabase={\n")
+        for state_id in range(800):
+            f.write(f"\t\t{state_id}={{\n\t\t\tcountry={rng.randrange(150)}\n\t\t\tmarket={rng.randrange(60)}\n"
+                    f"\t\t\tregion=\"STATE_{state_id}\"\n" + goods_block("\t\t\t")
+                    + "\t\t\tpop_statistics={ population_lower_strata=12345 population_middle_strata=2345 }\n\t\t}\n")
+        f.write("\t\t800=none\n\t}\n}\n")
+
+        f.write("market_manager={\n\tdatabase={\n")
+        for market_id in range(60):
+            f.write(f"\t\t{market_id}={{\n\t\t\towner={market_id}\n" + goods_block("\t\t\t") + "\t\t}\n")
+        f.write("\t}\n}\n")
+
+        f.write("building_manager={\n\tdatabase={\n")
+        for building_id in range(20000):
+            f.write(f"\t\t{building_id}={{\n\t\t\tbuilding=\"building_{rng.randrange(80)}\"\n"
+                    f"\t\t\tstate={rng.randrange(800)}\n\t\t\tlevel={rng.randrange(1, 30)}\n"
+                    f"\t\t\toccupancy={rng.random():.4f}\n\t\t\tstaffing={rng.uniform(0, 50000):.1f}\n"
+                    f"\t\t\tproduction_methods={{ \"pm_{rng.randrange(300)}\" \"pm_{rng.randrange(300)}\" }}\n"
+                    f"\t\t\tcash_reserves={rng.uniform(0, 1e5):.2f}\n"
+                    f"\t\t\thistory={{ {' '.join(f'{rng.random():.3f}' for _ in range(20))} }}\n\t\t}}\n")
+        f.write("\t}\n}\n")
+
+        f.write("pops={\n\tdatabase={\n")
+        pop_id = 0
+        while f.tell() < target:
+            f.write(f"\t\t{pop_id}={{\n\t\t\ttype=\"laborers\"\n\t\t\tsize={rng.randrange(1000, 100000)}\n"
+                    f"\t\t\tlocation={rng.randrange(800)}\n\t\t\tworkplace={rng.randrange(20000)}\n"
+                    f"\t\t\tbudget={{ wealth={rng.randrange(1, 99)} needs={{ {' '.join(str(rng.randrange(9)) for _ in range(30))} }} }}\n"
+                    "\t\t}\n")
+            pop_id += 1
+        f.write("\t}\n}\n")
+
+
+def benchmark_save(filepath, repeat, full_parse):
+    """测试存档流式读取的吞吐量，full_parse时对比把整个存档解析为语法树的耗时"""
+    megabytes = os.path.getsize(filepath) / 1e6
+    reader = SaveReader()
+    elapsed, tables = _time_best(lambda: reader.read(filepath), repeat)
+
+    print("明文存档读取吞吐量")
+    print("=" * 50)
+    print(f"存档大小：{megabytes:.1f} MB，重复 {repeat} 次取最短耗时")
+    print(f"{'':<12}{'耗时(ms)':>12}{'MB/s':>10}{'解析对象':>10}")
+    print(f"{'流式读取':<12}{elapsed * 1000:>12.1f}{megabytes / elapsed:>10.1f}{reader.objects_parsed:>10}")
+    if full_parse:
+        def parse_whole():
+            with open(filepath, 'r', encoding='utf-8') as f:
+                return parse(f.read())
+        parse_time, _ = _time_best(parse_whole, 1)
+        print(f"{'完整语法树':<12}{parse_time * 1000:>12.1f}{megabytes / parse_time:>10.1f}")
+        print(f"加速比：{parse_time / elapsed:.2f}x")
+    for name, table in tables.items():
+        print(f"{name:<32}{len(table):>10} 行")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比正则提取与语法解析器的性能")
+    parser.add_argument('--base-path', default='.', help="游戏数据所在目录")
+    parser.add_argument('--repeat', type=int, default=5, help="重复次数，取最短耗时")
+    parser.add_argument('--save', help="测试读取指定明文存档的吞吐量")
+    parser.add_argument('--synthetic-save', type=float, metavar='MB',
+                        help="生成指定大小的合成明文存档并测试读取吞吐量")
+    parser.add_argument('--full-parse', action='store_true', help="同时测试把整个存档解析为语法树的耗时（内存占用很大）")
+    args = parser.parse_args()
+
+    if args.save:
+        benchmark_save(args.save, args.repeat, args.full_parse)
+        return
+    if args.synthetic_save:
+        fd, save_file = tempfile.mkstemp(prefix='ogas_synthetic_', suffix='.v3')
+        os.close(fd)
+        try:
+            write_synthetic_save(save_file, args.synthetic_save)
+            benchmark_save(save_file, args.repeat, args.full_parse)
+        finally:
+            os.remove(save_file)
+        return
+
+    source_bytes = 0
+    for subdir in ("buildings", "production_method_groups", "production_methods"):
+        directory = os.path.join(args.base_path, subdir)
+        source_bytes += sum(os.path.getsize(os.path.join(directory, f))
+                            for f in os.listdir(directory) if f.endswith('.txt'))
+
+    legacy_time, legacy = _time_best(lambda: _run(LegacyRegexAnalyzer, args.base_path), args.repeat)
+    parser_time, current = _time_best(lambda: _run(Victoria3DataAnalyzer, args.base_path), args.repeat)
+
+    print("解析器性能对比（extract_buildings_hierarchy + analyze_production_method_goods）")
+    print("=" * 50)
+    print(f"数据量：{source_bytes / 1024:.1f} KB，重复 {args.repeat} 次取最短耗时")
+    print(f"{'':<12}{'耗时(ms)':>12}{'MB/s':>10}{'层级关系':>10}{'生产方法组':>10}{'生产方法':>10}")
+    for label, elapsed, analyzer in (("正则提取", legacy_time, legacy), ("语法解析", parser_time, current)):
+        print(f"{label:<12}{elapsed * 1000:>12.1f}{source_bytes / elapsed / 1e6:>10.2f}"
+              f"{len(analyzer.buildings_hierarchy):>10}{len(analyzer.production_method_groups_data):>10}"
+              f"{len(analyzer.goods_relations):>10}")
+    print(f"耗时比（语法解析/正则提取）：{parser_time / legacy_time:.2f}x")
+
+    dropped_pms = sorted(set(current.goods_relations) - set(legacy.goods_relations))
+    if dropped_pms:
+        print(f"正则提取遗漏的生产方法 {len(dropped_pms)} 个：{', '.join(dropped_pms[:10])}"
+              + (" ..." if len(dropped_pms) > 10 else ""))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生产方法×物资矩阵
+表格中每一行（建筑→生产方法组→生产方法）对应矩阵的一行，每种物资对应一列，
+数值以float32稠密数组保存，导出CSV/xlsx/Parquet时整体向量化处理，也可以直接在内存中交给下游工具使用
+"""
+
+from typing import Dict, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 表格中物资列之前的描述列
+ROW_HEADERS = ["buildings", "production_method_groups", "production_methods", "type", "required_construction"]
+
+Row = Tuple[str, str, str, str, str]
+
+
+class GoodsMatrix:
+    def __init__(self, goods: List[str], rows: List[Row], values):
+        self.goods = goods  # 物资列名，顺序与goods文件一致
+        self.goods_index = {name: i for i, name in enumerate(goods)}
+        self.rows = rows  # 每行的 (建筑, 生产方法组, 生产方法, 类型, required_construction)
+        self.values = values  # shape为 (行数, 物资数) 的float32数组，输入为负、输出为正
+
+    @classmethod
+    def from_relations(cls, goods: List[str], rows: List[Row],
+                       goods_relations: Dict[str, Dict[str, Dict[str, float]]]) -> 'GoodsMatrix':
+        """
+        由生产方法的物资关系构建矩阵
+        先为每个生产方法构建一次物资向量，再按表格行对应的生产方法整体取行，不再逐格查字典
+        """
+        if np is None:
+            raise ImportError("构建物资矩阵需要numpy，请先执行 pip install numpy")
+
+        goods_index = {name: i for i, name in enumerate(goods)}
+        pm_index = {}
+        coordinates = []
+        numbers = []
+        for pm_name, relation in goods_relations.items():
+            pm_row = pm_index.setdefault(pm_name, len(pm_index))
+            for direction in ("input", "output"):
+                for goods_name, value in relation[direction].items():
+                    column = goods_index.get(goods_name)
+                    if column is not None:
+                        coordinates.append((pm_row, column))
+                        numbers.append(value)
+
+        # 最后一行全为0，供没有物资关系的生产方法使用
+        pm_values = np.zeros((len(pm_index) + 1, len(goods)), dtype=np.float32)
+        if coordinates:
+            pm_rows, columns = np.array(coordinates, dtype=np.intp).T
+            # 同一物资既有输入又有输出时取净影响
+            np.add.at(pm_values, (pm_rows, columns), np.array(numbers, dtype=np.float32))
+
+        missing = len(pm_index)
+        row_pms = np.fromiter((pm_index.get(row[2], missing) for row in rows), dtype=np.intp, count=len(rows))
+        return cls(goods, rows, pm_values[row_pms])
+
+    @property
+    def headers(self) -> List[str]:
+        return ROW_HEADERS + self.goods
+
+    def column(self, goods_name: str):
+        """返回某种物资的整列数据"""
+        return self.values[:, self.goods_index[goods_name]]
+
+    def nonzero_goods(self, row: int) -> Dict[str, float]:
+        """返回某一行中不为0的物资及数值"""
+        columns = np.flatnonzero(self.values[row])
+        return {self.goods[column]: self.values[row, column].item() for column in columns}
+
+    def to_csr(self):
+        """
+        转换为CSR稀疏格式：安装了scipy时返回scipy.sparse.csr_matrix，
+        否则返回 (data, indices, indptr) 三个数组
+        """
+        try:
+            from scipy.sparse import csr_matrix
+            return csr_matrix(self.values)
+        except ImportError:
+            rows, columns = np.nonzero(self.values)
+            indptr = np.zeros(len(self.rows) + 1, dtype=np.intp)
+            np.cumsum(np.bincount(rows, minlength=len(self.rows)), out=indptr[1:])
+            return self.values[rows, columns], columns, indptr
+
+    def formatted_cells(self):
+        """将数值整体格式化为字符串，0显示为空（整数不带小数点）"""
+        cells = np.char.mod('%g', self.values)
+        return np.where(self.values != 0, cells, '')
+
+    def table_rows(self) -> List[List[str]]:
+        """返回与原表格相同的字符串行"""
+        cells = self.formatted_cells().tolist()
+        return [list(row) + row_cells for row, row_cells in zip(self.rows, cells)]
+
+    def to_csv(self, filename: str):
+        """导出CSV文件"""
+        with open(filename, 'w', encoding='utf-8-sig') as f:
+            f.write(','.join(self.headers) + '\n')
+            f.writelines(','.join(row) + '\n' for row in self.table_rows())
+
+    def to_dataframe(self):
+        """转换为pandas DataFrame，0转换为空值"""
+        import pandas as pd
+
+        frame = pd.DataFrame(self.rows, columns=ROW_HEADERS)
+        goods_frame = pd.DataFrame(np.where(self.values != 0, self.values, np.nan), columns=self.goods)
+        return pd.concat([frame, goods_frame], axis=1)
+
+    def to_xlsx(self, filename: str):
+        """导出xlsx文件（需要pandas和openpyxl）"""
+        self.to_dataframe().to_excel(filename, index=False)
+
+    def to_parquet(self, filename: str):
+        """导出Parquet文件（需要pandas和pyarrow）"""
+        self.to_dataframe().to_parquet(filename, index=False)
@@ -5,38 +5,242 @@
 用于分析建筑、生产方法组、生产方法与物资之间的关系
 """
 
+import argparse
 import os
-import re
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
 from typing import List, Dict, Set, Tuple
 
+from paradox_parser import Block, parse_file, to_number, top_level_definitions
+from parse_cache import ParseCache
+from goods_matrix import GoodsMatrix, ROW_HEADERS, np
+from stage_profiler import StageProfiler
+
+# 单文件解析函数的版本：修改任何parse_*_file函数的输出时递增，使旧的解析缓存失效
+PARSER_VERSION = 1
+
+# 覆盖前缀的处理方式：INJECT类合并到已有定义，其余情况整体替换已有定义
+# 定义不存在时，只有无前缀和*_OR_CREATE前缀会新建定义（TRY_前缀直接忽略）
+INJECT_PREFIXES = ('INJECT', 'TRY_INJECT', 'INJECT_OR_CREATE')
+CREATE_PREFIXES = ('', 'INJECT_OR_CREATE', 'REPLACE_OR_CREATE')
+
+def list_script_files(directory: str) -> List[str]:
+    """按游戏加载顺序（文件名顺序）列出目录下的脚本文件"""
+    return sorted(f for f in os.listdir(directory)
+                  if f.endswith('.txt') and not f.startswith('.'))
+
+def _name_list(block) -> List[str]:
+    """提取列表块中的名字，例如 production_methods = { pm_a pm_b }"""
+    if not isinstance(block, Block):
+        return []
+    return [value for value in block.values() if isinstance(value, str)]
+
+def parse_goods_file(filepath: str) -> List[Tuple[str, str, dict]]:
+    """解析物资文件，返回 (覆盖前缀, 物资名, 数据) 列表"""
+    definitions = []
+    for prefix, name, block in top_level_definitions(parse_file(filepath)):
+        data = {}
+        cost = block.get('cost')
+        if isinstance(cost, str):
+            data['cost'] = cost
+        definitions.append((prefix, name, data))
+    return definitions
+
+def parse_buildings_file(filepath: str) -> List[Tuple[str, str, dict]]:
+    """解析建筑文件，返回 (覆盖前缀, 建筑名, 数据) 列表"""
+    definitions = []
+    for prefix, name, block in top_level_definitions(parse_file(filepath)):
+        data = {}
+        construction_cost = block.get('required_construction')
+        if isinstance(construction_cost, str):
+            data['required_construction'] = construction_cost
+        pmg_block = block.get('production_method_groups')
+        if isinstance(pmg_block, Block):
+            data['production_method_groups'] = _name_list(pmg_block)
+        definitions.append((prefix, name, data))
+    return definitions
+
+def parse_production_method_groups_file(filepath: str) -> List[Tuple[str, str, dict]]:
+    """解析生产方法组文件，返回 (覆盖前缀, 生产方法组名, 数据) 列表"""
+    definitions = []
+    for prefix, name, block in top_level_definitions(parse_file(filepath)):
+        data = {}
+        texture = block.get('texture')
+        if isinstance(texture, str):
+            data['texture'] = texture
+        pm_block = block.get('production_methods')
+        if isinstance(pm_block, Block):
+            data['production_methods'] = _name_list(pm_block)
+        definitions.append((prefix, name, data))
+    return definitions
+
+def parse_production_methods_file(filepath: str) -> List[Tuple[str, str, dict]]:
+    """解析生产方法文件，返回 (覆盖前缀, 生产方法名, 数据) 列表"""
+    definitions = []
+    for prefix, name, block in top_level_definitions(parse_file(filepath)):
+        data = {}
+        modifiers = block.get('building_modifiers')
+        if isinstance(modifiers, Block):
+            input_goods = {}
+            output_goods = {}
+            # 在building_modifiers的所有层级中查找物资输入输出及数值
+            for key, _, value in modifiers.walk():
+                if not key.endswith('_add'):
+                    continue
+                number = to_number(value)
+                if number is None:
+                    continue
+                if key.startswith('goods_input_'):
+                    # 输入物资：转换正负号（负值变正值，正值变负值）
+                    input_goods[key[len('goods_input_'):-len('_add')]] = -number
+                elif key.startswith('goods_output_'):
+                    # 输出物资：直接使用原始值
+                    output_goods[key[len('goods_output_'):-len('_add')]] = number
+            data['input'] = input_goods
+            data['output'] = output_goods
+        definitions.append((prefix, name, data))
+    return definitions
+
+def _inject_definition(existing: dict, patch: dict) -> dict:
+    """INJECT合并：列表字段追加，其余字段覆盖"""
+    merged = dict(existing)
+    for key, value in patch.items():
+        if isinstance(value, list) and isinstance(merged.get(key), list):
+            merged[key] = merged[key] + value
+        else:
+            merged[key] = value
+    return merged
+
+def format_goods_value(value) -> str:
+    """格式化物资数值：整数不带小数点，小数保留有效数字"""
+    if value == int(value):
+        return str(int(value))
+    return f"{value:g}"
+
+def merge_definitions(file_results: List[List[Tuple[str, str, dict]]]) -> Dict[str, dict]:
+    """
+    按文件加载顺序合并所有定义，遵循游戏的覆盖规则：
+    同名定义后者替换前者，REPLACE替换已有定义，INJECT合并到已有定义，
+    TRY_前缀在定义不存在时忽略
+    """
+    merged = {}
+    for definitions in file_results:
+        for prefix, name, data in definitions:
+            if name in merged:
+                if prefix in INJECT_PREFIXES:
+                    merged[name] = _inject_definition(merged[name], data)
+                else:
+                    merged[name] = data
+            elif prefix in CREATE_PREFIXES:
+                merged[name] = data
+    return merged
+
+# 默认的解析缓存文件
+DEFAULT_CACHE_FILE = ".parse_cache.pickle"
+
+# --profile未指定文件时的性能报告文件
+DEFAULT_PROFILE_FILE = "profile_report.json"
+
+# 需要解析的目录及对应的单文件解析函数
+SCRIPT_DIRECTORIES = (
+    ("goods", parse_goods_file),
+    ("production_method_groups", parse_production_method_groups_file),
+    ("buildings", parse_buildings_file),
+    ("production_methods", parse_production_methods_file),
+)
+
 class Victoria3DataAnalyzer:
-    def __init__(self, base_path: str = "."):
+    def __init__(self, base_path: str = ".", jobs: int = 1, cache_file: str = None,
+                 profiler: StageProfiler = None):
         self.base_path = base_path
+        self.jobs = jobs if jobs > 0 else (os.cpu_count() or 1)  # 并行解析的进程数，1为串行
+        self.cache = ParseCache(cache_file, PARSER_VERSION) if cache_file else None  # 单文件解析结果的磁盘缓存
+        self._pending_files = {}  # 并行模式下预先取得的结果：文件路径 -> (是否来自缓存, 解析结果或进程池任务)
         self.goods_list = []
         self.buildings_hierarchy = []  # 存储建筑→生产方法组→生产方法的层级关系
         self.production_method_groups_data = {}  # 存储生产方法组数据
         self.production_method_groups_texture = {}  # 存储生产方法组的texture信息
         self.goods_relations = {}  # 存储生产方法的物资关系
+        self.building_construction_costs = {}  # 存储建筑的required_construction值
+        self.profiler = profiler  # 分阶段性能记录，为None时不记录
         
+    def _stage(self, name: str):
+        """性能记录中的一个阶段，未开启记录时为空的上下文"""
+        return self.profiler.stage(name) if self.profiler is not None else nullcontext()
+    
+    def _count_output_file(self, record, filename: str):
+        if record is not None and os.path.exists(filename):
+            self.profiler.count_output_files(record, [filename])
+    
+    @contextmanager
+    def _parallel_ingestion(self):
+        """并行模式下把所有目录的文件一次性提交给进程池，各阶段再按文件顺序取回结果"""
+        if self.jobs <= 1:
+            yield
+            return
+        
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            for subdir, parse_function in SCRIPT_DIRECTORIES:
+                directory = os.path.join(self.base_path, subdir)
+                if not os.path.isdir(directory):
+                    continue
+                for filename in list_script_files(directory):
+                    filepath = os.path.join(directory, filename)
+                    # 命中缓存的文件不需要提交
+                    if self.cache is not None:
+                        hit, result = self.cache.lookup(filepath, parse_function.__name__)
+                        if hit:
+                            self._pending_files[filepath] = (True, result)
+                            continue
+                    self._pending_files[filepath] = (False, executor.submit(parse_function, filepath))
+            try:
+                yield
+            finally:
+                for from_cache, pending in self._pending_files.values():
+                    if not from_cache:
+                        pending.cancel()
+                self._pending_files = {}
+    
+    def _parse_directory(self, directory: str, parse_function) -> Dict[str, dict]:
+        """解析目录下的所有脚本文件，并按文件顺序和覆盖规则合并（与是否并行无关，结果完全一致）"""
+        kind = parse_function.__name__
+        profiler = self.profiler
+        file_results = []
+        for filename in list_script_files(directory):
+            filepath = os.path.join(directory, filename)
+            pending = self._pending_files.pop(filepath, None)
+            if pending is not None:
+                from_cache, result = pending
+                if from_cache:
+                    if profiler is not None:
+                        profiler.count(cache_hits=1)
+                    file_results.append(result)
+                    continue
+                result = result.result()
+            else:
+                if self.cache is not None:
+                    hit, result = self.cache.lookup(filepath, kind)
+                    if hit:
+                        if profiler is not None:
+                            profiler.count(cache_hits=1)
+                        file_results.append(result)
+                        continue
+                result = parse_function(filepath)
+            if profiler is not None:
+                profiler.count_file_read(filepath, blocks=len(result))
+            if self.cache is not None:
+                self.cache.store(filepath, kind, result)
+            file_results.append(result)
+        return merge_definitions(file_results)
+    
     def extract_goods_names(self) -> List[str]:
-        """从goods/00_goods.txt中提取所有物资名"""
-        goods_file = os.path.join(self.base_path, "goods", "00_goods.txt")
+        """从goods文件夹中提取所有物资名"""
         goods_names = []
         
         try:
-            with open(goods_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-                # 处理BOM字符：移除文件开头的BOM字符
-                if content.startswith('\ufeff'):
-                    content = content[1:]
-                    
-                # 匹配物资名定义模式：物资名 = {
-                pattern = r'^\w+'
-                matches = re.findall(pattern, content, re.MULTILINE)
-                goods_names = matches
-        except FileNotFoundError:
-            print(f"错误：找不到文件 {goods_file}")
+            goods_names = list(self._parse_directory(os.path.join(self.base_path, "goods"), parse_goods_file))
+        except FileNotFoundError as e:
+            print(f"错误：找不到文件 {e.filename}")
         except Exception as e:
             print(f"读取物资文件时出错：{e}")
             
@@ -50,71 +254,37 @@ class Victoria3DataAnalyzer:
         # 首先加载所有生产方法组数据
         self._load_production_method_groups(pmg_dir)
         
-        # 存储建筑的required_construction值
-        self.building_construction_costs = {}
-        
         # 按buildings文件夹内文件顺序处理建筑
         try:
-            building_files = sorted([f for f in os.listdir(buildings_dir) 
-                                   if f.endswith('.txt') and not f.startswith('.')])
+            buildings = self._parse_directory(buildings_dir, parse_buildings_file)
             
-            for filename in building_files:
-                filepath = os.path.join(buildings_dir, filename)
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    content = f.read()
-
-                    # 处理BOM字符：移除文件开头的BOM字符
-                    if content.startswith('\ufeff'):
-                        content = content[1:]
-                    
-                    # 使用更精确的正则表达式匹配建筑定义（处理嵌套大括号）
-                    building_pattern = r'^(\w+)\s*=\s*\{([\s\S]*?)^\}$'
-                    building_matches = re.findall(building_pattern, content, re.MULTILINE)
-                    
-                    for building_name, building_content in building_matches:
-                        # 提取建筑的required_construction值
-                        construction_pattern = r'required_construction\s*=\s*(\w+)'
-                        construction_match = re.search(construction_pattern, building_content)
-                        construction_cost = ""
-                        if construction_match:
-                            construction_cost = construction_match.group(1)
-                        
-                        # 存储建筑的construction cost
-                        self.building_construction_costs[building_name] = construction_cost
-                        
-                        # 提取建筑的生产方法组
-                        pmg_pattern = r'production_method_groups\s*=\s*\{([^}]*)\}'
-                        pmg_match = re.search(pmg_pattern, building_content, re.DOTALL)
-                        
-                        if pmg_match:
-                            pmg_content = pmg_match.group(1)
-                            # 提取生产方法组名（按定义顺序，使用更精确的匹配）
-                            pmg_names = re.findall(r'(\w+)', pmg_content)
-                            pmg_names = [name for name in pmg_names if name]  # 过滤空名
-                            
-                            # 为每个生产方法组添加其生产方法
-                            for pmg_name in pmg_names:
-                                if pmg_name in self.production_method_groups_data:
-                                    production_methods = self.production_method_groups_data[pmg_name]
-                                    self.buildings_hierarchy.append({
-                                        'building': building_name,
-                                        'production_method_group': pmg_name,
-                                        'production_methods': production_methods
-                                    })
+            for building_name, building_data in buildings.items():
+                # 存储建筑的construction cost
+                self.building_construction_costs[building_name] = building_data.get('required_construction', "")
+                
+                # 为每个生产方法组（按定义顺序）添加其生产方法
+                for pmg_name in building_data.get('production_method_groups', []):
+                    if pmg_name in self.production_method_groups_data:
+                        production_methods = self.production_method_groups_data[pmg_name]
+                        self.buildings_hierarchy.append({
+                            'building': building_name,
+                            'production_method_group': pmg_name,
+                            'production_methods': production_methods
+                        })
         except Exception as e:
             print(f"提取建筑层级关系时出错：{e}")
     
-    def _classify_pmg_type(self, pmg_content: str) -> str:
-        """根据pmg_content中的关键字进行分类"""
-        if 'mixed_icon_base' in pmg_content:
+    def _classify_pmg_type(self, pmg_texture: str) -> str:
+        """根据生产方法组texture中的关键字进行分类"""
+        if 'mixed_icon_base' in pmg_texture:
             return 'base'
-        elif 'mixed_icon_refining' in pmg_content:
+        elif 'mixed_icon_refining' in pmg_texture:
             return 'refining'
-        elif 'mixed_icon_automation' in pmg_content:
+        elif 'mixed_icon_automation' in pmg_texture:
             return 'automation'
-        elif 'mixed_icon_military' in pmg_content:
+        elif 'mixed_icon_military' in pmg_texture:
             return 'military'
-        elif 'mixed_icon_ownership' in pmg_content:
+        elif 'mixed_icon_ownership' in pmg_texture:
             return 'ownership'
         else:
             return 'other'
@@ -122,35 +292,15 @@ class Victoria3DataAnalyzer:
     def _load_production_method_groups(self, pmg_dir: str):
         """加载所有生产方法组数据"""
         try:
-            for filename in os.listdir(pmg_dir):
-                if filename.endswith('.txt') and not filename.startswith('.'):
-                    filepath = os.path.join(pmg_dir, filename)
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        content = f.read()
-
-                        # 处理BOM字符：移除文件开头的BOM字符
-                        if content.startswith('\ufeff'):
-                            content = content[1:]
-                        
-                        # 使用更精确的正则表达式匹配生产方法组定义
-                        pmg_pattern = r'^(\w+)\s*=\s*\{([\s\S]*?)^\}$'
-                        pmg_matches = re.findall(pmg_pattern, content, re.MULTILINE)
-                        
-                        for pmg_name, pmg_content in pmg_matches:
-                            # 根据pmg_content中的关键字进行分类
-                            pmg_type = self._classify_pmg_type(pmg_content)
-                            self.production_method_groups_texture[pmg_name] = pmg_type
-                            
-                            # 提取生产方法（按定义顺序），处理嵌套大括号
-                            pm_pattern = r'production_methods\s*=\s*\{([^}]*)\}'
-                            pm_match = re.search(pm_pattern, pmg_content, re.DOTALL)
-                            
-                            if pm_match:
-                                pm_content = pm_match.group(1)
-                                # 使用更精确的匹配，只匹配有效的生产方法名
-                                production_methods = re.findall(r'(\w+)', pm_content)
-                                production_methods = [name for name in production_methods if name and not name.isspace()]  # 过滤空名和空格
-                                self.production_method_groups_data[pmg_name] = production_methods
+            pmg_definitions = self._parse_directory(pmg_dir, parse_production_method_groups_file)
+            
+            for pmg_name, pmg_data in pmg_definitions.items():
+                # 根据texture中的关键字进行分类
+                self.production_method_groups_texture[pmg_name] = self._classify_pmg_type(pmg_data.get('texture', ''))
+                
+                # 提取生产方法（按定义顺序）
+                if 'production_methods' in pmg_data:
+                    self.production_method_groups_data[pmg_name] = pmg_data['production_methods']
         except Exception as e:
             print(f"加载生产方法组数据时出错：{e}")
     
@@ -159,103 +309,111 @@ class Victoria3DataAnalyzer:
         pm_dir = os.path.join(self.base_path, "production_methods")
         
         try:
-            for filename in os.listdir(pm_dir):
-                if filename.endswith('.txt') and not filename.startswith('.'):
-                    filepath = os.path.join(pm_dir, filename)
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        
-                        # 处理BOM字符：移除文件开头的BOM字符
-                        if content.startswith('\ufeff'):
-                            content = content[1:]
-                        
-                        # 找到所有生产方法定义
-                        pm_blocks = re.findall(r'^(\w+)\s*=\s*\{([\s\S]*?)^\}$', content, re.MULTILINE)
-                        
-                        for pm_name, pm_content in pm_blocks:
-                            input_goods = {}
-                            output_goods = {}
-                            
-                            # 直接在生产方法内容中查找物资输入输出及数值
-                            input_pattern = r'goods_input_(\w+)_add\s*=\s*(-?\d+)'
-                            output_pattern = r'goods_output_(\w+)_add\s*=\s*(-?\d+)'
-                            
-                            # 提取输入物资及数值
-                            input_matches = re.findall(input_pattern, pm_content)
-                            for goods_name, value in input_matches:
-                                # 输入物资：转换正负号（负值变正值，正值变负值）
-                                numeric_value = int(value)
-                                input_goods[goods_name] = -numeric_value
-                            
-                            # 提取输出物资及数值
-                            output_matches = re.findall(output_pattern, pm_content)
-                            for goods_name, value in output_matches:
-                                # 输出物资：直接使用原始值
-                                output_goods[goods_name] = int(value)
-                            
-                            # 使用生产方法名作为键
-                            self.goods_relations[pm_name] = {
-                                "input": input_goods,
-                                "output": output_goods
-                            }
+            pm_definitions = self._parse_directory(pm_dir, parse_production_methods_file)
+            
+            for pm_name, pm_data in pm_definitions.items():
+                # 使用生产方法名作为键
+                self.goods_relations[pm_name] = {
+                    "input": pm_data.get('input', {}),
+                    "output": pm_data.get('output', {})
+                }
         except Exception as e:
             print(f"分析生产方法物资关系时出错：{e}")
     
-    def generate_table(self):
-        """生成表格数据"""
+    def extract_data(self):
+        """提取所有数据：物资、建筑层级关系、生产方法物资关系"""
         print("开始提取数据...")
         
-        # 提取所有数据
-        self.goods_list = self.extract_goods_names()
-        self.extract_buildings_hierarchy()
-        self.analyze_production_method_goods()
+        with self._parallel_ingestion():
+            with self._stage('extract_goods'):
+                self.goods_list = self.extract_goods_names()
+            with self._stage('buildings_hierarchy'):
+                self.extract_buildings_hierarchy()
+            with self._stage('production_method_goods'):
+                self.analyze_production_method_goods()
+        
+        if self.cache is not None:
+            self.cache.save()
+            print(f"解析缓存：命中 {self.cache.hits} 个文件，重新解析 {self.cache.misses} 个文件")
         
         print(f"找到 {len(self.goods_list)} 个物资")
         print(f"建立 {len(self.buildings_hierarchy)} 条层级关系")
         
         # 调试：检查物资关系分析结果
         print(f"分析到 {len(self.goods_relations)} 个生产方法的物资关系")
-        
-        # 生成表头
-        headers = ["buildings", "production_method_groups", "production_methods", "type", "required_construction"] + self.goods_list
-        
-        # 生成表格数据
-        table_data = []
-        
-        # 为每个层级关系创建行
+    
+    def _table_row_keys(self) -> List[Tuple[str, str, str, str, str]]:
+        """按层级关系生成每一行的描述列：建筑、生产方法组、生产方法、类型、required_construction"""
+        row_keys = []
         for hierarchy in self.buildings_hierarchy:
             building = hierarchy['building']
             pmg = hierarchy['production_method_group']
+            # 获取pmg对应的type
+            pmg_type = self.production_method_groups_texture.get(pmg, "other")
+            # 获取建筑的required_construction值
+            construction_cost = self.building_construction_costs.get(building, "")
             
             # 为每个生产方法创建一行
             for pm in hierarchy['production_methods']:
-                # 获取pmg对应的type
-                pmg_type = self.production_method_groups_texture.get(pmg, "other")
-                # 获取建筑的required_construction值
-                construction_cost = self.building_construction_costs.get(building, "")
-                row = [building, pmg, pm, pmg_type, construction_cost]
+                row_keys.append((building, pmg, pm, pmg_type, construction_cost))
+        return row_keys
+    
+    def net_goods(self, pm: str) -> Dict[str, float]:
+        """
+        返回生产方法对每种物资的净影响（输入为负、输出为正），只包含不为0的物资，按goods文件顺序排列
+        计算净影响：输入值 + 输出值 （虽然目前没有这种PM，但是某些游戏设计中是可能存在的）
+        """
+        relation = self.goods_relations.get(pm)
+        if relation is None:
+            return {}
+        net_goods = {}
+        for goods in self.goods_list:
+            net_value = relation["input"].get(goods, 0) + relation["output"].get(goods, 0)
+            if net_value != 0:
+                net_goods[goods] = net_value
+        return net_goods
+    
+    def pm_goods_records(self) -> List[Tuple[Tuple[str, str, str, str, str], Dict[str, float]]]:
+        """
+        提取数据并返回表格每一行的 (描述列, 物资净影响)
+        与CSV内容一致，但数值保持为数字，供OGAS生成器直接在内存中使用，不需要经过CSV
+        """
+        self.extract_data()
+        return [(row_key, self.net_goods(row_key[2])) for row_key in self._table_row_keys()]
+    
+    def build_goods_matrix(self) -> GoodsMatrix:
+        """提取数据并构建生产方法×物资矩阵（需要numpy），可直接交给下游工具使用"""
+        self.extract_data()
+        with self._stage('build_table'):
+            return GoodsMatrix.from_relations(self.goods_list, self._table_row_keys(), self.goods_relations)
+    
+    def generate_table(self):
+        """生成表格数据"""
+        # 安装了numpy时使用矩阵整体格式化
+        if np is not None:
+            matrix = self.build_goods_matrix()
+            with self._stage('format_table'):
+                return matrix.headers, matrix.table_rows()
+        
+        self.extract_data()
+        
+        with self._stage('build_table'):
+            # 生成表头
+            headers = ROW_HEADERS + self.goods_list
+            
+            # 生成表格数据
+            table_data = []
+            
+            # 为每一行添加各物资的数值信息
+            for row_key in self._table_row_keys():
+                net_goods = self.net_goods(row_key[2])
+                row = list(row_key)
                 
-                # 为每个物资列添加数值信息
                 for goods in self.goods_list:
+                    # 如果净影响不为0，显示数值
                     value_info = ""
-                    if pm in self.goods_relations:
-                        input_value = 0
-                        output_value = 0
-                        
-                        # 获取输入值（如果存在）
-                        if goods in self.goods_relations[pm]["input"]:
-                            input_value = self.goods_relations[pm]["input"][goods]
-                        
-                        # 获取输出值（如果存在）
-                        if goods in self.goods_relations[pm]["output"]:
-                            output_value = self.goods_relations[pm]["output"][goods]
-                        
-                        # 计算净影响：输入值 + 输出值 （虽然目前没有这种PM，但是某些游戏设计中是可能存在的）
-                        net_value = input_value + output_value
-                        
-                        # 如果净影响不为0，显示数值
-                        if net_value != 0:
-                            value_info = str(net_value)
+                    if goods in net_goods:
+                        value_info = format_goods_value(net_goods[goods])
                     
                     row.append(value_info)
                 
@@ -267,28 +425,71 @@ class Victoria3DataAnalyzer:
         """保存为CSV文件"""
         headers, table_data = self.generate_table()
         
+        record = None
         try:
-            with open(filename, 'w', encoding='utf-8-sig') as f:
-                # 写入表头
-                f.write(','.join(headers) + '\n')
-                
-                # 写入数据
-                for row in table_data:
-                    f.write(','.join(row) + '\n')
+            with self._stage('write_csv') as record:
+                with open(filename, 'w', encoding='utf-8-sig') as f:
+                    # 写入表头
+                    f.write(','.join(headers) + '\n')
+                    
+                    # 写入数据
+                    for row in table_data:
+                        f.write(','.join(row) + '\n')
             
             print(f"表格已保存到 {filename}")
         except Exception as e:
             print(f"保存CSV文件时出错：{e}")
+        self._count_output_file(record, filename)
+    
+    def save(self, basename: str = "victoria3_building_pm_goods", formats: List[str] = ("csv",)):
+        """按指定格式导出表格：csv / xlsx / parquet（xlsx和parquet需要numpy和pandas）"""
+        if list(formats) == ["csv"]:
+            self.save_to_csv(f"{basename}.csv")
+            return
+        
+        matrix = self.build_goods_matrix()
+        for file_format in formats:
+            filename = f"{basename}.{file_format}"
+            record = None
+            try:
+                with self._stage(f'write_{file_format}') as record:
+                    getattr(matrix, f"to_{file_format}")(filename)
+                self._count_output_file(record, filename)
+                print(f"表格已保存到 {filename}")
+            except ImportError as e:
+                print(f"导出{file_format}需要额外的依赖：{e}")
+            except Exception as e:
+                print(f"保存{file_format}文件时出错：{e}")
     
 def main():
     """主函数"""
-    analyzer = Victoria3DataAnalyzer()
+    parser = argparse.ArgumentParser(description="维多利亚3建筑生产方法物资关系分析程序")
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help="并行解析文件的进程数，默认1为串行，0表示使用全部CPU核心")
+    parser.add_argument('--cache-file', default=DEFAULT_CACHE_FILE,
+                        help=f"解析缓存文件，默认 {DEFAULT_CACHE_FILE}")
+    parser.add_argument('--no-cache', action='store_true', help="不使用解析缓存，重新解析所有文件")
+    parser.add_argument('--export', nargs='+', default=["csv"], choices=["csv", "xlsx", "parquet"],
+                        help="导出格式，可同时指定多个，默认只导出csv")
+    parser.add_argument('--profile', nargs='?', const=DEFAULT_PROFILE_FILE, metavar='FILE',
+                        help=f"记录各阶段的耗时和读写统计并保存为JSON报告（默认 {DEFAULT_PROFILE_FILE}）")
+    parser.add_argument('--cprofile', metavar='FILE',
+                        help="同时用cProfile记录函数级开销并保存到指定文件（会开启--profile）")
+    args = parser.parse_args()
+    
+    profiler = StageProfiler('Victoria3 building PM', cprofile=bool(args.cprofile)) \
+        if args.profile or args.cprofile else None
+    analyzer = Victoria3DataAnalyzer(jobs=args.jobs, cache_file=None if args.no_cache else args.cache_file,
+                                     profiler=profiler)
     
     print("维多利亚3建筑生产方法物资关系分析程序")
     print("=" * 50)
     
     # 生成并保存表格
-    analyzer.save_to_csv()
+    analyzer.save(formats=args.export)
+    
+    if profiler is not None:
+        profiler.finish(args.profile or DEFAULT_PROFILE_FILE, args.cprofile)
     
     print("\n程序执行完成！")
 
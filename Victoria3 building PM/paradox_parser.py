@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Paradox脚本格式（Victoria 3 / Jomini）的词法分析器与语法解析器
+先用一次 findall 把整个文件切分为词法单元，再按大括号层级构建语法树，
+不依赖右大括号是否位于行首，也不会因为嵌套层级而丢失定义块；
+纯Python逐词法单元建树，比旧版只取所需字段的正则提取慢，重复运行时由 parse_cache 跳过解析
+"""
+
+import re
+from typing import Iterator, List, Optional, Tuple, Union
+
+# 词法规则：每个分支都由首字符唯一确定，整个文件只需一次 findall 扫描，不会产生回溯
+# 依次为：字符串、注释、大括号、运算符、内联数学表达式、普通单词（名字/数值/作用域路径）
+TOKEN_PATTERN = re.compile(r'"[^"\n]*"?|#[^\n]*|[{}]|[<>!?=]=?|@\[[^\]]*\]|[^\s\ufeff{}=<>!?"#]+')
+
+# 数据库定义可用的覆盖前缀，例如 TRY_INJECT:pmg_xxx = { ... }
+OVERRIDE_PREFIXES = ('INJECT', 'TRY_INJECT', 'INJECT_OR_CREATE',
+                     'REPLACE', 'TRY_REPLACE', 'REPLACE_OR_CREATE')
+
+Token = Tuple[str, str, int]
+Value = Union[str, 'Block']
+
+
+class ParadoxSyntaxError(ValueError):
+    """脚本语法错误，携带出错的行号"""
+
+    def __init__(self, message: str, line: int):
+        super().__init__(f"第{line}行：{message}")
+        self.line = line
+
+
+class Block:
+    """
+    大括号块：按出现顺序保存条目
+    每个条目为 (key, op, value)，列表形式的裸值（如 production_methods 中的名字）key和op为None
+    """
+    __slots__ = ('entries',)
+
+    def __init__(self):
+        self.entries: List[Tuple[Optional[str], Optional[str], Value]] = []
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return f"Block({self.entries!r})"
+
+    def get(self, key: str, default=None) -> Optional[Value]:
+        """返回key最后一次出现的值（与游戏中后写覆盖前写的规则一致）"""
+        result = default
+        for entry_key, _, value in self.entries:
+            if entry_key == key:
+                result = value
+        return result
+
+    def get_all(self, key: str) -> List[Value]:
+        """返回key所有出现的值"""
+        return [value for entry_key, _, value in self.entries if entry_key == key]
+
+    def keyed(self) -> Iterator[Tuple[str, str, Value]]:
+        """遍历所有带key的条目"""
+        for entry in self.entries:
+            if entry[0] is not None:
+                yield entry
+
+    def values(self) -> List[Value]:
+        """返回所有裸值，即列表形式的条目"""
+        return [value for key, _, value in self.entries if key is None]
+
+    def walk(self) -> Iterator[Tuple[str, str, Value]]:
+        """深度优先遍历所有层级中带key的条目"""
+        stack = [iter(self.entries)]
+        while stack:
+            for key, op, value in stack[-1]:
+                if key is not None:
+                    yield key, op, value
+                if isinstance(value, Block):
+                    stack.append(iter(value.entries))
+                    break
+            else:
+                stack.pop()
+
+
+def strip_bom(content: str) -> str:
+    """移除文件开头的BOM字符"""
+    if content.startswith('\ufeff'):
+        return content[1:]
+    return content
+
+
+def _token_kind(token: str) -> str:
+    """根据词法单元的首字符判断类型"""
+    first = token[0]
+    if first == '{':
+        return 'lbrace'
+    if first == '}':
+        return 'rbrace'
+    if first in '=<>!?':
+        return 'op'
+    if first == '"':
+        return 'string'
+    if first == '#':
+        return 'comment'
+    return 'atom'
+
+
+def tokenize(content: str) -> Iterator[Token]:
+    """
+    将脚本文本切分为 (类型, 值, 偏移量) 的词法单元流
+    类型为 lbrace / rbrace / op / string / atom，空白和注释直接跳过
+    """
+    for match in TOKEN_PATTERN.finditer(content):
+        value = match.group()
+        kind = _token_kind(value)
+        if kind == 'comment':
+            continue
+        if kind == 'string':
+            value = value.strip('"')
+        yield kind, value, match.start()
+
+
+def line_of(content: str, offset: int) -> int:
+    """根据偏移量计算行号（只在报错时使用，避免在扫描中逐行计数）"""
+    return content.count('\n', 0, offset) + 1
+
+
+def parse(content: str, errors: Optional[List[ParadoxSyntaxError]] = None) -> Block:
+    """
+    将脚本文本解析为语法树
+    解析是容错的：多余的右括号、未闭合的块、悬空的运算符都会被跳过，
+    若传入errors列表，则把对应的语法错误追加进去；否则不报告
+    """
+    root = Block()
+    stack = [root]
+    entries = root.entries
+    pending_key = None
+    pending_op = None
+    # 扫描时只记录出错的词法单元序号，行号在扫描结束后再统一换算
+    problems = []
+
+    for index, token in enumerate(TOKEN_PATTERN.findall(content)):
+        first = token[0]
+
+        if first == '#':
+            continue
+
+        elif first == '{':
+            block = Block()
+            if pending_op is not None:
+                entries.append((pending_key, pending_op, block))
+            else:
+                if pending_key is not None:
+                    entries.append((None, None, pending_key))
+                entries.append((None, None, block))
+            pending_key = pending_op = None
+            stack.append(block)
+            entries = block.entries
+
+        elif first == '}':
+            if pending_op is not None:
+                problems.append((index, f"{pending_key} {pending_op} 之后缺少值"))
+            elif pending_key is not None:
+                entries.append((None, None, pending_key))
+            pending_key = pending_op = None
+            if len(stack) > 1:
+                stack.pop()
+                entries = stack[-1].entries
+            else:
+                problems.append((index, "多余的右大括号"))
+
+        elif first in '=<>!?':
+            if pending_key is None or pending_op is not None:
+                problems.append((index, f"运算符 {token} 前缺少键名"))
+            else:
+                pending_op = token
+
+        else:
+            if first == '"':
+                token = token.strip('"')
+            if pending_op is not None:
+                entries.append((pending_key, pending_op, token))
+                pending_key = pending_op = None
+            else:
+                if pending_key is not None:
+                    entries.append((None, None, pending_key))
+                pending_key = token
+
+    if pending_op is not None:
+        problems.append((None, f"{pending_key} {pending_op} 之后缺少值"))
+    elif pending_key is not None:
+        entries.append((None, None, pending_key))
+    if len(stack) > 1:
+        problems.append((None, f"文件结束时仍有 {len(stack) - 1} 个未闭合的大括号"))
+
+    if problems and errors is not None:
+        offsets = [match.start() for match in TOKEN_PATTERN.finditer(content)]
+        for index, message in problems:
+            offset = len(content) if index is None else offsets[index]
+            errors.append(ParadoxSyntaxError(message, line_of(content, offset)))
+
+    return root
+
+
+def parse_file(filepath: str, errors: Optional[List[ParadoxSyntaxError]] = None) -> Block:
+    """读取并解析单个脚本文件"""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        content = strip_bom(f.read())
+    return parse(content, errors)
+
+
+def split_override_prefix(key: str) -> Tuple[str, str]:
+    """
+    拆分数据库定义的覆盖前缀
+    'TRY_INJECT:pmg_xxx' -> ('TRY_INJECT', 'pmg_xxx')，无前缀时返回 ('', key)
+    """
+    prefix, sep, name = key.partition(':')
+    if sep and prefix in OVERRIDE_PREFIXES:
+        return prefix, name
+    return '', key
+
+
+def top_level_definitions(root: Block) -> Iterator[Tuple[str, str, Block]]:
+    """遍历顶层的数据库定义，返回 (覆盖前缀, 定义名, 定义块)"""
+    for key, op, value in root.keyed():
+        if op == '=' and isinstance(value, Block):
+            prefix, name = split_override_prefix(key)
+            yield prefix, name, value
+
+
+def to_number(value: Value) -> Optional[Union[int, float]]:
+    """把数值字面量转换为int或float，非数值返回None"""
+    if not isinstance(value, str):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return None
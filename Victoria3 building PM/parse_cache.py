@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+单文件解析结果的磁盘缓存
+以 文件路径 + 修改时间 + 内容哈希 为键保存每个脚本文件的解析结果，
+未修改的文件直接复用上次的结果，已删除文件的条目在保存时清除
+"""
+
+import hashlib
+import os
+import pickle
+from typing import Any, Tuple
+
+# 缓存格式版本：解析逻辑或缓存结构变化时递增，旧缓存会被整体丢弃
+CACHE_FORMAT_VERSION = 1
+
+
+class ParseCache:
+    def __init__(self, cache_file: str, parser_version: int = 0):
+        self.cache_file = cache_file
+        self.parser_version = parser_version
+        self.entries = {}  # 绝对路径 -> (解析函数名, mtime_ns, 文件大小, 内容哈希, 解析结果)
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        """读取缓存文件，版本不一致或文件损坏时从空缓存开始"""
+        try:
+            with open(self.cache_file, 'rb') as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"解析缓存已损坏，将重新建立：{e}")
+            self._dirty = True
+            return
+
+        if (isinstance(data, dict)
+                and data.get('format') == CACHE_FORMAT_VERSION
+                and data.get('parser') == self.parser_version):
+            self.entries = data.get('entries', {})
+        else:
+            self._dirty = True
+
+    @staticmethod
+    def _key(filepath: str) -> str:
+        return os.path.normcase(os.path.abspath(filepath))
+
+    def lookup(self, filepath: str, kind: str) -> Tuple[bool, Any]:
+        """
+        查询文件的解析结果，返回 (是否命中, 结果)
+        修改时间和大小都没变时不读取文件；否则计算内容哈希，内容未变时仍视为命中
+        """
+        key = self._key(filepath)
+        stat = os.stat(filepath)
+        entry = self.entries.get(key)
+
+        if entry is not None and entry[0] == kind:
+            if entry[1] == stat.st_mtime_ns and entry[2] == stat.st_size:
+                self.hits += 1
+                return True, entry[4]
+
+            digest = self._digest(filepath)
+            if entry[3] == digest:
+                # 文件被touch过但内容没变：只更新修改时间
+                self.entries[key] = (kind, stat.st_mtime_ns, stat.st_size, digest, entry[4])
+                self._dirty = True
+                self.hits += 1
+                return True, entry[4]
+
+        self.misses += 1
+        return False, None
+
+    def store(self, filepath: str, kind: str, result: Any):
+        """保存文件的解析结果"""
+        stat = os.stat(filepath)
+        self.entries[self._key(filepath)] = (kind, stat.st_mtime_ns, stat.st_size,
+                                             self._digest(filepath), result)
+        self._dirty = True
+
+    @staticmethod
+    def _digest(filepath: str) -> str:
+        with open(filepath, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    def evict_deleted(self) -> int:
+        """清除已删除文件的缓存条目，返回清除的数量"""
+        deleted = [key for key in self.entries if not os.path.exists(key)]
+        for key in deleted:
+            del self.entries[key]
+        if deleted:
+            self._dirty = True
+        return len(deleted)
+
+    def save(self):
+        """清除已删除文件的条目后写回缓存文件（先写临时文件再替换，中途中断不会损坏缓存）"""
+        self.evict_deleted()
+        if not self._dirty:
+            return
+
+        temp_file = self.cache_file + '.tmp'
+        try:
+            with open(temp_file, 'wb') as f:
+                pickle.dump({'format': CACHE_FORMAT_VERSION,
+                             'parser': self.parser_version,
+                             'entries': self.entries}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_file, self.cache_file)
+            self._dirty = False
+        except OSError as e:
+            print(f"保存解析缓存时出错：{e}")
@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+明文存档读取程序
+以内存映射方式流式扫描Victoria 3的明文（debug模式）存档，只解析需要的部分：
+不需要的块只按大括号跳过，需要的database按段读取，每个对象直接在字节上匹配用到的键和嵌套块，提取数值后立即丢弃，
+内存占用与一段（DATABASE_CHUNK_SIZE）相当，不会把整个存档读成语法树；
+结果按列保存（编号为int64、数值为float64的array，名字为列表），可以直接转换为numpy数组交给下游工具使用
+"""
+
+import argparse
+import math
+import mmap
+import os
+import re
+import time
+from array import array
+from collections import namedtuple
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from main import Victoria3DataAnalyzer
+from paradox_parser import parse, to_number
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 与paradox_parser.TOKEN_PATTERN相同的词法规则，直接在存档的字节上扫描（存档不含BOM）
+TOKEN_PATTERN = re.compile(rb'"[^"\n]*"?|#[^\n]*|[{}]|[<>!?=]=?|@\[[^\]]*\]|[^\s{}=<>!?"#]+')
+# 跳过整个块时只需要大括号，字符串和注释中的大括号不计入层级
+BRACE_PATTERN = re.compile(rb'"[^"\n]*"?|#[^\n]*|[{}]')
+# 注释（连同字符串一起匹配，字符串中的#不是注释）
+COMMENT_PATTERN = re.compile(rb'"[^"\n]*"?|#[^\n]*')
+STRING_PATTERN = re.compile(rb'"[^"\n]*"?')
+# 列表形式的块中的值（名字或字符串），以及列表中不应出现的字符（键值条目、嵌套块、注释等）
+LIST_VALUE_PATTERN = re.compile(rb'"([^"\n]*)"?|([^\s{}=<>!?"#]+)')
+NON_LIST_PATTERN = re.compile(rb'[={}<>!?#@]')
+# 键只从词法单元的开头匹配，否则正则会在长的名字和数值中逐个位置回溯
+KEY_START = rb'(?<![^\s{}=<>!?"#])'
+# 运算符和值（名字、数值或字符串）
+VALUE_PATTERN = rb'\s*[<>!?=]=?\s*("[^"\n]*"|[^\s{}=<>!?"#]+)'
+# 不再嵌套的 键 运算符 { ... } 条目（物资块中的每种物资）
+FLAT_BLOCK_PATTERN = re.compile(KEY_START + rb'([^\s{}=<>!?"#]+)\s*[<>!?=]=?\s*\{([^{}]*)\}')
+# 跳过块时逐个词法单元扫描的第一段大小，以及之后按段计算层级时最大的段
+SKIP_FIRST_CHUNK_SIZE = 1 << 12
+SKIP_CHUNK_SIZE = 1 << 20
+# 读取database时每段的大小
+DATABASE_CHUNK_SIZE = 1 << 20
+
+OPERATOR_BYTES = frozenset(b'=<>!?')
+# bytes.translate的转换表：大括号、引号和换行保留，其余字节变为0（或删去）
+STRUCTURE_BYTES = bytes(byte if byte in b'{}"\n' else 0 for byte in range(256))
+NON_STRUCTURE_BYTES = bytes(byte for byte in range(256) if byte not in b'{}"\n')
+LBRACE, RBRACE, HASH, QUOTE, NEWLINE = b'{'[0], b'}'[0], b'#'[0], b'"'[0], b'\n'[0]
+
+# 列的类型：数值（缺失为nan）或名字（缺失为空字符串）
+NUMBER = 'number'
+NAME = 'name'
+
+# 存档中需要读取的一个database：
+# path：从顶层到database的键；table：每个对象一行的表名；fields：列名 -> (类型, 依次尝试的键)；
+# lists：表名 -> 列表形式的键（每个名字一行）；goods：(表名, 键)，该键下每种物资一行，没有时为None
+SaveSection = namedtuple('SaveSection', ['path', 'table', 'fields', 'lists', 'goods'])
+
+# 物资表中读取的数值，键名依次尝试
+GOODS_FIELDS = {
+    'supply': (NUMBER, ('supply', 'sell_orders', 'production')),
+    'demand': (NUMBER, ('demand', 'buy_orders', 'consumption')),
+    'price': (NUMBER, ('price',)),
+}
+
+# 存档的结构随游戏版本变化，所有用到的键都集中在这里
+SAVE_SCHEMA = (
+    SaveSection(('states', 'database'), 'states', {
+        'country': (NUMBER, ('country',)),
+        'market': (NUMBER, ('market',)),
+        'region': (NAME, ('region', 'state_region')),
+    }, {}, ('state_goods', 'goods')),
+    SaveSection(('market_manager', 'database'), 'markets', {
+        'owner': (NUMBER, ('owner',)),
+    }, {}, ('market_goods', 'goods')),
+    SaveSection(('building_manager', 'database'), 'buildings', {
+        'type': (NAME, ('building',)),
+        'state': (NUMBER, ('state',)),
+        'level': (NUMBER, ('level', 'levels')),
+        'occupancy': (NUMBER, ('occupancy',)),
+        'staffing': (NUMBER, ('staffing',)),
+    }, {'building_production_methods': 'production_methods'}, None),
+)
+
+
+class SaveFormatError(ValueError):
+    """不是明文存档（压缩或二进制存档）"""
+
+
+class SaveTable:
+    """按列保存的表格：第一列为对象编号id，数值列为array('d')，名字列为列表"""
+    __slots__ = ('name', 'columns', '_appenders')
+
+    def __init__(self, name: str, columns: List[Tuple[str, str]]):
+        self.name = name
+        self.columns = {'id': array('q')}
+        for column, kind in columns:
+            self.columns[column] = array('d') if kind == NUMBER else []
+        self._appenders = [values.append for values in self.columns.values()]
+
+    def add_row(self, values):
+        """按列的顺序追加一行（第一个值为id）"""
+        for append, value in zip(self._appenders, values):
+            append(value)
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def to_numpy(self) -> Dict[str, 'np.ndarray']:
+        """转换为numpy数组：id为int64、数值为float64（不复制数据），名字为object数组"""
+        if np is None:
+            raise ImportError("转换为numpy数组需要numpy，请先执行 pip install numpy")
+        result = {}
+        for column, values in self.columns.items():
+            if isinstance(values, array):
+                result[column] = np.frombuffer(values, dtype=np.int64 if values.typecode == 'q' else np.float64)
+            else:
+                result[column] = np.array(values, dtype=object)
+        return result
+
+
+def _skip_chunk_vectorized(data, pos: int, end: int, depth: int) -> Tuple[int, int]:
+    """
+    用numpy对一段数据的大括号求前缀和，返回 (该段结束后的层级, 块结束的位置)，块没有在该段中结束时位置为-1
+    字符串不跨行，按每行中引号个数的奇偶判断大括号是否位于字符串中；该段中有注释时返回 (depth, None)
+    """
+    chunk = data[pos:end]
+    if b'#' in chunk:
+        return depth, None
+    # 只保留大括号、引号和换行的位置，之后的计算都在这些位置上进行
+    positions = np.flatnonzero(np.frombuffer(chunk.translate(STRUCTURE_BYTES), dtype=np.uint8))
+    codes = np.frombuffer(chunk, dtype=np.uint8)[positions]
+    steps = (codes == LBRACE).astype(np.int32) - (codes == RBRACE)
+    if b'"' in chunk:
+        quotes = np.cumsum(codes == QUOTE)
+        line_quotes = np.maximum.accumulate(np.where(codes == NEWLINE, quotes, 0))
+        steps[(quotes - line_quotes) & 1 == 1] = 0
+    levels = np.cumsum(steps) + depth
+    closed = np.flatnonzero(levels == 0)
+    if len(closed):
+        return 0, pos + int(positions[closed[0]]) + 1
+    return int(levels[-1]) if len(levels) else depth, -1
+
+
+def skip_block(data, pos: int) -> int:
+    """
+    从左大括号之后的位置开始跳过整个块，返回对应右大括号之后的位置（未闭合时为文件末尾）
+    大部分块都很短，先逐个词法单元扫描一小段；块更长且安装了numpy时按段整体计算层级，段从小到大逐次加倍
+    """
+    depth = 1
+    size = len(data)
+    chunk_size = SKIP_FIRST_CHUNK_SIZE
+    while pos < size:
+        # 每段在行末结束，字符串不跨行，段的开头不会位于字符串中
+        end = data.find(b'\n', min(pos + chunk_size, size))
+        end = size if end < 0 else end + 1
+        if np is not None and chunk_size > SKIP_FIRST_CHUNK_SIZE:
+            depth, closed = _skip_chunk_vectorized(data, pos, end, depth)
+            if closed is not None:
+                if closed >= 0:
+                    return closed
+                pos = end
+                chunk_size = min(chunk_size * 2, SKIP_CHUNK_SIZE)
+                continue
+        for match in BRACE_PATTERN.finditer(data, pos, end):
+            first = data[match.start()]
+            if first == LBRACE:
+                depth += 1
+            elif first == RBRACE:
+                depth -= 1
+                if depth == 0:
+                    return match.end()
+        pos = end
+        chunk_size = min(chunk_size * 2, SKIP_CHUNK_SIZE)
+    return size
+
+
+def content_start(data) -> int:
+    """
+    存档正文的起始位置：明文存档第一行是以SAV开头的文件头
+    压缩存档（zip）和二进制存档无法读取
+    """
+    start = 0
+    if data[:3] == b'SAV':
+        newline = data.find(b'\n')
+        start = len(data) if newline < 0 else newline + 1
+    head = data[start:start + 4096]
+    if head.startswith(b'PK\x03\x04') or b'\x00' in head:
+        raise SaveFormatError("只支持明文存档，请使用debug模式保存的存档或先转换为明文")
+    return start
+
+
+def _strip_comments(content: bytes) -> bytes:
+    return COMMENT_PATTERN.sub(lambda match: b'' if match.group().startswith(b'#') else match.group(), content)
+
+
+def _block_key(piece: bytes) -> Optional[bytes]:
+    """嵌套块之前的 键 运算符 中的键（从末尾向前查找），没有运算符时为None"""
+    head = piece.rstrip()
+    if not head or head[-1] not in OPERATOR_BYTES:
+        return None
+    head = head.rstrip(b'=<>!?').rstrip()
+    if head.endswith(b'"'):
+        return head[head.rfind(b'"', 0, -1) + 1:-1]
+    key = head.rsplit(None, 1)[-1] if head else b''
+    return key[max(key.rfind(b'"'), key.rfind(b'}')) + 1:] or None
+
+
+def entry_pattern(keys) -> 're.Pattern':
+    """只匹配指定键的 键 运算符 值 条目，不需要的条目不切分（长的键在前，避免只匹配到前缀）"""
+    alternatives = b'|'.join(re.escape(key) for key in sorted(keys, key=len, reverse=True))
+    return re.compile(KEY_START + rb'(' + alternatives + rb')' + VALUE_PATTERN)
+
+
+def _quoted_braces(content: bytes) -> bool:
+    """字符串中是否有大括号（或有不成对的引号），此时不能直接按大括号的位置划分层级"""
+    if b'"' not in content:
+        return False
+    # 只保留大括号、引号和换行后再逐个字符串检查
+    structure = content.translate(None, NON_STRUCTURE_BYTES)
+    return any(len(string) < 2 or string[-1] != QUOTE or b'{' in string or b'}' in string
+               for string in STRING_PATTERN.findall(structure))
+
+
+def _braces(content: bytes) -> Iterator[Tuple[int, bool]]:
+    """
+    依次返回不在字符串和注释中的大括号：(位置, 是否为左大括号)
+    没有注释、字符串中也没有大括号时直接查找大括号，不逐个字节匹配正则
+    """
+    if b'#' in content or _quoted_braces(content):
+        for match in BRACE_PATTERN.finditer(content):
+            first = content[match.start()]
+            if first == LBRACE or first == RBRACE:
+                yield match.start(), first == LBRACE
+        return
+    find = content.find
+    next_open = find(b'{')
+    next_close = find(b'}')
+    while next_open >= 0 or next_close >= 0:
+        if next_close < 0 or 0 <= next_open < next_close:
+            yield next_open, True
+            next_open = find(b'{', next_open + 1)
+        else:
+            yield next_close, False
+            next_close = find(b'}', next_close + 1)
+
+
+def _top_level_blocks(content: bytes) -> Iterator[Tuple[int, int]]:
+    """块中顶层的嵌套块：(左大括号的位置, 对应右大括号的位置)，未闭合的块不列出"""
+    depth = opened = 0
+    for position, is_open in _braces(content):
+        if is_open:
+            if depth == 0:
+                opened = position
+            depth += 1
+        elif depth:
+            depth -= 1
+            if depth == 0:
+                yield opened, position
+
+
+def scan_block(content: bytes, pattern, wanted=None) -> Tuple[Dict[bytes, bytes], List[Tuple[bytes, bytes]]]:
+    """
+    直接在字节上扫描一个块的内容（不含外层大括号和注释），不切分词法单元：
+    返回 (顶层中pattern匹配的 键 = 值 条目，同一个键取最后一次出现的值（与Block.get相同）,
+          键在wanted中的嵌套块 [(键, 块内容)]，wanted为None时为所有带键的嵌套块)；
+    其余嵌套块只按大括号跳过
+    """
+    if b'{' not in content:
+        return dict(pattern.findall(content)), []
+    scalars = {}
+    blocks = []
+    pos = 0
+    for opened, closed in _top_level_blocks(content):
+        piece = content[pos:opened]
+        scalars.update(pattern.findall(piece))
+        pos = closed + 1
+        key = _block_key(piece)
+        if key is not None and (wanted is None or key in wanted):
+            blocks.append((key, content[opened + 1:closed]))
+    scalars.update(pattern.findall(content, pos))
+    return scalars, blocks
+
+
+def scan_entries(content: bytes, pattern) -> List[Tuple[bytes, Dict[bytes, bytes]]]:
+    """块中每个带键的嵌套块及其中pattern匹配的条目（如物资块中每种物资的数值），没有更深的嵌套时只需一次正则匹配"""
+    entries = FLAT_BLOCK_PATTERN.findall(content)
+    if len(entries) == content.count(b'{'):
+        return [(key, dict(pattern.findall(body))) for key, body in entries]
+    return [(key, scan_block(body, pattern)[0]) for key, body in scan_block(content, pattern)[1]]
+
+
+def _object_id(piece: bytes) -> Optional[int]:
+    """database中对象之前的 编号 =，不是整数编号时为None"""
+    key = _block_key(piece)
+    number = to_number(key.decode('ascii', 'replace')) if key is not None else None
+    return number if isinstance(number, int) else None
+
+
+def _list_values(content: bytes) -> List[str]:
+    """列表形式的块中的值；有键值条目或嵌套块时交给paradox_parser解析，只取裸值"""
+    if NON_LIST_PATTERN.search(content):
+        return [value for value in parse(content.decode('utf-8', 'replace')).values() if isinstance(value, str)]
+    return [(string or name).decode('utf-8', 'replace') for string, name in LIST_VALUE_PATTERN.findall(content)]
+
+
+def _compile_fields(fields) -> Tuple[list, 're.Pattern']:
+    """
+    列名 -> (类型, 依次尝试的键) 转换为按列顺序的 (类型, 字节形式的键)，
+    以及只匹配这些键的条目的正则
+    """
+    columns = [(kind, tuple(key.encode('ascii') for key in keys)) for kind, keys in fields.values()]
+    return columns, entry_pattern({key for _, keys in columns for key in keys})
+
+
+def _field_values(scalars: Dict[bytes, bytes], fields) -> list:
+    values = []
+    for kind, keys in fields:
+        value = None
+        for key in keys:
+            value = scalars.get(key)
+            if value is not None:
+                break
+        if kind == NUMBER:
+            try:
+                values.append(float(value.strip(b'"')) if value is not None else math.nan)
+            except ValueError:
+                values.append(math.nan)
+        else:
+            values.append(value.strip(b'"').decode('utf-8', 'replace') if value is not None else '')
+    return values
+
+
+class SaveReader:
+    """
+    流式读取明文存档
+    goods_names为按goods文件顺序排列的物资名（存档中的物资以编号表示），指定时物资列为物资名，否则为编号
+    """
+
+    def __init__(self, schema=SAVE_SCHEMA, goods_names: Optional[List[str]] = None):
+        self.schema = schema
+        self.goods_names = goods_names
+        self.tables: Dict[str, SaveTable] = {}
+        self.bytes_read = 0
+        self.objects_parsed = 0
+
+        # 顶层键 -> ... -> database的读取方式，按路径组织成嵌套字典
+        self._targets = {}
+        self._fields = {section.table: _compile_fields(section.fields) for section in schema}
+        self._goods_fields = _compile_fields(GOODS_FIELDS)
+        # database中每个对象需要读取的嵌套块：列表和物资块
+        self._wanted = {section.table: {key.encode('ascii') for key in section.lists.values()}
+                        | ({section.goods[1].encode('ascii')} if section.goods is not None else set())
+                        for section in schema}
+        for section in schema:
+            node = self._targets
+            for key in section.path[:-1]:
+                node = node.setdefault(key, {})
+            node[section.path[-1]] = section
+
+    def read(self, filepath: str) -> Dict[str, SaveTable]:
+        """读取存档，返回 表名 -> 按列保存的表格"""
+        self.tables = {}
+        self.objects_parsed = 0
+        for section in self.schema:
+            self.tables[section.table] = SaveTable(section.table, [(column, kind) for column, (kind, _)
+                                                                    in section.fields.items()])
+            for table in section.lists:
+                self.tables[table] = SaveTable(table, [('value', NAME)])
+            if section.goods is not None:
+                self.tables[section.goods[0]] = SaveTable(section.goods[0], [('goods', NAME)] + [
+                    (column, kind) for column, (kind, _) in GOODS_FIELDS.items()])
+
+        with open(filepath, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return self.tables
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                self._scan_level(data, content_start(data), self._targets)
+                self.bytes_read = len(data)
+        return self.tables
+
+    def _scan_level(self, data, pos: int, targets: dict) -> int:
+        """扫描一层块中的条目，只进入targets中的键，返回该层结束的位置"""
+        pending_key = None
+        search = TOKEN_PATTERN.search
+        while True:
+            match = search(data, pos)
+            if match is None:
+                return len(data)
+            pos = match.end()
+            first = data[match.start()]
+            if first == RBRACE:
+                if targets is self._targets:
+                    # 顶层多余的右大括号直接忽略
+                    continue
+                return pos
+            if first == LBRACE:
+                target = targets.get(pending_key)
+                if target is None:
+                    pos = skip_block(data, pos)
+                elif isinstance(target, SaveSection):
+                    pos = self._read_database(data, pos, target)
+                else:
+                    pos = self._scan_level(data, pos, target)
+                pending_key = None
+            elif first in OPERATOR_BYTES or first == HASH:
+                continue
+            else:
+                pending_key = match.group().strip(b'"').decode('utf-8', 'replace')
+
+    def _read_database(self, data, pos: int, section: SaveSection) -> int:
+        """
+        database中每个 编号 = { ... } 对象单独读取，编号 = none 的已删除对象跳过；
+        先跳过整个database找到结尾，再按段读取：每段中直接查找大括号划分出完整的对象，
+        对象只读取顶层的条目和需要的嵌套块（对象中的注释先去掉），段中最后一个不完整的对象留到下一段
+        """
+        end = skip_block(data, pos)
+        closing = end - 1 if data[end - 1:end] == b'}' else end
+        pattern = self._fields[section.table][1]
+        wanted = self._wanted[section.table]
+        chunk_size = DATABASE_CHUNK_SIZE
+        while pos < closing:
+            # 每段在行末结束，字符串和注释不跨行
+            chunk_end = data.find(b'\n', min(pos + chunk_size, closing), closing)
+            chunk_end = closing if chunk_end < 0 else chunk_end + 1
+            chunk = data[pos:chunk_end]
+            consumed = 0
+            for opened, closed in _top_level_blocks(chunk):
+                object_id = _object_id(chunk[consumed:opened])
+                consumed = closed + 1
+                if object_id is None:
+                    continue
+                content = chunk[opened + 1:closed]
+                if b'#' in content:
+                    content = _strip_comments(content)
+                scalars, blocks = scan_block(content, pattern, wanted)
+                self._extract(section, object_id, scalars, dict(blocks))
+                self.objects_parsed += 1
+            if chunk_end == closing:
+                break
+            if consumed:
+                pos += consumed
+                chunk_size = DATABASE_CHUNK_SIZE
+            else:
+                # 一个对象比一段更长
+                chunk_size *= 2
+        return end
+
+    def _extract(self, section: SaveSection, object_id: int, scalars: Dict[bytes, bytes], blocks: Dict[bytes, bytes]):
+        """blocks为需要的嵌套块（同一个键取最后一次出现的块）"""
+        self.tables[section.table].add_row([object_id] + _field_values(scalars, self._fields[section.table][0]))
+
+        for table, key in section.lists.items():
+            values = blocks.get(key.encode('ascii'))
+            if values is not None:
+                add_row = self.tables[table].add_row
+                for value in _list_values(values):
+                    add_row((object_id, value))
+
+        if section.goods is not None:
+            table, key = section.goods
+            goods_block = blocks.get(key.encode('ascii'))
+            if goods_block is not None:
+                add_row = self.tables[table].add_row
+                columns, pattern = self._goods_fields
+                for goods_key, goods_data in scan_entries(goods_block, pattern):
+                    add_row([object_id, self._goods_name(goods_key.decode('utf-8', 'replace'))]
+                             + _field_values(goods_data, columns))
+
+    def _goods_name(self, goods_key: str) -> str:
+        if self.goods_names is not None and goods_key.isdigit() and int(goods_key) < len(self.goods_names):
+            return self.goods_names[int(goods_key)]
+        return goods_key
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="流式读取Victoria 3明文存档中的市场、state和建筑数据")
+    parser.add_argument('save', help="明文存档文件（.v3）")
+    parser.add_argument('--base-path', default='.', help="游戏数据所在目录，用于把存档中的物资编号转换为物资名")
+    parser.add_argument('--output', help="把所有表格保存为numpy的.npz文件（需要numpy）")
+    args = parser.parse_args()
+
+    goods_names = None
+    if os.path.isdir(os.path.join(args.base_path, 'goods')):
+        goods_names = Victoria3DataAnalyzer(base_path=args.base_path).extract_goods_names() or None
+
+    reader = SaveReader(goods_names=goods_names)
+    start = time.perf_counter()
+    try:
+        tables = reader.read(args.save)
+    except FileNotFoundError:
+        print(f"错误：找不到存档文件 {args.save}")
+        return
+    except SaveFormatError as e:
+        print(f"错误：{e}")
+        return
+    elapsed = time.perf_counter() - start
+
+    print(f"读取 {reader.bytes_read / 1e6:.1f} MB，解析 {reader.objects_parsed} 个对象，"
+          f"耗时 {elapsed:.2f} 秒（{reader.bytes_read / 1e6 / max(elapsed, 1e-9):.1f} MB/s）")
+    for name, table in tables.items():
+        print(f"{name:<32}{len(table):>10} 行")
+
+    if args.output:
+        try:
+            arrays = {f"{name}.{column}": values for name, table in tables.items()
+                      for column, values in table.to_numpy().items()}
+            np.savez(args.output, **arrays)
+            print(f"表格已保存到 {args.output}")
+        except ImportError as e:
+            print(f"保存.npz需要额外的依赖：{e}")
+        except Exception as e:
+            print(f"保存{args.output}时出错：{e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分阶段性能记录
+命令行指定--profile时记录每个阶段的耗时、CPU时间，以及读取的文件数和字节数、解析的定义块数、写出的字节数和条目数，
+结束时输出JSON报告，并可以同时用cProfile记录整个运行过程的函数级开销；
+未开启时调用方持有的记录器为None，各记录点只做一次None判断，不做任何计时和统计
+分析程序和OGAS生成程序共用本模块
+"""
+
+import cProfile
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+# 每个阶段都会出现在报告中的计数器，其他计数器（例如cache_hits）只在用到时出现
+COUNTERS = ('files_read', 'bytes_read', 'blocks_parsed', 'files_written', 'bytes_written', 'entries_emitted')
+
+# 生成的脚本中顶格书写的行即一个顶层定义（缩进的行、注释和右括号除外）
+TOP_LEVEL_ENTRY_PATTERN = re.compile(r'^\ufeff?[^\s#}]', re.MULTILINE)
+
+
+def count_top_level_entries(filepath: str) -> int:
+    """统计输出文件中的顶层条目数：脚本为顶层定义数，CSV为行数"""
+    with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
+        return len(TOP_LEVEL_ENTRY_PATTERN.findall(f.read()))
+
+
+class StageProfiler:
+    def __init__(self, program: str, cprofile: bool = False):
+        self.program = program
+        self.stages: Dict[str, dict] = {}  # 阶段名称 -> 记录，同一阶段多次执行时累加
+        self._current: Optional[dict] = None
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._cprofile = cProfile.Profile() if cprofile else None
+        if self._cprofile is not None:
+            self._cprofile.enable()
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        记录一个阶段，返回该阶段的记录
+        阶段不嵌套：阶段内的计数都记在当前阶段上，阶段外的计数被忽略
+        """
+        record = self.stages.get(name)
+        if record is None:
+            record = self.stages[name] = dict({'stage': name, 'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0},
+                                              **dict.fromkeys(COUNTERS, 0))
+        previous, self._current = self._current, record
+        start_cpu = time.process_time()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['wall_seconds'] += time.perf_counter() - start
+            record['cpu_seconds'] += time.process_time() - start_cpu
+            record['calls'] += 1
+            self._current = previous
+
+    def count(self, **amounts):
+        """把计数加到当前阶段上"""
+        record = self._current
+        if record is None:
+            return
+        for counter, amount in amounts.items():
+            record[counter] = record.get(counter, 0) + amount
+
+    def count_file_read(self, filepath: str, blocks: int = 0):
+        self.count(files_read=1, bytes_read=os.path.getsize(filepath), blocks_parsed=blocks)
+
+    def skip(self, name: str):
+        """记录一个因输入未变化而跳过的阶段"""
+        with self.stage(name) as record:
+            record['skipped'] = True
+
+    @staticmethod
+    def count_output_files(record: dict, filepaths: Iterable[str]):
+        """
+        在阶段结束后把写出的文件计入该阶段：文件数、字节数和顶层条目数
+        需要重新读取输出文件，因此放在阶段计时之外
+        """
+        for filepath in filepaths:
+            record['files_written'] += 1
+            record['bytes_written'] += os.path.getsize(filepath)
+            record['entries_emitted'] += count_top_level_entries(filepath)
+
+    def report(self) -> dict:
+        stages: List[dict] = []
+        for record in self.stages.values():
+            record = dict(record)
+            record['wall_seconds'] = round(record['wall_seconds'], 6)
+            record['cpu_seconds'] = round(record['cpu_seconds'], 6)
+            stages.append(record)
+        return {
+            'program': self.program,
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'total_wall_seconds': round(time.perf_counter() - self._start_wall, 6),
+            'total_cpu_seconds': round(time.process_time() - self._start_cpu, 6),
+            'stages': stages,
+        }
+
+    def print_summary(self, report: dict):
+        # 表头中的汉字按两个字符宽度对齐
+        print(f"{'阶段':<30}{'耗时(ms)':>8}{'CPU(ms)':>10}{'读取文件':>6}{'读取(KB)':>8}"
+              f"{'定义块':>7}{'写出(KB)':>8}{'条目':>8}")
+        for record in report['stages']:
+            if record.get('skipped'):
+                print(f"{record['stage']:<32}{'跳过':>8}")
+                continue
+            print(f"{record['stage']:<32}{record['wall_seconds'] * 1000:>10.1f}{record['cpu_seconds'] * 1000:>10.1f}"
+                  f"{record['files_read']:>10}{record['bytes_read'] / 1024:>10.1f}{record['blocks_parsed']:>10}"
+                  f"{record['bytes_written'] / 1024:>10.1f}{record['entries_emitted']:>10}")
+        print(f"合计耗时：{report['total_wall_seconds']:.3f} 秒，CPU时间：{report['total_cpu_seconds']:.3f} 秒")
+
+    def finish(self, report_file: str, cprofile_file: Optional[str] = None):
+        """停止记录，输出摘要，保存JSON报告和cProfile统计"""
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        report = self.report()
+        print("=" * 50)
+        self.print_summary(report)
+
+        try:
+            with open(report_file, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=1)
+            print(f"性能报告已保存到 {report_file}")
+        except OSError as e:
+            print(f"保存性能报告时出错：{e}")
+
+        if self._cprofile is not None and cprofile_file:
+            try:
+                self._cprofile.dump_stats(cprofile_file)
+                print(f"cProfile统计已保存到 {cprofile_file}（可用 python -m pstats {cprofile_file} 查看）")
+            except OSError as e:
+                print(f"保存cProfile统计时出错：{e}")
+        return report